@@ -1,29 +1,31 @@
 import ipaddress
-from fastapi import APIRouter, Body, Depends, HTTPException
+from functools import lru_cache
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
 from app.models import ACL, Peer, User
-from app.auth import get_current_user
+from app.auth import get_current_user, get_current_user_async
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db import get_db, get_async_db
 from app.activity import log_activity
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 @router.put("/acls/{acl_id}/enable")
-def enable_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
+def enable_acl_api(acl_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	acl = session.query(ACL).get(acl_id)
 	if not acl:
-		session.close()
 		raise HTTPException(status_code=404, detail="ACL not found")
 	acl.enabled = True
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	msg = "ACL enabled"
 	# 记录活动
 	try:
-		log_activity(f"启用 防火墙 规则: {acl_id}", type='info')
+		log_activity(f"启用 防火墙 规则: {acl_id}", type='info', session=session, event_type='acl.enable',
+			actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	if not sync_success:
@@ -32,60 +34,256 @@ def enable_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
 
 # ACL 禁用
 @router.put("/acls/{acl_id}/disable")
-def disable_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
+def disable_acl_api(acl_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	acl = session.query(ACL).get(acl_id)
 	if not acl:
-		session.close()
 		raise HTTPException(status_code=404, detail="ACL not found")
 	acl.enabled = False
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	msg = "ACL disabled"
 	# 记录活动
 	try:
-		log_activity(f"禁用 防火墙 规则: {acl_id}", type='info')
+		log_activity(f"禁用 防火墙 规则: {acl_id}", type='info', session=session, event_type='acl.disable',
+			actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	if not sync_success:
 		msg += " (警告: WireGuard 同步失败)"
 	return {"msg": msg, "sync_success": sync_success}
 
-# ACL 列表接口
+# ACL 列表可返回（fields= 可投影）的字段
+ACL_LIST_FIELDS = {
+	"id": ACL.id,
+	"peer_id": ACL.peer_id,
+	"rule_type": ACL.rule_type,
+	"action": ACL.action,
+	"target": ACL.target,
+	"destination": ACL.destination,
+	"source_interface": ACL.source_interface,
+	"destination_interface": ACL.destination_interface,
+	"port": ACL.port,
+	"protocol": ACL.protocol,
+	"direction": ACL.direction,
+	"enabled": ACL.enabled,
+}
+
+# 可排序字段（全局规则 peer_id 为空，按 -1 参与比较）
+ACL_SORT_FIELDS = {
+	"id": ACL.id,
+	"peer_id": func.coalesce(ACL.peer_id, -1),
+	"target": ACL.target,
+	"rule_type": ACL.rule_type,
+}
+
+# ACL 列表接口（异步查询，高频轮询不占用线程池）
+# 不带参数时返回完整数组；带 limit/cursor/fields/sort 或过滤参数时返回 {"items", "next_cursor"}
+# target_contains=IP/CIDR：规则目标网段包含该地址；target_within=CIDR：规则目标位于该网段内
+# 响应带弱 ETag（acls 表代数），If-None-Match 命中时返回 304
 @router.get("/acls")
-def get_acls(current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
-	acls = session.query(ACL).all()
-	session.close()
-	return [
-		{
-			"id": a.id,
-			"peer_id": a.peer_id,
-			"rule_type": a.rule_type,
-			"action": a.action,
-			"target": a.target,
-			"destination": a.destination,
-			"source_interface": a.source_interface,
-			"destination_interface": a.destination_interface,
-			"port": a.port,
-			"protocol": a.protocol,
-			"direction": a.direction,
-			"enabled": a.enabled
-		} for a in acls
-	]
-
-# 防火墙 规则合法性校验
-def validate_acl_target(target: str) -> bool:
+async def get_acls(
+	request: Request,
+	response: Response,
+	limit: int = None,
+	cursor: str = None,
+	fields: str = None,
+	sort: str = None,
+	peer_id: int = None,
+	rule_type: str = None,
+	direction: str = None,
+	enabled: bool = None,
+	target_contains: str = None,
+	target_within: str = None,
+	current_user: User = Depends(get_current_user_async),
+	session: AsyncSession = Depends(get_async_db)
+):
+	from app.generations import conditional_list
+	from app.listing import keyset_page, network_contains, page_limit, parse_fields, parse_network, parse_sort
+	not_modified = await conditional_list(request, response, session, 'acls')
+	if not_modified is not None:
+		return not_modified
+	params = (limit, cursor, fields, sort, peer_id, rule_type, direction, enabled, target_contains, target_within)
+	if all(v is None for v in params):
+		columns = [column.label(name) for name, column in ACL_LIST_FIELDS.items()]
+		rows = (await session.execute(select(*columns).order_by(ACL.id))).all()
+		return [dict(row._mapping) for row in rows]
+
+	selected = parse_fields(fields, ACL_LIST_FIELDS)
+	sort_name, descending = parse_sort(sort, ACL_SORT_FIELDS)
+	filters = []
+	if peer_id is not None:
+		# peer_id=-1 表示全局规则
+		filters.append(ACL.peer_id.is_(None) if peer_id == -1 else ACL.peer_id == peer_id)
+	if rule_type is not None:
+		filters.append(ACL.rule_type == rule_type)
+	if direction is not None:
+		filters.append(ACL.direction == direction)
+	if enabled is not None:
+		filters.append(ACL.enabled == enabled)
+
+	# CIDR 关系无法在 SQL 中通用表达，按行在 Python 中判断（解析结果有缓存）
+	checks = []
+	for name, value in (("target_contains", target_contains), ("target_within", target_within)):
+		if value is None:
+			continue
+		network = parse_network(value)
+		if network is None:
+			raise HTTPException(status_code=400, detail=f"{name} 格式非法")
+		checks.append((name, network))
+	row_filter = None
+	if checks:
+		def row_filter(row):
+			target = parse_network(row._target)
+			for name, network in checks:
+				if name == "target_contains" and not network_contains(target, network):
+					return False
+				if name == "target_within" and not network_contains(network, target):
+					return False
+			return True
+
+	items, next_cursor = await keyset_page(
+		session, ACL.id, ACL_LIST_FIELDS, selected, filters,
+		ACL_SORT_FIELDS[sort_name], sort_name, descending, cursor, page_limit(limit),
+		row_filter=row_filter, extra_columns={"_target": ACL.target} if checks else None
+	)
+	return {"items": items, "next_cursor": next_cursor}
+
+# 按规则标识批量 upsert：已存在的规则只更新 action
+# 语句只编译一次，以 executemany 方式批量执行（驱动层按批合并为多行 VALUES）；
+# rows 内不应有标识相同的规则（PostgreSQL 不允许同一语句两次更新同一行）。
+# existing 为调用方已预取的规则标识，未提供时按 target 预取，用于区分新增与更新的变更记录
+def upsert_acls(session, rows, existing: set = None):
+	from app.changes import record_changes
+	from app.db import dialect_insert
+	if not rows:
+		return
+	if existing is None:
+		existing = existing_acl_identities(session, {row["target"] for row in rows})
+	stmt = dialect_insert(session, ACL)
+	stmt = stmt.on_conflict_do_update(
+		index_elements=list(ACL.IDENTITY),
+		set_={"action": stmt.excluded.action}
+	).returning(ACL.id, sort_by_parameter_order=True)
+	ids = session.connection().execute(stmt, rows).scalars().all()
+	record_changes(session, [
+		('acl', acl_id, 'updated' if acl_identity(row) in existing else 'created')
+		for acl_id, row in zip(ids, rows)
+	])
+	return ids
+
+# 单条规则 upsert，返回 (id, 是否新建)
+def save_acl(session, row: dict) -> tuple:
+	existing = existing_acl_identities(session, [row["target"]])
+	return upsert_acls(session, [row], existing)[0], acl_identity(row) not in existing
+
+# 删除节点的全部 ACL
+def delete_peer_acls(session, peer_ids) -> list:
+	from sqlalchemy import delete
+	from app.changes import execute_returning_ids
+	return execute_returning_ids(
+		session, lambda chunk: delete(ACL).where(ACL.peer_id.in_(chunk)).returning(ACL.id),
+		peer_ids, 'acl', 'deleted'
+	)
+
+# 批量切换 ACL 启用状态：UPDATE ... SET enabled = NOT enabled WHERE id IN (...)
+def toggle_acls(session, acl_ids) -> list:
+	from sqlalchemy import not_, update
+	from app.changes import execute_returning_ids
+	return execute_returning_ids(
+		session, lambda chunk: update(ACL).where(ACL.id.in_(chunk)).values(enabled=not_(ACL.enabled)).returning(ACL.id),
+		acl_ids, 'acl', 'updated'
+	)
+
+# 批量删除 ACL
+def delete_acls(session, acl_ids) -> list:
+	from sqlalchemy import delete
+	from app.changes import execute_returning_ids
+	return execute_returning_ids(
+		session, lambda chunk: delete(ACL).where(ACL.id.in_(chunk)).returning(ACL.id),
+		acl_ids, 'acl', 'deleted'
+	)
+
+# 防火墙 规则合法性校验（解析结果缓存，批量导入中重复的网段只解析一次）
+@lru_cache(maxsize=65536)
+def _is_valid_target(target: str) -> bool:
 	try:
 		ipaddress.ip_network(target.strip())
 		return True
-	except Exception:
+	except ValueError:
 		return False
 
+def validate_acl_target(target: str) -> bool:
+	return isinstance(target, str) and _is_valid_target(target)
+
+# 规则标识（与 uq_acls_identity 唯一索引一致，可空列归一）
+def acl_identity(row: dict) -> tuple:
+	return (
+		row["rule_type"],
+		-1 if row["peer_id"] is None else row["peer_id"],
+		row["target"],
+		row["destination"] or "",
+		row["source_interface"] or "",
+		row["destination_interface"] or "",
+		row["port"],
+		row["protocol"],
+		row["direction"],
+	)
+
+# 预取已存在的规则标识：按 target 分块 IN 查询
+def existing_acl_identities(session, targets) -> set:
+	from app.db import chunked
+	columns = [ACL.rule_type, ACL.peer_id, ACL.target, ACL.destination, ACL.source_interface,
+		ACL.destination_interface, ACL.port, ACL.protocol, ACL.direction]
+	identities = set()
+	for chunk in chunked(targets):
+		for row in session.execute(select(*columns).where(ACL.target.in_(chunk))):
+			identities.add(acl_identity(row._mapping))
+	return identities
+
+# 预取存在的节点 id
+def existing_peer_ids(session, peer_ids) -> set:
+	from app.db import chunked
+	found = set()
+	for chunk in chunked(peer_ids):
+		found.update(session.execute(select(Peer.id).where(Peer.id.in_(chunk))).scalars())
+	return found
+
+# 校验并标准化一条批量导入的规则，非法时抛出 ValueError
+def normalize_batch_acl(acl_data: dict) -> dict:
+	if not isinstance(acl_data, dict):
+		raise ValueError("规则格式非法")
+	for field in ('action', 'target'):  # peer_id 可选
+		if field not in acl_data:
+			raise ValueError(f"缺少必需字段: {field}")
+	if acl_data['action'] not in ["allow", "deny"]:
+		raise ValueError("action必须为allow或deny")
+	if not validate_acl_target(acl_data['target']):
+		raise ValueError("target格式非法")
+	protocol = acl_data.get('protocol') or ''
+	if isinstance(protocol, str) and protocol.lower() in ("*", "all"):
+		protocol = ""
+	peer_id = acl_data.get('peer_id')
+	if peer_id is not None:
+		try:
+			peer_id = int(peer_id)
+		except (TypeError, ValueError):
+			raise ValueError("peer_id 必须为整数")
+	port = acl_data.get('port')
+	return {
+		"rule_type": acl_data.get('rule_type', 'firewall'),
+		"peer_id": peer_id,
+		"action": acl_data['action'],
+		"target": acl_data['target'].strip(),
+		"destination": acl_data.get('destination'),
+		"source_interface": acl_data.get('source_interface'),
+		"destination_interface": acl_data.get('destination_interface'),
+		"port": '' if port is None else str(port),
+		"protocol": protocol,
+		"direction": acl_data.get('direction', 'both'),
+		"enabled": True
+	}
+
 # ACL 创建（POST /acls，兼容前端接口，支持全局规则和方向控制）
 @router.post("/acls")
 def create_acl_with_port(
@@ -99,7 +297,8 @@ def create_acl_with_port(
 	port: str = Body(""),
 	protocol: str = Body(""),
 	direction: str = Body("both"),  # 添加方向参数，默认both
-	current_user: User = Depends(get_current_user)
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
 ):
 	if rule_type not in ["firewall", "nat"]:
 		raise HTTPException(status_code=400, detail="rule_type 必须为 firewall 或 nat")
@@ -117,9 +316,6 @@ def create_acl_with_port(
 		if not destination or not validate_acl_target(destination):
 			raise HTTPException(status_code=400, detail="destination 格式非法")
 	
-	from app.main import SessionLocal
-	session = SessionLocal()
-	
 	# 处理全局规则：如果peer_id为None或-1，表示全局规则
 	if peer_id is None or peer_id == -1:
 		peer_id = None  # 全局规则设为 None
@@ -127,43 +323,25 @@ def create_acl_with_port(
 		# 验证节点是否存在
 		peer = session.query(Peer).get(peer_id)
 		if not peer:
-			session.close()
 			raise HTTPException(status_code=400, detail="指定的节点不存在")
 	
-	# 检查是否已存在相同规则
-	existing_acl = session.query(ACL).filter_by(
-		rule_type=rule_type,
-		peer_id=peer_id,
-		target=target,
-		destination=destination,
-		source_interface=source_interface,
-		destination_interface=destination_interface,
-		port=port,
-		protocol=protocol,
-		direction=direction
-	).first()
-	
-	if existing_acl:
-		existing_acl.action = action
-		msg = "ACL updated"
-	else:
-		acl = ACL(
-			rule_type=rule_type,
-			peer_id=peer_id,
-			action=action,
-			target=target,
-			destination=destination,
-			source_interface=source_interface,
-			destination_interface=destination_interface,
-			port=port,
-			protocol=protocol,
-			direction=direction
-		)
-		session.add(acl)
-		msg = "ACL created"
+	# 相同规则已存在时覆盖 action（依赖 uq_acls_identity 唯一索引的单条 upsert）
+	acl_id, created = save_acl(session, {
+		"rule_type": rule_type,
+		"peer_id": peer_id,
+		"action": action,
+		"target": target,
+		"destination": destination,
+		"source_interface": source_interface,
+		"destination_interface": destination_interface,
+		"port": port,
+		"protocol": protocol,
+		"direction": direction,
+		"enabled": True
+	})
+	msg = "ACL created" if created else "ACL updated"
 	
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	if not sync_success:
@@ -172,7 +350,8 @@ def create_acl_with_port(
 	try:
 		peer_info = "全局规则" if peer_id is None else f"peer_id={peer_id}"
 		direction_info = f"方向:{direction}"
-		log_activity(f"{msg}: {peer_info} target={target} {direction_info}", type='success')
+		log_activity(f"{msg}: {peer_info} target={target} {direction_info}", type='success', session=session,
+			event_type='acl.save', actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	return {"msg": msg, "sync_success": sync_success}
@@ -183,40 +362,44 @@ def create_acl_minimal(
 	peer_id: int = Body(...),
 	action: str = Body(...),
 	target: str = Body(...),
-	current_user: User = Depends(get_current_user)
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
 ):
 	if action not in ["allow", "deny"]:
 		raise HTTPException(status_code=400, detail="action 必须为 allow 或 deny")
 	if not validate_acl_target(target):
 		raise HTTPException(status_code=400, detail="target 格式非法")
 	
-	from app.main import SessionLocal
-	session = SessionLocal()
-	
-	# 处理全局规则
+	# 处理全局规则：与 POST /acls 一致存为 None
 	if peer_id is None or peer_id == -1:
-		peer_id = -1
+		peer_id = None
 	else:
 		# 验证节点是否存在
 		peer = session.query(Peer).get(peer_id)
 		if not peer:
-			session.close()
 			raise HTTPException(status_code=400, detail="指定的节点不存在")
 	
-	acl = session.query(ACL).filter_by(peer_id=peer_id, target=target).first()
-	if acl:
-		acl.action = action
-		msg = "ACL updated"
-	else:
-		acl = ACL(peer_id=peer_id, action=action, target=target)
-		session.add(acl)
-		msg = "ACL created"
+	# 其余字段取默认值，与 POST /acls 共用按规则标识的 upsert
+	acl_id, created = save_acl(session, {
+		"rule_type": "firewall",
+		"peer_id": peer_id,
+		"action": action,
+		"target": target,
+		"destination": None,
+		"source_interface": None,
+		"destination_interface": None,
+		"port": "",
+		"protocol": "",
+		"direction": "both",
+		"enabled": True
+	})
+	msg = "ACL created" if created else "ACL updated"
 	session.commit()
-	session.close()
 	# 记录活动
 	try:
-		peer_info = "全局规则" if peer_id == -1 else f"peer_id={peer_id}"
-		log_activity(f"{msg}: {peer_info} target={target}", type='success')
+		peer_info = "全局规则" if peer_id is None else f"peer_id={peer_id}"
+		log_activity(f"{msg}: {peer_info} target={target}", type='success', session=session,
+			event_type='acl.save', actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	return {"msg": msg}
@@ -235,13 +418,11 @@ def edit_acl_api(
 	port: str = Body(None),
 	protocol: str = Body(None),
 	direction: str = Body(None),  # 添加方向参数
-	current_user: User = Depends(get_current_user)
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
 ):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	acl = session.query(ACL).get(acl_id)
 	if not acl:
-		session.close()
 		raise HTTPException(status_code=404, detail="ACL not found")
 	
 	# allow changing associated peer (including setting to global rule)
@@ -253,34 +434,28 @@ def edit_acl_api(
 			# validate peer exists
 			peer = session.query(Peer).get(peer_id)
 			if not peer:
-				session.close()
 				raise HTTPException(status_code=400, detail="指定的节点不存在")
 			acl.peer_id = peer_id
 	
 	if rule_type:
 		if rule_type not in ["firewall", "nat"]:
-			session.close()
 			raise HTTPException(status_code=400, detail="rule_type 必须为 firewall 或 nat")
 		acl.rule_type = rule_type
 	
 	if action:
 		if acl.rule_type == "firewall" and action not in ["allow", "deny"]:
-			session.close()
 			raise HTTPException(status_code=400, detail="firewall action 必须为 allow 或 deny")
 		elif acl.rule_type == "nat" and action not in ["allow", "deny"]:
-			session.close()
 			raise HTTPException(status_code=400, detail="nat action 必须为 allow 或 deny")
 		acl.action = action
 	
 	if target:
 		if not validate_acl_target(target):
-			session.close()
 			raise HTTPException(status_code=400, detail="target 格式非法")
 		acl.target = target
 	
 	if destination is not None:
 		if destination and not validate_acl_target(destination):
-			session.close()
 			raise HTTPException(status_code=400, detail="destination 格式非法")
 		acl.destination = destination
 	
@@ -301,29 +476,26 @@ def edit_acl_api(
 	
 	if direction:
 		if acl.rule_type == "firewall" and direction not in ["inbound", "outbound", "both"]:
-			session.close()
 			raise HTTPException(status_code=400, detail="direction 必须为 inbound、outbound 或 both")
 		acl.direction = direction
 	
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	msg = "ACL updated"
 	# 记录活动
 	try:
-		log_activity(f"更新 防火墙 规则: {acl_id}", type='info')
+		log_activity(f"更新 防火墙 规则: {acl_id}", type='info', session=session, event_type='acl.update',
+			actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	if not sync_success:
 		msg += " (警告: WireGuard 同步失败)"
 	return {"msg": msg, "sync_success": sync_success}
 
-# ACL 删除
-@router.delete("/acls/{acl_id}")
-def delete_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
+# ACL 删除（路径参数限定为整数，避免遮蔽 DELETE /acls/batch）
+@router.delete("/acls/{acl_id:int}")
+def delete_acl_api(acl_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	acl = session.query(ACL).get(acl_id)
 	if acl:
 		session.delete(acl)
@@ -331,7 +503,6 @@ def delete_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
 		msg = "ACL deleted"
 	else:
 		msg = "ACL not found"
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	if msg == "ACL deleted" and not sync_success:
@@ -339,32 +510,34 @@ def delete_acl_api(acl_id: int, current_user: User = Depends(get_current_user)):
 	# 记录活动
 	try:
 		if msg == "ACL deleted":
-			log_activity(f"删除 防火墙 规则: {acl_id}", type='warning')
+			log_activity(f"删除 防火墙 规则: {acl_id}", type='warning', session=session, event_type='acl.delete',
+				actor=current_user.username, entity_type='acl', entity_id=acl_id)
 		else:
-			log_activity(f"尝试 删除 防火墙 规则: {acl_id} 但未找到", type='warning')
+			log_activity(f"尝试 删除 防火墙 规则: {acl_id} 但未找到", type='warning', session=session,
+				event_type='acl.delete_missing', actor=current_user.username, entity_type='acl', entity_id=acl_id)
 	except Exception:
 		pass
 	return {"msg": msg, "sync_success": sync_success}
 
 # Peer 删除时级联删除 ACL
 @router.delete("/peers/{peer_id}")
-def delete_peer_cascade(peer_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
+def delete_peer_cascade(peer_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	peer = session.query(Peer).get(peer_id)
 	if peer:
-		session.query(ACL).filter_by(peer_id=peer_id).delete()
+		delete_peer_acls(session, [peer_id])
 		session.delete(peer)
 		session.commit()
+		from app.client_config import invalidate_peer
+		invalidate_peer(peer_id)
 		msg = "Peer and related ACLs deleted"
 		# 记录活动
 		try:
-			log_activity(f"删除 节点: {peer_id} 及其相关规则", type='warning')
+			log_activity(f"删除 节点: {peer_id} 及其相关规则", type='warning', session=session, event_type='peer.delete',
+				actor=current_user.username, entity_type='peer', entity_id=peer_id)
 		except Exception:
 			pass
 	else:
 		msg = "Peer not found"
-	session.close()
 	return {"msg": msg}
 
 # 批量操作接口
@@ -375,7 +548,7 @@ class BatchACLRequest(BaseModel):
     acls: List[dict]
 
 @router.post("/acls/batch")
-def batch_create_acls(request: BatchACLRequest, current_user: User = Depends(get_current_user)):
+def batch_create_acls(request: BatchACLRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量创建ACL规则"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量创建 {len(request.acls)} 个ACL")
@@ -384,86 +557,37 @@ def batch_create_acls(request: BatchACLRequest, current_user: User = Depends(get
         success_count = 0
         fail_count = 0
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
+        # 1. 逐条校验与标准化（纯内存，target 解析有缓存）
+        normalized = []
         for i, acl_data in enumerate(request.acls):
             try:
-                # 验证必需字段
-                required_fields = ['action', 'target']  # 移除peer_id的必需验证
-                for field in required_fields:
-                    if field not in acl_data:
-                        raise ValueError(f"缺少必需字段: {field}")
-
-                # 验证action
-                if acl_data['action'] not in ["allow", "deny"]:
-                    raise ValueError("action必须为allow或deny")
-
-                # 验证target
-                if not validate_acl_target(acl_data['target']):
-                    raise ValueError("target格式非法")
-
-                # 验证peer_id（如果提供的话）
-                peer_id = acl_data.get('peer_id')
-                if peer_id is not None:
-                    peer = session.query(Peer).get(peer_id)
-                    if not peer:
-                        raise ValueError("指定的节点不存在")
-
-                # 检查是否已存在相同规则
-                existing_acl = session.query(ACL).filter_by(
-                    rule_type=acl_data.get('rule_type', 'firewall'),
-                    peer_id=acl_data.get('peer_id'),
-                    target=acl_data['target'],
-                    destination=acl_data.get('destination'),
-                    source_interface=acl_data.get('source_interface'),
-                    destination_interface=acl_data.get('destination_interface'),
-                    port=acl_data.get('port', ''),
-                    protocol=acl_data.get('protocol', ''),
-                    direction=acl_data.get('direction', 'both')  # 添加direction到唯一性检查
-                ).first()
-
-                if existing_acl:
-                    existing_acl.action = acl_data['action']
-                    msg = "ACL updated"
-                else:
-                    # 标准化协议
-                    protocol = acl_data.get('protocol', '')
-                    if isinstance(protocol, str) and protocol.lower() in ("*", "all"):
-                        protocol = ""
-
-                    acl = ACL(
-                        rule_type=acl_data.get('rule_type', 'firewall'),
-                        peer_id=acl_data.get('peer_id'),
-                        action=acl_data['action'],
-                        target=acl_data['target'],
-                        destination=acl_data.get('destination'),
-                        source_interface=acl_data.get('source_interface'),
-                        destination_interface=acl_data.get('destination_interface'),
-                        port=acl_data.get('port', ''),
-                        protocol=protocol,
-                        direction=acl_data.get('direction', 'both')
-                    )
-                    session.add(acl)
-                    msg = "ACL created"
-
-                results.append({
-                    "index": i,
-                    "success": True,
-                    "message": msg
-                })
-                success_count += 1
-
+                normalized.append((i, normalize_batch_acl(acl_data)))
             except Exception as e:
-                results.append({
-                    "index": i,
-                    "success": False,
-                    "error": str(e)
-                })
+                normalized.append((i, e))
+
+        # 2. 预取引用的节点与已存在的规则标识（分块 IN 查询）
+        valid_rows = [row for _, row in normalized if isinstance(row, dict)]
+        peer_ids = existing_peer_ids(session, {row["peer_id"] for row in valid_rows if row["peer_id"] is not None})
+        existing = existing_acl_identities(session, {row["target"] for row in valid_rows})
+
+        # 3. 批内去重：同一标识以最后一条的 action 为准
+        pending = {}
+        for i, row in normalized:
+            if isinstance(row, dict) and row["peer_id"] is not None and row["peer_id"] not in peer_ids:
+                row = ValueError("指定的节点不存在")
+            if not isinstance(row, dict):
+                results.append({"index": i, "success": False, "error": str(row)})
                 fail_count += 1
-
+                continue
+            identity = acl_identity(row)
+            msg = "ACL updated" if identity in existing or identity in pending else "ACL created"
+            pending[identity] = row
+            results.append({"index": i, "success": True, "message": msg})
+            success_count += 1
+
+        # 4. 单次批量 upsert
+        upsert_acls(session, list(pending.values()), existing)
         session.commit()
-        session.close()
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -473,7 +597,8 @@ def batch_create_acls(request: BatchACLRequest, current_user: User = Depends(get
 
         # 记录活动
         try:
-            log_activity(f"批量创建防火墙规则: 成功{success_count}, 失败{fail_count}", type='success')
+            log_activity(f"批量创建防火墙规则: 成功{success_count}, 失败{fail_count}", type='success', session=session,
+                         event_type='acl.batch_create', actor=current_user.username)
         except Exception:
             pass
 
@@ -489,23 +614,14 @@ def batch_create_acls(request: BatchACLRequest, current_user: User = Depends(get
 
 
 @router.post("/acls/batch-toggle")
-def batch_toggle_acls(acl_ids: List[int] = Body(...), current_user: User = Depends(get_current_user)):
+def batch_toggle_acls(acl_ids: List[int] = Body(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量启用/禁用ACL规则"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量操作 {len(acl_ids)} 个ACL")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
-        updated_count = 0
-        for acl_id in acl_ids:
-            acl = session.query(ACL).get(acl_id)
-            if acl:
-                acl.enabled = not acl.enabled
-                updated_count += 1
-
+        updated_ids = toggle_acls(session, acl_ids)
+        updated_count = len(updated_ids)
         session.commit()
-        session.close()
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -515,13 +631,15 @@ def batch_toggle_acls(acl_ids: List[int] = Body(...), current_user: User = Depen
 
         # 记录活动
         try:
-            log_activity(f"批量切换防火墙规则状态: 更新{updated_count}个", type='info')
+            log_activity(f"批量切换防火墙规则状态: 更新{updated_count}个", type='info', session=session,
+                         event_type='acl.batch_toggle', actor=current_user.username)
         except Exception:
             pass
 
         return {
             "msg": f"批量操作完成: 更新{updated_count}个规则",
             "updated_count": updated_count,
+            "updated_ids": updated_ids,
             "sync_success": sync_success
         }
 
@@ -531,23 +649,14 @@ def batch_toggle_acls(acl_ids: List[int] = Body(...), current_user: User = Depen
 
 
 @router.delete("/acls/batch")
-def batch_delete_acls(acl_ids: List[int] = Body(...), current_user: User = Depends(get_current_user)):
+def batch_delete_acls(acl_ids: List[int] = Body(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量删除ACL规则"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量删除 {len(acl_ids)} 个ACL")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
-        deleted_count = 0
-        for acl_id in acl_ids:
-            acl = session.query(ACL).get(acl_id)
-            if acl:
-                session.delete(acl)
-                deleted_count += 1
-
+        deleted_ids = delete_acls(session, acl_ids)
+        deleted_count = len(deleted_ids)
         session.commit()
-        session.close()
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -557,13 +666,15 @@ def batch_delete_acls(acl_ids: List[int] = Body(...), current_user: User = Depen
 
         # 记录活动
         try:
-            log_activity(f"批量删除防火墙规则: 删除{deleted_count}个", type='warning')
+            log_activity(f"批量删除防火墙规则: 删除{deleted_count}个", type='warning', session=session,
+                         event_type='acl.batch_delete', actor=current_user.username)
         except Exception:
             pass
 
         return {
             "msg": f"批量删除完成: 删除{deleted_count}个规则",
             "deleted_count": deleted_count,
+            "deleted_ids": deleted_ids,
             "sync_success": sync_success
         }
 
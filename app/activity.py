@@ -1,27 +1,357 @@
-from fastapi import APIRouter
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import JSONResponse
-from app.models import Activity
+from sqlalchemy import func, insert, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import ACTIVITY_BATCH_SIZE, ACTIVITY_ENQUEUE_TIMEOUT, ACTIVITY_FLUSH_MS, ACTIVITY_QUEUE_SIZE
+from app.auth import get_current_user_async
+from app.db import dialect_insert, get_async_db
+from app.events import event_broker
+from app.models import Activity, ActivityRollup, User
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
+_STOP = object()
+_EVENT_FIELDS = {'event_type': None, 'actor': None, 'entity_type': None, 'entity_id': None}
 
-def log_activity(message: str, type: str = 'info'):
-    """记录一条活动到数据库（函数内导入 SessionLocal，避免循环导入）"""
-    from app.main import SessionLocal
-    session = SessionLocal()
-    act = Activity(type=type, message=message)
-    session.add(act)
-    session.commit()
-    session.close()
+ROLLUP_PERIODS = ('hour', 'day')
+
+
+def rollup_bucket(period: str, moment: datetime) -> datetime:
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_counts(rows) -> Counter:
+    """按 (时段, 时段起点, 类型) 统计一批活动；rows 为含 type / created_at 的字典或行"""
+    counts = Counter()
+    for row in rows:
+        type_, created_at = (row['type'], row['created_at']) if isinstance(row, dict) else row
+        for period in ROLLUP_PERIODS:
+            counts[(period, rollup_bucket(period, created_at), type_)] += 1
+    return counts
+
+
+def record_rollups(conn, counts: Counter):
+    """把计数累加到 activity_rollups（一条预编译的 upsert 批量执行）"""
+    if not counts:
+        return
+    stmt = dialect_insert(conn, ActivityRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['period', 'bucket', 'type'],
+        set_={'count': ActivityRollup.count + stmt.excluded['count']}
+    )
+    conn.execute(stmt, [
+        {'period': period, 'bucket': bucket, 'type': type_, 'count': count}
+        for (period, bucket, type_), count in counts.items()
+    ])
+
+
+def recent_activity_count_stmt(hours: int = 24):
+    """最近 hours 小时的活动数（按小时汇总求和，包含起点所在的整小时；不扫描活动表）"""
+    since = rollup_bucket('hour', datetime.utcnow() - timedelta(hours=hours))
+    return select(func.coalesce(func.sum(ActivityRollup.count), 0)).where(
+        ActivityRollup.period == 'hour', ActivityRollup.bucket >= since
+    )
+
+
+def _total_count_stmt():
+    return select(func.coalesce(func.sum(ActivityRollup.count), 0)).where(ActivityRollup.period == 'day')
+
+
+def total_activity_count(session) -> int:
+    """累计记录的活动数（含已清理的记录，读取按天汇总）"""
+    return session.execute(_total_count_stmt()).scalar()
+
+
+class ActivityWriter:
+    """活动日志后台写入器
+
+    请求只把活动放入内存队列；后台线程凑满 batch_size 条或等待 flush_ms 毫秒后，
+    用一条 executemany INSERT、一次提交写入，多次活动共享一次提交和 fsync。
+    队列满时调用方最多阻塞 enqueue_timeout 秒（背压），仍然满则直接同步写入，不丢记录。
+    进程退出时（应用 shutdown 事件与 atexit）写完队列中剩余的记录。
+    """
+
+    def __init__(self, batch_size: int = ACTIVITY_BATCH_SIZE, flush_ms: int = ACTIVITY_FLUSH_MS,
+                 queue_size: int = ACTIVITY_QUEUE_SIZE, enqueue_timeout: float = ACTIVITY_ENQUEUE_TIMEOUT,
+                 session_factory=None):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_ms, 0) / 1000
+        self.enqueue_timeout = enqueue_timeout
+        self._session_factory = session_factory
+        self._queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.overflow = 0  # 队列满时同步写入的条数
+        self.failed = 0
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.main import SessionLocal
+        return SessionLocal()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """写完队列中剩余的记录后停止后台线程（可重复调用）"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def enqueue(self, row: dict, timeout: float = None) -> bool:
+        """放入队列；等待超时后返回 False"""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout if timeout is None else timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def write_now(self, rows: list):
+        """不经队列直接写入（队列满时的后备路径）"""
+        self.overflow += len(rows)
+        self._write(rows)
+
+    def flush(self):
+        """等待队列中已有的记录全部写入"""
+        if self._thread is None:
+            return
+        self._queue.join()
+
+    def _collect(self, first) -> list:
+        rows = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            rows.append(row)
+            if row is _STOP:
+                break
+        return rows
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            rows = self._collect(self._queue.get())
+            if rows[-1] is _STOP:
+                stopping = True
+            batch = [row for row in rows if row is not _STOP]
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+        # 停止后仍可能有并发放入的记录
+        leftover = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if row is not _STOP:
+                leftover.append(row)
+        if leftover:
+            self._write(leftover)
+
+    def _write(self, rows: list):
+        session = self._session()
+        try:
+            conn = session.connection()
+            # executemany 要求每行字段一致；按参数顺序返回 id，供实时事件使用
+            rows = [{**_EVENT_FIELDS, **row} for row in rows]
+            ids = conn.execute(
+                insert(Activity).returning(Activity.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            # 汇总与记录在同一事务中写入，计数与活动表保持一致
+            record_rollups(conn, rollup_counts(rows))
+            session.commit()
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            session.rollback()
+            self.failed += len(rows)
+            logger.error(f"写入 {len(rows)} 条活动记录失败: {e}")
+            return
+        finally:
+            session.close()
+        # 提交后再推送，客户端收到事件时记录已可查询
+        for activity_id, row in zip(ids, rows):
+            event_broker.publish('activity', _activity_item({'id': activity_id, **row}))
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'overflow': self.overflow,
+            'failed': self.failed
+        }
+
+
+# 全局活动日志写入器实例
+activity_writer = ActivityWriter()
+atexit.register(activity_writer.stop)
+
+
+def _activity_row(message: str, type: str, event_type: str = None, actor: str = None,
+                  entity_type: str = None, entity_id: int = None) -> dict:
+    # 时间取记录时刻，而不是写入时刻
+    return {
+        'type': type, 'message': message, 'created_at': datetime.utcnow(), 'event_type': event_type,
+        'actor': actor, 'entity_type': entity_type, 'entity_id': entity_id
+    }
+
+
+def log_activity(message: str, type: str = 'info', session=None, event_type: str = None,
+                 actor: str = None, entity_type: str = None, entity_id: int = None):
+    """记录一条活动（放入后台写入队列，不在请求中提交）
+
+    event_type/actor/entity_* 为结构化字段，供按索引审计查询；
+    session 参数保留以兼容已有调用，不再使用。
+    """
+    row = _activity_row(message, type, event_type, actor, entity_type, entity_id)
+    if not activity_writer.enqueue(row):
+        activity_writer.write_now([row])
+
+
+async def log_activity_async(message: str, type: str = 'info', session: AsyncSession = None, event_type: str = None,
+                             actor: str = None, entity_type: str = None, entity_id: int = None):
+    """异步接口使用：队列未满时不阻塞事件循环，满时在线程中等待"""
+    row = _activity_row(message, type, event_type, actor, entity_type, entity_id)
+    if activity_writer.enqueue(row, timeout=0):
+        return
+    if not await asyncio.to_thread(activity_writer.enqueue, row):
+        await asyncio.to_thread(activity_writer.write_now, [row])
+
+
+ACTIVITY_FIELDS = {
+    'id': Activity.id,
+    'type': Activity.type,
+    'message': Activity.message,
+    'created_at': Activity.created_at,
+    'event_type': Activity.event_type,
+    'actor': Activity.actor,
+    'entity_type': Activity.entity_type,
+    'entity_id': Activity.entity_id,
+}
+
+# activities_fts 是否可用（按进程缓存；建表或迁移后不会再消失）
+_fts_available = None
+
+
+async def _has_fts(session) -> bool:
+    global _fts_available
+    if _fts_available is None:
+        if session.bind.dialect.name != 'sqlite':
+            _fts_available = False
+        else:
+            _fts_available = (await session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activities_fts'")
+            )).first() is not None
+    return _fts_available
+
+
+async def message_filter(session, q: str):
+    """消息搜索条件：FTS5 trigram 索引（至少 3 个字符），否则退回 LIKE 子串匹配"""
+    from app.listing import escape_like
+    if len(q) >= 3 and await _has_fts(session):
+        phrase = '"' + q.replace('"', '""') + '"'
+        matches = select(literal_column('rowid')).select_from(text('activities_fts')).where(
+            literal_column('activities_fts').op('MATCH')(phrase)
+        )
+        return Activity.id.in_(matches)
+    return Activity.message.like(f"%{escape_like(q)}%", escape='\\')
+
+
+def _activity_item(row: dict) -> dict:
+    created_at = row.pop('created_at')
+    row['timestamp'] = created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None
+    return row
 
 
 @router.get('/activities')
-def get_activities(limit: int = 20):
-    """返回最近的活动，按时间倒序（函数内导入 SessionLocal，避免循环导入）"""
-    from app.main import SessionLocal
-    session = SessionLocal()
-    acts = session.query(Activity).order_by(Activity.created_at.desc()).limit(limit).all()
-    session.close()
+async def get_activities(
+    request: Request,
+    response: Response,
+    limit: int = None,
+    cursor: str = None,
+    type: str = None,
+    event_type: str = None,
+    actor: str = None,
+    entity_type: str = None,
+    entity_id: int = None,
+    q: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    current_user: User = Depends(get_current_user_async),
+    session: AsyncSession = Depends(get_async_db)
+):
+    """返回活动，按时间倒序（异步查询）；活动表未变化时按 ETag 返回 304
+
+    不带分页 / 过滤参数时保持原格式（最近 20 条数组）；否则按 id 倒序游标分页，
+    返回 {"items", "next_cursor"}。event_type / actor / entity 过滤走复合索引，q 走全文索引。
+    """
+    from app.generations import conditional_list
+    from app.listing import keyset_page, page_limit
+    not_modified = await conditional_list(request, response, session, 'activities')
+    if not_modified is not None:
+        return not_modified
+    if all(v is None for v in (cursor, type, event_type, actor, entity_type, entity_id, q, since, until)):
+        return await _latest_activities(session, 20 if limit is None else limit)
+
+    filters = []
+    if type is not None:
+        filters.append(Activity.type == type)
+    if event_type is not None:
+        filters.append(Activity.event_type == event_type)
+    if actor is not None:
+        filters.append(Activity.actor == actor)
+    if entity_type is not None:
+        filters.append(Activity.entity_type == entity_type)
+    if entity_id is not None:
+        filters.append(Activity.entity_id == entity_id)
+    if since is not None:
+        filters.append(Activity.created_at >= since)
+    if until is not None:
+        filters.append(Activity.created_at < until)
+    if q:
+        filters.append(await message_filter(session, q))
+    items, next_cursor = await keyset_page(
+        session, Activity.id, ACTIVITY_FIELDS, list(ACTIVITY_FIELDS), filters,
+        Activity.id, 'id', True, cursor, page_limit(limit)
+    )
+    return {"items": [_activity_item(item) for item in items], "next_cursor": next_cursor}
+
+
+async def _latest_activities(session, limit: int) -> list:
+    acts = (await session.execute(
+        select(Activity).order_by(Activity.created_at.desc()).limit(limit)
+    )).scalars().all()
     return [
         {
             'id': a.id,
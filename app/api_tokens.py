@@ -0,0 +1,303 @@
+"""自动化脚本使用的长期 API 令牌
+
+令牌格式为 wga_<前缀>_<密钥>。前缀明文保存并建唯一索引，用于一次索引查找；
+密钥只保存 HMAC-SHA256 摘要，验证时常量时间比较，不经过 bcrypt。
+验证所需的记录按前缀缓存；最后使用时间先记在内存中，按固定间隔批量写回，
+而不是每个请求写一次数据库。
+"""
+import hashlib
+import hmac
+import logging
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.cache import LRUCache
+from app.config import API_TOKEN_CACHE_SECONDS, API_TOKEN_CACHE_SIZE, API_TOKEN_USAGE_FLUSH_SECONDS
+from app.models import ApiToken, AppSecret, User
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = 'wga_'
+PEPPER_NAME = 'API_TOKEN_PEPPER'
+
+# 权限范围：admin 包含全部权限，任一写权限同时包含 read
+SCOPES = ('read', 'peers:write', 'acls:write', 'admin')
+# 路径前缀 -> 写操作所需权限；未列出的写操作需要 admin
+WRITE_SCOPES = (('/peers', 'peers:write'), ('/acls', 'acls:write'))
+# 无论读写都需要 admin 的路径（导出内容含私钥、令牌与账号管理）
+ADMIN_PATHS = ('/backup', '/api-tokens', '/change-password', '/users', '/peers/export')
+# 返回解密后客户端私钥的单个节点配置与二维码，读取也需要 peers:write
+PEER_SECRET_PATH = re.compile(r'^/peers/[^/]+/config(/qrcode)?/?$')
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# 使用 POST 但只读取数据的路径（换取事件流票据）
+READ_PATHS = ('/events/ticket',)
+
+
+def required_scope(method: str, path: str) -> str:
+    if path.startswith(ADMIN_PATHS):
+        return 'admin'
+    if PEER_SECRET_PATH.match(path):
+        return 'peers:write'
+    if method.upper() in READ_METHODS or path in READ_PATHS:
+        return 'read'
+    for prefix, scope in WRITE_SCOPES:
+        if path == prefix or path.startswith(prefix + '/'):
+            return scope
+    return 'admin'
+
+
+def scope_allows(scopes, required: str) -> bool:
+    if 'admin' in scopes or required in scopes:
+        return True
+    return required == 'read' and bool(scopes)
+
+
+def parse_scopes(scopes) -> tuple:
+    """校验并规范化权限列表（去重、按 SCOPES 顺序）"""
+    names = set(scopes or ())
+    unknown = names - set(SCOPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的权限: {', '.join(sorted(unknown))}")
+    if not names:
+        raise HTTPException(status_code=400, detail="至少需要一个权限")
+    return tuple(scope for scope in SCOPES if scope in names)
+
+
+def is_api_token(token: str) -> bool:
+    return token.startswith(TOKEN_PREFIX)
+
+
+_pepper = None
+_pepper_lock = threading.Lock()
+
+
+def token_pepper(session_factory=None) -> bytes:
+    """HMAC 密钥：首次使用时从 app_secrets 读取或生成，之后常驻内存"""
+    global _pepper
+    if _pepper is not None:
+        return _pepper
+    with _pepper_lock:
+        if _pepper is None:
+            if session_factory is None:
+                from app.main import SessionLocal
+                session_factory = SessionLocal
+            session = session_factory()
+            try:
+                record = session.query(AppSecret).filter_by(name=PEPPER_NAME).first()
+                if record is None:
+                    session.add(AppSecret(name=PEPPER_NAME, value=secrets.token_urlsafe(32)))
+                    try:
+                        session.commit()
+                    except IntegrityError:
+                        # 其他 worker 同时生成了密钥，使用对方的
+                        session.rollback()
+                    record = session.query(AppSecret).filter_by(name=PEPPER_NAME).first()
+                _pepper = record.value.encode()
+            finally:
+                session.close()
+    return _pepper
+
+
+def hash_secret(secret: str) -> str:
+    return hmac.new(token_pepper(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+def generate_token() -> tuple:
+    """返回 (完整令牌, 前缀, 密钥)；完整令牌只在创建时返回一次"""
+    prefix = secrets.token_hex(6)
+    secret = secrets.token_urlsafe(32)
+    return f"{TOKEN_PREFIX}{prefix}_{secret}", prefix, secret
+
+
+def parse_token(token: str) -> tuple:
+    prefix, sep, secret = token[len(TOKEN_PREFIX):].partition('_')
+    if not sep or not prefix or not secret:
+        raise HTTPException(status_code=401, detail="API 令牌无效")
+    return prefix, secret
+
+
+def create_api_token(session, user_id: int, name: str, scopes, expires_at: datetime = None) -> tuple:
+    """创建令牌，返回 (ApiToken, 完整令牌)；调用方负责提交"""
+    token, prefix, secret = generate_token()
+    record = ApiToken(
+        name=name, prefix=prefix, token_hash=hash_secret(secret),
+        scopes=','.join(parse_scopes(scopes)), user_id=user_id, expires_at=expires_at
+    )
+    session.add(record)
+    return record, token
+
+
+@dataclass(frozen=True)
+class ApiTokenRecord:
+    """验证令牌所需的字段，不绑定数据库会话，可跨请求缓存"""
+    id: int
+    token_hash: str
+    scopes: tuple
+    expires_at: datetime
+    user_id: int
+    username: str
+
+
+def _record_stmt(prefix: str):
+    return (
+        select(ApiToken.id, ApiToken.token_hash, ApiToken.scopes, ApiToken.expires_at, User.id, User.username)
+        .join(User, User.id == ApiToken.user_id)
+        .where(ApiToken.prefix == prefix)
+    )
+
+
+def _to_record(row):
+    if row is None:
+        return None
+    token_id, token_hash, scopes, expires_at, user_id, username = row
+    return ApiTokenRecord(token_id, token_hash, tuple(scopes.split(',')), expires_at, user_id, username)
+
+
+class ApiTokenCache:
+    """API 令牌记录缓存（LRU + TTL），按前缀索引；只缓存存在的令牌"""
+
+    def __init__(self, max_entries: int = API_TOKEN_CACHE_SIZE, ttl: float = API_TOKEN_CACHE_SECONDS):
+        self.ttl = ttl
+        self._entries = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prefix: str):
+        entry = self._entries.get(prefix)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, prefix: str, record: ApiTokenRecord):
+        if record is not None:
+            self._entries.set(prefix, (record, time.monotonic() + self.ttl))
+
+    def invalidate(self, prefix: str):
+        self._entries.pop(prefix)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self._entries.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+# 全局 API 令牌缓存实例
+api_token_cache = ApiTokenCache()
+
+
+# 本进程内修改或删除令牌时立即失效缓存；其他 worker 最多在 TTL 后生效
+@event.listens_for(ApiToken, 'after_update')
+@event.listens_for(ApiToken, 'after_delete')
+def _invalidate_cached_token(mapper, connection, target):
+    api_token_cache.invalidate(target.prefix)
+
+
+class ApiTokenUsage:
+    """令牌最后使用时间：请求只更新内存，到达间隔后由后台线程一次批量写回"""
+
+    def __init__(self, interval: float = API_TOKEN_USAGE_FLUSH_SECONDS, session_factory=None):
+        self.interval = interval
+        self._session_factory = session_factory
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-token-usage')
+        self.flushes = 0
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.main import SessionLocal
+        return SessionLocal()
+
+    def touch(self, token_id: int):
+        now = time.monotonic()
+        with self._lock:
+            self._pending[token_id] = datetime.utcnow()
+            due = now >= self._next_flush
+            if due:
+                self._next_flush = now + self.interval
+        if due:
+            self._executor.submit(self.flush)
+
+    def flush(self) -> int:
+        """写回累积的使用时间，返回更新的令牌数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        session = self._session()
+        try:
+            session.connection().execute(
+                update(ApiToken).where(ApiToken.id == bindparam('_id')).values(last_used_at=bindparam('_used')),
+                [{'_id': token_id, '_used': used} for token_id, used in pending.items()]
+            )
+            session.commit()
+            self.flushes += 1
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"写回 API 令牌使用时间失败: {e}")
+            # 放回待写队列，下次一起写回（保留更新的时间）
+            with self._lock:
+                for token_id, used in pending.items():
+                    self._pending.setdefault(token_id, used)
+            return 0
+        finally:
+            session.close()
+        return len(pending)
+
+
+# 全局令牌使用记录实例
+api_token_usage = ApiTokenUsage()
+
+
+def _check(record, secret: str) -> ApiTokenRecord:
+    digest = hash_secret(secret)
+    # 前缀不存在时也先计算摘要，响应时间不暴露前缀是否存在
+    if record is None or not hmac.compare_digest(record.token_hash, digest):
+        raise HTTPException(status_code=401, detail="API 令牌无效")
+    if record.expires_at is not None and record.expires_at <= datetime.utcnow():
+        raise HTTPException(status_code=401, detail="API 令牌已过期")
+    api_token_usage.touch(record.id)
+    return record
+
+
+def resolve_token(token: str, session) -> ApiTokenRecord:
+    """验证 API 令牌：缓存命中时不查询数据库，只做一次 HMAC 比较"""
+    prefix, secret = parse_token(token)
+    record = api_token_cache.get(prefix)
+    if record is None:
+        record = _to_record(session.execute(_record_stmt(prefix)).first())
+        api_token_cache.set(prefix, record)
+    return _check(record, secret)
+
+
+async def resolve_token_async(token: str, session) -> ApiTokenRecord:
+    prefix, secret = parse_token(token)
+    record = api_token_cache.get(prefix)
+    if record is None:
+        record = _to_record((await session.execute(_record_stmt(prefix))).first())
+        api_token_cache.set(prefix, record)
+    return _check(record, secret)
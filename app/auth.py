@@ -1,21 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from app.models import User
+from app.models import ApiToken, User
+from app.api_tokens import (
+    create_api_token, is_api_token, required_scope, resolve_token, resolve_token_async, scope_allows,
+)
+from app.cache import LRUCache
+from app.config import (
+    AUTH_TRUST_CLAIMS, AUTH_USER_CACHE_SECONDS, AUTH_USER_CACHE_SIZE,
+    BCRYPT_ROUNDS, PASSWORD_QUEUE_SIZE, PASSWORD_WORKERS,
+)
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db import get_db, get_async_db
+from app.key_manager import key_manager
 from datetime import datetime, timedelta
+import asyncio
 import os
 import re
-from app.activity import log_activity
+import threading
+import time
 
 router = APIRouter()
 
-SECRET_KEY = os.environ.get("WG_SECRET_KEY", "wireguardaclsecretkey")
+# 显式配置 WG_SECRET_KEY 时使用该固定密钥；否则使用 KeyManager 保存在数据库中、定期轮换的密钥
+SECRET_KEY = os.environ.get("WG_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 轮数与配置不同的哈希视为需要更新，登录成功时重新哈希
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+class PasswordPool:
+    """密码哈希专用线程池
+
+    bcrypt 计算不占用请求线程池；执行中加排队的任务数有上限，
+    饱和时立即以 503 拒绝，登录洪峰（或撞库）不会拖慢其他接口。
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_size: int = PASSWORD_QUEUE_SIZE):
+        self.workers = max(workers, 1)
+        self.capacity = self.workers + max(queue_size, 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self.rejected = 0
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="登录请求过多，请稍后重试", headers={"Retry-After": "1"})
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # 任务结束时才释放名额：请求被取消时计算仍在进行，名额不能提前归还
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def call(self, fn, *args):
+        """同步接口使用：在专用线程池中执行并等待结果"""
+        return self.submit(fn, *args).result()
+
+# 全局密码哈希线程池实例
+password_pool = PasswordPool()
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -57,43 +113,177 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, SECRET_KEY or key_manager.get_current_key(), algorithm=ALGORITHM)
+
+def create_user_token(user) -> str:
+    """签发令牌：sub 为用户名，uid/tv 为用户 id 与令牌版本"""
+    return create_access_token(data={"sub": user.username, "uid": user.id, "tv": user.token_version})
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    # 暂时使用简单验证，避免循环导入
+def decode_token(token: str, purpose: str = None) -> dict:
+    """校验令牌签名；purpose 不一致的令牌（如事件流票据）不能当作其他用途的令牌使用"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="无效认证")
+        if SECRET_KEY:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        else:
+            # 密钥缓存在内存中，轮换过渡期内前一个密钥签发的令牌仍然有效
+            payload = key_manager.decode(token, algorithms=(ALGORITHM,))
     except JWTError:
         raise HTTPException(status_code=401, detail="认证失败")
+    if payload.get("sub") is None or payload.get("purpose") != purpose:
+        raise HTTPException(status_code=401, detail="无效认证")
+    return payload
 
-    # 动态导入SessionLocal避免循环导入
-    import importlib
-    main_module = importlib.import_module('app.main')
-    SessionLocal = main_module.SessionLocal
+@dataclass(frozen=True)
+class Principal:
+    """已认证用户：认证依赖的返回值，不绑定数据库会话，可跨请求缓存"""
+    id: int
+    username: str
+    token_version: int
+    scopes: tuple = None  # API 令牌的权限范围；登录令牌为 None（不限）
 
-    session = SessionLocal()
-    user = session.query(User).filter_by(username=username).first()
-    session.close()
-    if user is None:
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username, token_version=user.token_version)
+
+    @classmethod
+    def from_api_token(cls, record):
+        return cls(id=record.user_id, username=record.username, token_version=0, scopes=record.scopes)
+
+class UserCache:
+    """认证用户缓存（LRU + TTL），按用户名索引"""
+
+    def __init__(self, max_entries: int = AUTH_USER_CACHE_SIZE, ttl: float = AUTH_USER_CACHE_SECONDS):
+        self.ttl = ttl
+        self._entries = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.claims = 0  # 直接信任签名声明的认证次数
+
+    def peek(self, username: str):
+        entry = self._entries.get(username)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def get(self, username: str):
+        principal = self.peek(username)
+        if principal is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return principal
+
+    def set(self, principal: Principal):
+        self._entries.set(principal.username, (principal, time.monotonic() + self.ttl))
+
+    def invalidate(self, username: str):
+        self._entries.pop(username)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.claims = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self._entries.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'trust_claims': AUTH_TRUST_CLAIMS,
+            'claims_authenticated': self.claims
+        }
+
+# 全局认证用户缓存实例
+user_cache = UserCache()
+
+# 本进程内修改或删除用户时立即失效缓存
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.username)
+
+def _cached_principal(claims: dict):
+    """不查询数据库解析用户：信任签名声明，或命中用户缓存；都不可用时返回 None"""
+    username = claims["sub"]
+    if AUTH_TRUST_CLAIMS and "uid" in claims and "tv" in claims:
+        principal = Principal(id=claims["uid"], username=username, token_version=claims["tv"])
+        user_cache.claims += 1
+        # 本进程已知更新的令牌版本（如刚修改过密码）时拒绝旧令牌
+        known = user_cache.peek(username)
+        return known if known is not None and known.token_version != principal.token_version else principal
+    return user_cache.get(username)
+
+def _check_principal(principal, claims: dict) -> Principal:
+    if principal is None:
         raise HTTPException(status_code=401, detail="用户不存在")
-    return user
+    # 不含 tv 的旧令牌按用户名认证
+    if "tv" in claims and claims["tv"] != principal.token_version:
+        raise HTTPException(status_code=401, detail="令牌已失效，请重新登录")
+    return principal
+
+def _remember(user):
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    user_cache.set(principal)
+    return principal
+
+def _check_scope(principal: Principal, request: Request) -> Principal:
+    """API 令牌按请求方法与路径检查权限范围"""
+    if principal.scopes is None or request is None:
+        return principal
+    required = required_scope(request.method, request.url.path)
+    if not scope_allows(principal.scopes, required):
+        raise HTTPException(status_code=403, detail=f"API 令牌缺少权限: {required}")
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_db), request: Request = None):
+    if is_api_token(token):
+        return _check_scope(Principal.from_api_token(resolve_token(token, session)), request)
+    claims = decode_token(token)
+    principal = _cached_principal(claims)
+    if principal is None:
+        # 使用请求级会话，处理函数通过 Depends(get_db) 获得同一个会话
+        principal = _remember(session.query(User).filter_by(username=claims["sub"]).first())
+    return _check_principal(principal, claims)
+
+# 异步接口使用的认证依赖：在事件循环中查询，不占用线程池
+async def get_current_user_async(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_db), request: Request = None):
+    if is_api_token(token):
+        return _check_scope(Principal.from_api_token(await resolve_token_async(token, session)), request)
+    claims = decode_token(token)
+    principal = _cached_principal(claims)
+    if principal is None:
+        user = (await session.execute(select(User).filter_by(username=claims["sub"]))).scalars().first()
+        principal = _remember(user)
+    return _check_principal(principal, claims)
 
 # 登录接口
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    from app.main import SessionLocal
-    session = SessionLocal()
-    user = session.query(User).filter_by(username=form_data.username).first()
-    session.close()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_async_db)):
+    user = (await session.execute(select(User).filter_by(username=form_data.username))).scalars().first()
+    if not user:
         raise HTTPException(status_code=400, detail="用户名或密码错误")
-    access_token = create_access_token(data={"sub": user.username})
+    # 结束只读事务，bcrypt 计算期间不占用数据库连接（会话不在提交时过期对象）
+    await session.commit()
+    # bcrypt 在专用线程池中验证；哈希轮数与配置不一致时同时得到新哈希
+    valid, new_hash = await password_pool.run(pwd_context.verify_and_update, form_data.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=400, detail="用户名或密码错误")
+    if new_hash:
+        user.password_hash = new_hash
+        await session.commit()
+    access_token = create_user_token(user)
     # 记录登录活动
     try:
-        log_activity(f"用户 登录: {user.username}", type='info')
+        from app.activity import log_activity_async
+        await log_activity_async(f"用户 登录: {user.username}", type='info', session=session, event_type='auth.login',
+                                 actor=user.username)
     except Exception:
         pass
     return {"access_token": access_token, "token_type": "bearer"}
@@ -106,12 +296,16 @@ class ChangePasswordRequest(BaseModel):
     new_password: str
 
 @router.post("/change-password")
-def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user)):
+def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     if current_user.username != "admin":
         raise HTTPException(status_code=403, detail="仅 admin 可修改密码")
 
-    # 验证当前密码
-    if not verify_password(request.current_password, current_user.password_hash):
+    user = session.query(User).filter_by(username="admin").first()
+    if not user:
+        raise HTTPException(status_code=404, detail="admin 用户不存在")
+
+    # 验证当前密码（认证依赖返回的是缓存的 Principal，密码哈希从数据库读取）
+    if not password_pool.call(verify_password, request.current_password, user.password_hash):
         raise HTTPException(status_code=400, detail="当前密码错误")
 
     # 验证新密码强度
@@ -119,27 +313,76 @@ def change_password(request: ChangePasswordRequest, current_user: User = Depends
     if not is_valid:
         raise HTTPException(status_code=400, detail=error_msg)
 
-    from app.main import SessionLocal
-    session = SessionLocal()
-    user = session.query(User).filter_by(username="admin").first()
-    if user:
-        user.password_hash = hash_password(request.new_password)
-        session.commit()
-        # 记录活动
-        try:
-            log_activity(f"修改 管理员 密码", type='info')
-        except Exception:
-            pass
-        session.close()
-        return {"msg": "密码修改成功"}
-    else:
-        session.close()
-        raise HTTPException(status_code=404, detail="admin 用户不存在")
+    user.password_hash = password_pool.call(hash_password, request.new_password)
+    # 递增令牌版本，修改前签发的令牌全部失效；返回新令牌供当前客户端继续使用
+    user.token_version = (user.token_version or 0) + 1
+    session.commit()
+    access_token = create_user_token(user)
+    _remember(user)
+    # 记录活动
+    try:
+        from app.activity import log_activity
+        log_activity(f"修改 管理员 密码", type='info', session=session, event_type='auth.change_password',
+                     actor=current_user.username)
+    except Exception:
+        pass
+    return {"msg": "密码修改成功", "access_token": access_token, "token_type": "bearer"}
 # 用户列表接口
 @router.get("/users")
-def get_users(current_user: User = Depends(get_current_user)):
-    from app.main import SessionLocal
-    session = SessionLocal()
+def get_users(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     users = session.query(User).all()
-    session.close()
     return [{"id": u.id, "username": u.username} for u in users]
+
+# API 令牌管理：完整令牌只在创建时返回一次
+class CreateApiTokenRequest(BaseModel):
+    name: str
+    scopes: list[str]
+    expires_in_days: int | None = None
+
+def _api_token_dict(record: ApiToken) -> dict:
+    return {
+        "id": record.id,
+        "name": record.name,
+        "prefix": record.prefix,
+        "scopes": record.scopes.split(','),
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "expires_at": record.expires_at.isoformat() if record.expires_at else None,
+        "last_used_at": record.last_used_at.isoformat() if record.last_used_at else None
+    }
+
+@router.post("/api-tokens")
+def create_token(request: CreateApiTokenRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
+    if not request.name.strip():
+        raise HTTPException(status_code=400, detail="令牌名称不能为空")
+    if request.expires_in_days is not None and request.expires_in_days < 1:
+        raise HTTPException(status_code=400, detail="有效期至少 1 天")
+    expires_at = datetime.utcnow() + timedelta(days=request.expires_in_days) if request.expires_in_days else None
+    record, token = create_api_token(session, current_user.id, request.name.strip(), request.scopes, expires_at)
+    session.commit()
+    try:
+        from app.activity import log_activity
+        log_activity(f"创建 API 令牌: {record.name} ({record.scopes})", type='info', session=session,
+                     event_type='auth.api_token_create', actor=current_user.username)
+    except Exception:
+        pass
+    return {**_api_token_dict(record), "token": token}
+
+@router.get("/api-tokens")
+def list_tokens(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
+    return [_api_token_dict(record) for record in session.query(ApiToken).order_by(ApiToken.id)]
+
+@router.delete("/api-tokens/{token_id:int}")
+def revoke_token(token_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
+    record = session.get(ApiToken, token_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="API 令牌不存在")
+    name = record.name
+    session.delete(record)
+    session.commit()
+    try:
+        from app.activity import log_activity
+        log_activity(f"吊销 API 令牌: {name}", type='info', session=session, event_type='auth.api_token_revoke',
+                     actor=current_user.username)
+    except Exception:
+        pass
+    return {"msg": "API 令牌已吊销"}
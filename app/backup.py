@@ -2,7 +2,9 @@ from fastapi import APIRouter, Response, Depends, HTTPException, Body
 from fastapi.responses import JSONResponse
 from app.models import Peer, ACL, ServerKey, AppSecret, Activity, User
 from app.auth import get_current_user
-from app.activity import log_activity
+from sqlalchemy.orm import Session
+from app.db import get_db
+from app.activity import log_activity, total_activity_count
 import json
 import datetime
 import logging
@@ -12,14 +14,11 @@ logger = logging.getLogger(__name__)
 
 
 @router.get("/backup/export")
-def export_configuration(current_user: User = Depends(get_current_user)):
+def export_configuration(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """导出系统配置"""
     try:
         logger.info(f"用户 {current_user.username} 导出系统配置")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
         # 导出Peers
         peers = session.query(Peer).all()
         peers_data = []
@@ -59,8 +58,6 @@ def export_configuration(current_user: User = Depends(get_current_user)):
                 "created_at": server_key.created_at.isoformat() if server_key.created_at else None
             }
 
-        session.close()
-
         # 构建导出数据
         export_data = {
             "version": "1.0",
@@ -72,7 +69,8 @@ def export_configuration(current_user: User = Depends(get_current_user)):
 
         # 记录活动
         try:
-            log_activity(f"导出系统配置: {len(peers_data)}个节点, {len(acls_data)}个规则", type='info')
+            log_activity(f"导出系统配置: {len(peers_data)}个节点, {len(acls_data)}个规则", type='info', session=session,
+                         event_type='backup.export', actor=current_user.username)
         except Exception:
             pass
 
@@ -86,7 +84,7 @@ def export_configuration(current_user: User = Depends(get_current_user)):
 
 
 @router.post("/backup/import")
-def import_configuration(data: dict = Body(...), current_user: User = Depends(get_current_user)):
+def import_configuration(data: dict = Body(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """导入系统配置"""
     try:
         logger.info(f"用户 {current_user.username} 导入系统配置")
@@ -94,9 +92,6 @@ def import_configuration(data: dict = Body(...), current_user: User = Depends(ge
         if not data or "peers" not in data:
             raise HTTPException(status_code=400, detail="无效的配置文件")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
         imported_peers = 0
         imported_acls = 0
         errors = []
@@ -157,8 +152,6 @@ def import_configuration(data: dict = Body(...), current_user: User = Depends(ge
         except Exception as e:
             session.rollback()
             raise e
-        finally:
-            session.close()
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -170,7 +163,8 @@ def import_configuration(data: dict = Body(...), current_user: User = Depends(ge
 
         # 记录活动
         try:
-            log_activity(f"导入系统配置: {imported_peers}个节点, {imported_acls}个规则", type='success')
+            log_activity(f"导入系统配置: {imported_peers}个节点, {imported_acls}个规则", type='success', session=session,
+                         event_type='backup.import', actor=current_user.username)
         except Exception:
             pass
 
@@ -192,26 +186,21 @@ def import_configuration(data: dict = Body(...), current_user: User = Depends(ge
 
 
 @router.get("/backup/status")
-def get_backup_status(current_user: User = Depends(get_current_user)):
+def get_backup_status(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """获取备份状态信息"""
     try:
-        from app.main import SessionLocal
-        session = SessionLocal()
 
         peer_count = session.query(Peer).count()
         acl_count = session.query(ACL).count()
-        activity_count = session.query(Activity).count()
-
-        # 获取最后备份时间（通过活动日志判断）
-        last_backup_activity = session.query(Activity).filter(
-            Activity.message.like("%导出系统配置%")
-        ).order_by(Activity.created_at.desc()).first()
+        # 累计活动数读取按天汇总（含已按保留期清理的记录）
+        activity_count = total_activity_count(session)
 
-        last_backup_time = None
-        if last_backup_activity:
-            last_backup_time = last_backup_activity.created_at.isoformat()
+        # 获取最后备份时间（按 event_type 索引倒序取第一条）
+        last_backup_at = session.query(Activity.created_at).filter(
+            Activity.event_type == 'backup.export'
+        ).order_by(Activity.id.desc()).limit(1).scalar()
 
-        session.close()
+        last_backup_time = last_backup_at.isoformat() if last_backup_at else None
 
         return {
             "peer_count": peer_count,
@@ -0,0 +1,103 @@
+"""进程内缓存与 HTTP 条件请求工具"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，按条目数（及可选的总字节数）限制容量"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = None, sizeof=None):
+        self.max_entries = max(int(max_entries), 0)
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or len
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries == 0:
+            return
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._data[key] = value
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._discard(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key]
+            self._discard(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _discard(self, key):
+        if key in self._data:
+            value = self._data.pop(key)
+            if self.max_bytes is not None:
+                self._bytes -= self._sizeof(value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def make_etag(content, weak: bool = False) -> str:
+    """根据内容生成 ETag（默认强校验）"""
+    if isinstance(content, str):
+        content = content.encode()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中当前 ETag（弱比较，符合 RFC 7232）"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    current = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
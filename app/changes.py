@@ -0,0 +1,147 @@
+"""增量同步：peers / acls 的变更记录与 GET /changes?since=N
+
+会话 flush 时自动记录 ORM 方式的新增、修改与删除；绕过工作单元的批量语句
+（如 delete(...).returning(...)）由调用方通过 record_changes 显式记录。
+变更记录与业务写入在同一事务中提交，自增 id 即版本号。
+"""
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user_async
+from app.config import CHANGE_LOG_COMPACT_EVERY, CHANGE_LOG_MAX_ENTRIES, LIST_MAX_PAGE_SIZE, LIST_PAGE_SIZE
+from app.db import AppSession, get_async_db
+from app.models import ACL, ChangeLog, Peer, User
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# 模型 -> 实体名
+ENTITIES = {Peer: 'peer', ACL: 'acl'}
+
+
+def compact_change_log(conn, keep: int = CHANGE_LOG_MAX_ENTRIES) -> int:
+    """只保留最新 keep 条变更记录，返回删除的条数"""
+    latest = conn.execute(select(func.max(ChangeLog.id))).scalar()
+    if latest is None or latest <= keep:
+        return 0
+    removed = conn.execute(delete(ChangeLog).where(ChangeLog.id <= latest - keep)).rowcount
+    if removed:
+        logger.info(f"压缩变更记录: 删除 {removed} 条（版本 <= {latest - keep}）")
+    return removed
+
+
+def record_changes(session, changes):
+    """记录一组变更 (实体名, id, 操作)；session 可以是 Session 或 Connection"""
+    if not changes:
+        return
+    conn = session.connection() if isinstance(session, Session) else session
+    ids = conn.execute(
+        insert(ChangeLog).returning(ChangeLog.id),
+        [{'entity': entity, 'entity_id': entity_id, 'op': op} for entity, entity_id, op in changes]
+    ).scalars().all()
+    # 版本号跨过 CHANGE_LOG_COMPACT_EVERY 的整数倍时顺带压缩，单次删除量有上限
+    if max(ids) // CHANGE_LOG_COMPACT_EVERY != (min(ids) - 1) // CHANGE_LOG_COMPACT_EVERY:
+        compact_change_log(conn)
+
+
+def execute_returning_ids(session, build_stmt, ids, entity: str, op: str) -> list:
+    """按 id 分块执行 build_stmt(chunk) 生成的 UPDATE/DELETE ... RETURNING id，返回受影响的 id
+
+    批量语句不经过 flush，在此显式记录变更。
+    """
+    from app.db import chunked
+    affected = []
+    for chunk in chunked(ids):
+        affected.extend(session.execute(
+            build_stmt(chunk),
+            execution_options={"synchronize_session": False}
+        ).scalars().all())
+    record_changes(session, [(entity, affected_id, op) for affected_id in affected])
+    return affected
+
+
+# 注册在共用会话类上：同步会话与异步会话（sync_session_class）的 flush 都会记录
+@event.listens_for(AppSession, 'after_flush')
+def _record_flushed_changes(session, flush_context):
+    changes = []
+    for obj in session.new:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            changes.append((entity, obj.id, 'created'))
+    for obj in session.dirty:
+        entity = ENTITIES.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            changes.append((entity, obj.id, 'updated'))
+    for obj in session.deleted:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            changes.append((entity, obj.id, 'deleted'))
+    record_changes(session.connection(), changes)
+
+
+def _entity_fields():
+    from app.acl import ACL_LIST_FIELDS
+    from app.peer import PEER_LIST_FIELDS
+    return {'peer': (Peer.id, PEER_LIST_FIELDS), 'acl': (ACL.id, ACL_LIST_FIELDS)}
+
+
+@router.get('/changes')
+async def get_changes(
+    since: int,
+    limit: int = None,
+    current_user: User = Depends(get_current_user_async),
+    session: AsyncSession = Depends(get_async_db)
+):
+    """返回版本 since 之后的变更，同一对象只返回最后一次变更及其当前数据
+
+    响应中的 version 为本页覆盖到的版本，下次以 since=version 请求；has_more 为真时继续翻页。
+    since 早于已压缩的记录（或大于当前版本，如数据库已恢复）时返回 resync=true：
+    客户端应先记下 version，再重新拉取完整列表，之后从 version 开始增量同步。
+    """
+    limit = LIST_PAGE_SIZE if limit is None else limit
+    if since < 0 or limit < 1 or limit > LIST_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"since 不能为负数，limit 必须在 1 到 {LIST_MAX_PAGE_SIZE} 之间")
+    oldest, latest = (await session.execute(select(func.min(ChangeLog.id), func.max(ChangeLog.id)))).one()
+    latest = latest or 0
+    if since > latest or (oldest is not None and since < oldest - 1):
+        return {"version": latest, "resync": True, "has_more": False, "changes": []}
+
+    rows = (await session.execute(
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+        .where(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit + 1)
+    )).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    version = rows[-1].id if rows else since
+
+    # 同一对象多次变更只保留最后一次
+    last = {}
+    for row in rows:
+        last.pop((row.entity, row.entity_id), None)
+        last[(row.entity, row.entity_id)] = row
+
+    current = {}
+    for entity, (id_column, fields) in _entity_fields().items():
+        ids = [entity_id for (name, entity_id) in last if name == entity]
+        if not ids:
+            continue
+        columns = [column.label(name) for name, column in fields.items()]
+        for data in (await session.execute(select(*columns).where(id_column.in_(ids)))).all():
+            current[(entity, data.id)] = dict(data._mapping)
+
+    changes = []
+    for key, row in last.items():
+        data = current.get(key) if row.op != 'deleted' else None
+        changes.append({
+            "version": row.id,
+            "entity": row.entity,
+            "id": row.entity_id,
+            # 对象已被之后（下一页中）的变更删除时按删除返回
+            "op": 'deleted' if data is None else row.op,
+            "data": data
+        })
+    return {"version": version, "resync": False, "has_more": has_more, "changes": changes}
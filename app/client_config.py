@@ -0,0 +1,178 @@
+"""客户端配置渲染缓存
+
+缓存键由 Peer 的版本号、服务端密钥 ID 以及系统设置代数组成，
+任一变化都会使缓存失效，从而避免重复解密私钥和查询系统设置。
+二维码图片按配置指纹（强 ETag）缓存，可选落盘。
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+
+from app.cache import LRUCache, make_etag
+from app.config import (
+    CLIENT_CONFIG_CACHE_SIZE,
+    QR_CACHE_SIZE,
+    QR_CACHE_MAX_BYTES,
+    QR_CACHE_DIR,
+    QR_CACHE_DIR_MAX_FILES,
+)
+from app.settings_service import settings_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RenderedConfig:
+    peer_id: int
+    version: tuple
+    config: str
+    etag: str
+
+    @property
+    def fingerprint(self) -> str:
+        return self.etag.strip('"')
+
+
+config_cache = LRUCache(CLIENT_CONFIG_CACHE_SIZE)
+
+_settings_generation = 0
+_generation_lock = threading.Lock()
+
+
+def settings_generation() -> int:
+    """客户端配置相关设置的代数，相关设置变化后递增
+
+    先经过设置服务的 TTL 刷新：其他 worker 或直接写库的修改在刷新时触发变更通知，
+    缓存命中的请求同样能在刷新间隔内感知。
+    """
+    settings_service.refresh()
+    return _settings_generation
+
+
+def bump_settings_generation() -> int:
+    """相关系统设置发生变化时调用，使所有已渲染配置失效"""
+    global _settings_generation
+    with _generation_lock:
+        _settings_generation += 1
+        return _settings_generation
+
+
+# 客户端配置依赖的系统设置项，仅这些设置变化时才使缓存失效
+CONFIG_SETTING_KEYS = {'global_endpoint'}
+
+
+def _on_settings_changed(changed: set):
+    if changed & CONFIG_SETTING_KEYS:
+        bump_settings_generation()
+
+
+settings_service.subscribe(_on_settings_changed)
+
+
+def cache_version(peer_version: int, server_key_id: int) -> tuple:
+    return (peer_version, server_key_id, settings_generation())
+
+
+def get_cached_config(peer_id: int, version: tuple):
+    """返回与版本号匹配的已渲染配置，否则返回 None"""
+    cached = config_cache.get(peer_id)
+    if cached is not None and cached.version == version:
+        return cached
+    return None
+
+
+def store_config(peer_id: int, version: tuple, config: str) -> RenderedConfig:
+    rendered = RenderedConfig(peer_id=peer_id, version=version, config=config, etag=make_etag(config))
+    config_cache.set(peer_id, rendered)
+    return rendered
+
+
+def invalidate_peer(peer_id: int):
+    config_cache.pop(peer_id)
+
+
+# 二维码图片缓存
+QR_MEDIA_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+qr_cache = LRUCache(QR_CACHE_SIZE, max_bytes=QR_CACHE_MAX_BYTES)
+
+
+def qrcode_etag(rendered: RenderedConfig, fmt: str) -> str:
+    """二维码 ETag 由配置指纹与输出格式决定，无需生成图片即可比较"""
+    return make_etag(f"{rendered.fingerprint}:{fmt}")
+
+
+def make_qrcode(config: str, fmt: str = 'png') -> bytes:
+    """生成二维码图片；SVG 输出不依赖 PIL"""
+    import qrcode
+    buf = BytesIO()
+    if fmt == 'svg':
+        import qrcode.image.svg
+        img = qrcode.make(config, image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buf)
+    else:
+        img = qrcode.make(config)
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_qrcode(rendered: RenderedConfig, fmt: str = 'png') -> bytes:
+    """返回配置对应的二维码图片，依次查找内存缓存、磁盘缓存，最后才重新生成"""
+    if fmt not in QR_MEDIA_TYPES:
+        raise ValueError(f"不支持的二维码格式: {fmt}")
+    key = (rendered.fingerprint, fmt)
+    data = qr_cache.get(key)
+    if data is not None:
+        return data
+    data = _read_disk_qrcode(rendered.fingerprint, fmt)
+    if data is None:
+        data = make_qrcode(rendered.config, fmt)
+        _write_disk_qrcode(rendered.fingerprint, fmt, data)
+    qr_cache.set(key, data)
+    return data
+
+
+def _read_disk_qrcode(fingerprint: str, fmt: str):
+    if not QR_CACHE_DIR:
+        return None
+    try:
+        with open(os.path.join(QR_CACHE_DIR, f"{fingerprint}.{fmt}"), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_disk_qrcode(fingerprint: str, fmt: str, data: bytes):
+    # 图片内含客户端私钥，文件权限限制为 600
+    if not QR_CACHE_DIR:
+        return
+    try:
+        os.makedirs(QR_CACHE_DIR, mode=0o700, exist_ok=True)
+        path = os.path.join(QR_CACHE_DIR, f"{fingerprint}.{fmt}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        _evict_disk_qrcodes()
+    except OSError as e:
+        logger.warning(f"写入二维码磁盘缓存失败: {str(e)}")
+
+
+def _evict_disk_qrcodes():
+    """磁盘缓存超过文件数上限时，按修改时间删除最旧的文件"""
+    entries = [e for e in os.scandir(QR_CACHE_DIR) if e.is_file() and not e.name.endswith('.tmp')]
+    excess = len(entries) - QR_CACHE_DIR_MAX_FILES
+    if excess <= 0:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:excess]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,44 @@
+# 外部命令执行（wg / wg-quick / ip 等），所有调用都带超时
+import asyncio
+import subprocess
+
+from app.config import COMMAND_TIMEOUT
+
+
+def run(args, input: bytes = None, timeout: float = COMMAND_TIMEOUT, check: bool = False) -> subprocess.CompletedProcess:
+    """同步执行命令（供线程池中的同步代码使用），超时抛出 subprocess.TimeoutExpired"""
+    return subprocess.run(args, input=input, capture_output=True, timeout=timeout, check=check)
+
+
+def check_output(args, input: bytes = None, timeout: float = COMMAND_TIMEOUT) -> bytes:
+    return run(args, input=input, timeout=timeout, check=True).stdout
+
+
+async def run_async(args, input: bytes = None, timeout: float = COMMAND_TIMEOUT, check: bool = False) -> subprocess.CompletedProcess:
+    """在事件循环中执行命令，不占用线程池；超时后杀掉子进程并抛出 subprocess.TimeoutExpired"""
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(args, timeout)
+    except asyncio.CancelledError:
+        # 请求被取消（客户端断开）时不留下孤儿进程
+        proc.kill()
+        await proc.wait()
+        raise
+    result = subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
+
+
+async def check_output_async(args, input: bytes = None, timeout: float = COMMAND_TIMEOUT) -> bytes:
+    result = await run_async(args, input=input, timeout=timeout, check=True)
+    return result.stdout
@@ -0,0 +1,118 @@
+"""客户端配置批量导出
+
+以生成器方式流式输出 ZIP：每写入一个文件就把已生成的字节交给响应，
+Peer 分批加载、在线程池中解密渲染，内存占用与 Peer 总数无关。
+"""
+import logging
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.config import EXPORT_WORKERS, EXPORT_BATCH_SIZE
+from app.models import Peer, ServerKey
+
+logger = logging.getLogger(__name__)
+
+
+class _ZipSink:
+    """ZipFile 的只写目标：不支持 seek，zipfile 会改用数据描述符写入"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(files):
+    """把 (文件名, 内容) 序列流式打包为 ZIP，逐块产出字节"""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files:
+            zf.writestr(name, content)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', text or '').strip('_')[:64]
+
+
+def peer_export_query(session, peer_ids=None, remark_prefix=None):
+    """按 ID 列表、备注前缀筛选 Peer；均未指定时导出所有已启用的 Peer"""
+    query = session.query(Peer)
+    if peer_ids:
+        query = query.filter(Peer.id.in_(peer_ids))
+    if remark_prefix:
+        from app.listing import escape_like
+        query = query.filter(Peer.remark.like(f"{escape_like(remark_prefix)}%", escape='\\'))
+    if not peer_ids and not remark_prefix:
+        query = query.filter(Peer.status == True)  # noqa: E712
+    return query
+
+
+def iter_peer_export_files(session_factory, peer_ids=None, remark_prefix=None, include_qr=None):
+    """逐个产出 (文件名, 内容)；Peer 按主键分批加载，每批在线程池中并行解密渲染"""
+    from app.client_config import make_qrcode
+    from app.peer import format_client_config, get_fernet_key_from_db, get_global_endpoint
+
+    session = session_factory()
+    try:
+        server_key = session.query(ServerKey).first()
+        server_public_key = server_key.public_key if server_key else None
+        fernet = Fernet(get_fernet_key_from_db().encode())
+        global_endpoint = get_global_endpoint()
+
+        def render(peer):
+            try:
+                private_key = fernet.decrypt(peer.private_key.encode()).decode()
+            except InvalidToken:
+                # 从备份导入的 Peer 没有私钥，无法生成客户端配置
+                logger.warning(f"跳过无法解密私钥的 Peer: {peer.id}")
+                return []
+            config = format_client_config(peer, private_key, server_public_key, global_endpoint)
+            base = f"peer_{peer.id}"
+            if _safe_name(peer.remark):
+                base += f"_{_safe_name(peer.remark)}"
+            files = [(f"{base}.conf", config)]
+            if include_qr:
+                files.append((f"{base}.{include_qr}", make_qrcode(config, include_qr)))
+            return files
+
+        with ThreadPoolExecutor(max_workers=max(EXPORT_WORKERS, 1)) as executor:
+            last_id = 0
+            while True:
+                batch = (peer_export_query(session, peer_ids, remark_prefix)
+                         .filter(Peer.id > last_id)
+                         .order_by(Peer.id)
+                         .limit(EXPORT_BATCH_SIZE)
+                         .all())
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                # 工作线程只读取已加载的列属性，不访问会话
+                session.expunge_all()
+                for files in executor.map(render, batch):
+                    yield from files
+    finally:
+        session.close()
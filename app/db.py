@@ -0,0 +1,228 @@
+# 数据库连接和会话管理
+import asyncio
+import logging
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import (
+    BATCH_CHUNK_SIZE,
+    DB_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE_KB,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接上设置 SQLite 生产参数：WAL 让读写互不阻塞，NORMAL 同步在 WAL 下仍保证一致性"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def build_engine(db_url: str = DB_URL):
+    """根据 URL 创建引擎：SQLite 启用 WAL 等参数，其他数据库使用连接池"""
+    url = make_url(db_url)
+    if url.get_backend_name() == 'sqlite':
+        if not _is_memory_sqlite(url):
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        )
+        if not _is_memory_sqlite(url):
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+
+# 异步驱动：同步 URL 中的驱动名映射为对应的异步驱动
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def build_async_engine(db_url: str = DB_URL):
+    """创建与同步引擎指向同一数据库的异步引擎，供高频只读接口在事件循环中查询
+
+    数据库没有对应的异步驱动（或驱动未安装）时返回 None，异步接口改用线程池中的同步会话。
+    """
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        logger.warning(f"数据库 {backend} 不支持异步访问，异步接口使用线程池中的同步会话")
+        return None
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    try:
+        if backend == 'sqlite':
+            async_engine = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+            if not _is_memory_sqlite(url):
+                event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+            return async_engine
+        return create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    except ImportError as e:
+        logger.warning(f"未安装异步驱动 {url.drivername}（{e}），异步接口使用线程池中的同步会话")
+        return None
+
+
+class ThreadedSession:
+    """没有异步引擎时的后备会话：提供异步接口用到的 AsyncSession 方法，语句在线程池中执行
+
+    查询结果在工作线程中全部取回，事件循环中遍历结果不会再访问数据库连接。
+    """
+
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def get_bind(self, *args, **kwargs):
+        return self.sync_session.get_bind(*args, **kwargs)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def _execute(self, statement, *args, **kwargs):
+        result = self.sync_session.execute(statement, *args, **kwargs)
+        return result.freeze()() if getattr(result, 'returns_rows', True) else result
+
+    async def execute(self, statement, *args, **kwargs):
+        return await asyncio.to_thread(self._execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await asyncio.to_thread(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await asyncio.to_thread(self.sync_session.get, *args, **kwargs)
+
+    async def flush(self):
+        await asyncio.to_thread(self.sync_session.flush)
+
+    async def commit(self):
+        await asyncio.to_thread(self.sync_session.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self.sync_session.rollback)
+
+    async def close(self):
+        await asyncio.to_thread(self.sync_session.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def threaded_sessionmaker(session_factory):
+    """与 async_sessionmaker 用法相同的后备会话工厂"""
+    def factory(**kwargs):
+        return ThreadedSession(session_factory(**kwargs))
+    return factory
+
+
+class AppSession(Session):
+    """同步与异步会话共用的会话类，会话级事件（如变更记录）注册在此类上，两类会话都生效"""
+
+
+engine = build_engine()
+SessionLocal = sessionmaker(class_=AppSession, autocommit=False, autoflush=False, bind=engine)
+async_engine = build_async_engine()
+
+# 两个引擎上的写入都递增对应表的代数
+from app.generations import track_generations  # noqa: E402
+track_generations(engine)
+if async_engine is not None:
+    track_generations(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, class_=AsyncSession, sync_session_class=AppSession, autoflush=False, expire_on_commit=False
+    )
+else:
+    # 使用 SessionLocal 创建，变更记录等会话事件同样生效
+    AsyncSessionLocal = threaded_sessionmaker(lambda **kwargs: SessionLocal(expire_on_commit=False, **kwargs))
+
+
+def describe_engine(bind=None) -> str:
+    """用于日志输出的连接描述（隐藏密码）"""
+    return (bind or engine).url.render_as_string(hide_password=True)
+
+
+def dialect_insert(session, model):
+    """返回当前数据库方言的 INSERT 构造（支持 ON CONFLICT 的 SQLite/PostgreSQL）
+
+    session 也可以是 Connection。
+    """
+    bind = session.get_bind() if hasattr(session, 'get_bind') else session
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"不支持 upsert 的数据库方言: {dialect}")
+    return insert(model)
+
+
+def chunked(values, size: int = BATCH_CHUNK_SIZE):
+    """去重后按 size 切分 id 列表，供 IN (...) 批量语句使用"""
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_db():
+    """FastAPI 依赖：每个请求一个会话
+
+    同一请求内的认证、处理函数、活动日志与密钥查询共用该会话（依赖结果按请求缓存）。
+    连接按事务从连接池获取，提交后即归还：写接口提交后执行的 WireGuard 同步
+    （最长 WG_QUICK_TIMEOUT 秒）不会占用连接。请求结束时关闭会话。
+    """
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def get_async_db():
+    """FastAPI 依赖：异步接口的请求级会话，与 get_db 一样按请求共用"""
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -0,0 +1,289 @@
+"""实时事件推送（Server-Sent Events）
+
+进程内发布 / 订阅：活动写入、配置同步进度、节点上线 / 离线通过 event_broker.publish 发布
+（任意线程均可调用），序列化一次后分发给所有 GET /events/stream 连接。
+每个连接有独立的有界缓冲：慢客户端缓冲满时丢弃最旧的事件并收到 resync 事件，
+不会阻塞发布方或其他连接。没有事件时连接只在心跳间隔醒来一次；
+节点在线状态取自共享的 WireGuard 状态快照，不单独执行 wg 命令。
+
+事件只在本进程内广播：多 worker 部署时，客户端只收到所连接 worker 上发生的事件。
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import Principal, create_access_token, decode_token, get_current_user_async
+from app.config import (
+    EVENT_BUFFER_SIZE, EVENT_HISTORY_SIZE, EVENT_KEEPALIVE_SECONDS, EVENT_MAX_SUBSCRIBERS, EVENT_TICKET_SECONDS,
+)
+from app.db import get_async_db
+from app.wg_state import wireguard_state
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _frame(event_id, event_type: str, data) -> bytes:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Subscription:
+    """一个连接的事件缓冲；只在所属事件循环中读写"""
+
+    def __init__(self, loop, buffer_size: int):
+        self._loop = loop
+        self._events = deque(maxlen=max(buffer_size, 1))
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.overflowed = False
+
+    def _push(self, event: dict):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+            self.overflowed = True
+        self._events.append(event)
+        self._ready.set()
+
+    def deliver(self, event: dict):
+        """线程安全：把事件交给所属事件循环放入缓冲"""
+        try:
+            self._loop.call_soon_threadsafe(self._push, event)
+        except RuntimeError:
+            # 事件循环已关闭（连接随进程退出）
+            pass
+
+    async def get(self, timeout: float) -> list:
+        """取出缓冲中的全部事件；timeout 秒内没有事件时返回空列表"""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def take_overflow(self) -> bool:
+        overflowed, self.overflowed = self.overflowed, False
+        return overflowed
+
+
+class EventBroker:
+    """进程内事件广播：保留最近 history_size 条事件，供断线重连（Last-Event-ID）补发"""
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, history_size: int = EVENT_HISTORY_SIZE,
+                 max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._history = deque(maxlen=max(history_size, 1))
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data) -> dict:
+        """发布事件（任意线程）；事件只序列化一次，各连接共享同一份字节"""
+        with self._lock:
+            self._last_id += 1
+            event = {'id': self._last_id, 'type': event_type, 'frame': _frame(self._last_id, event_type, data)}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, last_event_id: int = None) -> Subscription:
+        """在事件循环中调用；带 last_event_id 时先放入之后错过的事件，无法补全时标记需要 resync"""
+        subscription = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise HTTPException(status_code=503, detail="实时事件连接数已达上限", headers={"Retry-After": "5"})
+            if last_event_id is not None:
+                oldest = self._history[0]['id'] if self._history else self._last_id + 1
+                # 重连前错过的事件已移出历史，或服务已重启（编号重新开始）
+                if last_event_id < oldest - 1 or last_event_id > self._last_id:
+                    subscription.overflowed = True
+                for event in self._history:
+                    if event['id'] > last_event_id:
+                        subscription._push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self.dropped += subscription.dropped
+
+    def stats(self) -> dict:
+        return {
+            'subscribers': len(self._subscribers),
+            'published': self.published,
+            'last_event_id': self._last_id,
+            'dropped': self.dropped + sum(s.dropped for s in list(self._subscribers))
+        }
+
+
+# 全局事件广播实例
+event_broker = EventBroker()
+
+
+class PresenceWatcher:
+    """比较相邻两次 WireGuard 状态快照，节点上线 / 离线时发布 peer.online / peer.offline
+
+    只在有连接时比较；没有连接时丢弃基线，下次有连接时重新建立（不补发期间的变化）。
+    """
+
+    def __init__(self, broker: EventBroker):
+        self.broker = broker
+        self._online = None
+
+    async def on_snapshot(self, snapshot):
+        if not self.broker.subscriber_count or snapshot.error:
+            self._online = None
+            return
+        from app.sync import WG_INTERFACE
+        await self.apply(snapshot.online_peers(WG_INTERFACE))
+
+    async def apply(self, online: dict) -> list:
+        """与上次结果比较并发布变化，返回发布的事件；第一次调用只建立基线"""
+        previous, self._online = self._online, set(online)
+        if previous is None:
+            return []
+        changes = [(key, True) for key in self._online - previous] + [(key, False) for key in previous - self._online]
+        if not changes:
+            return []
+        peers = await self._lookup([key for key, _ in changes])
+        events = []
+        for key, is_online in changes:
+            peer_id, remark = peers.get(key, (None, None))
+            events.append(self.broker.publish('peer.online' if is_online else 'peer.offline', {
+                'peer_id': peer_id, 'remark': remark, 'public_key': key,
+                'latest_handshake': online.get(key), 'online_count': len(self._online)
+            }))
+        return events
+
+    async def _lookup(self, public_keys: list) -> dict:
+        from app.db import AsyncSessionLocal
+        from app.models import Peer
+        async with AsyncSessionLocal() as session:
+            rows = await session.execute(
+                select(Peer.public_key, Peer.id, Peer.remark).where(Peer.public_key.in_(public_keys))
+            )
+            return {key: (peer_id, remark) for key, peer_id, remark in rows}
+
+
+# 全局节点在线状态监视实例（随 WireGuard 状态快照刷新）
+presence_watcher = PresenceWatcher(event_broker)
+wireguard_state.listeners.append(presence_watcher.on_snapshot)
+
+
+class StreamTickets:
+    """事件流票据
+
+    EventSource 不能设置请求头，而登录令牌放在 URL 中会进入访问日志与浏览器历史。
+    客户端先以正常认证 POST /events/ticket 换取票据：有效期很短、只能用于打开事件流的签名令牌
+    （purpose=events），签名密钥各 worker 共用。已使用的票据 id 在本进程内记录到过期，同一票据只能打开一次连接。
+    """
+
+    PURPOSE = 'events'
+
+    def __init__(self, ttl: int = EVENT_TICKET_SECONDS):
+        self.ttl = ttl
+        self._used = {}
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.redeemed = 0
+
+    def issue(self, principal: Principal) -> str:
+        claims = {
+            'sub': principal.username, 'uid': principal.id, 'tv': principal.token_version,
+            'purpose': self.PURPOSE, 'jti': secrets.token_urlsafe(16)
+        }
+        if principal.scopes is not None:
+            claims['scopes'] = list(principal.scopes)
+        self.issued += 1
+        return create_access_token(claims, timedelta(seconds=self.ttl))
+
+    def redeem(self, ticket: str) -> Principal:
+        claims = decode_token(ticket, purpose=self.PURPOSE)
+        now = time.monotonic()
+        with self._lock:
+            # 过期的票据签名校验即失败，无需继续记录
+            self._used = {jti: expires for jti, expires in self._used.items() if expires > now}
+            if claims.get('jti') in self._used:
+                raise HTTPException(status_code=401, detail="事件流票据已使用")
+            self._used[claims['jti']] = now + self.ttl
+        self.redeemed += 1
+        scopes = claims.get('scopes')
+        return Principal(id=claims['uid'], username=claims['sub'], token_version=claims['tv'],
+                         scopes=tuple(scopes) if scopes is not None else None)
+
+
+# 全局事件流票据实例
+stream_tickets = StreamTickets()
+
+
+async def stream_user(request: Request, ticket: str = None, authorization: str = Header(None),
+                      session: AsyncSession = Depends(get_async_db)):
+    """除 Authorization 外只接受一次性票据（?ticket=），不接受查询参数中的登录令牌"""
+    if authorization and authorization.lower().startswith('bearer '):
+        return await get_current_user_async(authorization[7:], session, request)
+    if not ticket:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return stream_tickets.redeem(ticket)
+
+
+async def _stream(subscription: Subscription, keepalive: float):
+    try:
+        # 断线后浏览器 3 秒重连，并带上 Last-Event-ID
+        yield b'retry: 3000\n\n'
+        while True:
+            events = await subscription.get(keepalive)
+            if subscription.take_overflow():
+                yield _frame(None, 'resync', {'dropped': subscription.dropped})
+            if events:
+                yield b''.join(event['frame'] for event in events)
+            else:
+                yield b': keepalive\n\n'
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@router.post('/events/ticket')
+async def event_ticket(current_user: Principal = Depends(get_current_user_async)):
+    """换取打开事件流的一次性票据（EventSource 以 ?ticket= 传递）"""
+    return {"ticket": stream_tickets.issue(current_user), "expires_in": stream_tickets.ttl}
+
+
+@router.get('/events/stream')
+async def event_stream(last_event_id: int = Header(None), current_user=Depends(stream_user)):
+    """实时事件流（text/event-stream）
+
+    事件类型：activity（活动写入后）、sync（配置同步进度）、peer.online / peer.offline、
+    resync（错过了事件，客户端应重新加载列表与统计）。
+    """
+    subscription = event_broker.subscribe(last_event_id)
+    return StreamingResponse(
+        _stream(subscription, EVENT_KEEPALIVE_SECONDS), media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
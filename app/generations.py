@@ -0,0 +1,136 @@
+"""表代数（generation）：列表接口的弱 ETag
+
+peers / acls / activities / app_secrets 的每条 INSERT/UPDATE/DELETE 都在同一事务中递增
+table_generations 表中对应的代数，数据库即多 worker 共享的存储。
+本进程提交后直接写入本地缓存；其他 worker 的写入在缓存过期（GENERATION_CACHE_SECONDS）
+后重新读取。缓存有效时 If-None-Match 命中直接返回 304，不查询数据库。
+"""
+import threading
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import event, select
+from sqlalchemy.sql.dml import UpdateBase
+
+from app.cache import etag_matches, make_etag
+from app.config import GENERATION_CACHE_SECONDS
+from app.models import TableGeneration
+
+# 需要维护代数的表（app_secrets 供 KeyManager 发现其他 worker 的密钥轮换）
+TRACKED_TABLES = frozenset({'peers', 'acls', 'activities', 'app_secrets'})
+
+_PENDING_KEY = 'pending_generations'
+
+
+class GenerationStore:
+    """表代数的进程内缓存"""
+
+    def __init__(self, ttl: float = GENERATION_CACHE_SECONDS):
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def cached(self, tables) -> dict:
+        """缓存全部有效时返回 {表名: 代数}，否则返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for table in tables:
+                entry = self._values.get(table)
+                if entry is None or now - entry[1] > self.ttl:
+                    return None
+                result[table] = entry[0]
+            return result
+
+    def store(self, values: dict):
+        """写入缓存；代数只增不减，避免较旧的读取覆盖本进程刚提交的值"""
+        now = time.monotonic()
+        with self._lock:
+            for table, generation in values.items():
+                entry = self._values.get(table)
+                if entry is not None and entry[0] > generation:
+                    generation = entry[0]
+                self._values[table] = (generation, now)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _query(self, tables):
+        return select(TableGeneration.name, TableGeneration.generation).where(TableGeneration.name.in_(tables))
+
+    def _result(self, tables, rows) -> dict:
+        values = {table: 0 for table in tables}
+        values.update({name: generation for name, generation in rows})
+        self.store(values)
+        return self.cached(tables) or values
+
+    def get(self, session, tables) -> dict:
+        values = self.cached(tables)
+        if values is None:
+            values = self._result(tables, session.execute(self._query(tables)).all())
+        return values
+
+    async def get_async(self, session, tables) -> dict:
+        values = self.cached(tables)
+        if values is None:
+            values = self._result(tables, (await session.execute(self._query(tables))).all())
+        return values
+
+
+# 全局表代数缓存实例
+generation_store = GenerationStore()
+
+
+def _after_execute(conn, clauseelement, multiparams, params, execution_options, result):
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    table = clauseelement.table.name
+    if table not in TRACKED_TABLES:
+        return
+    if not clauseelement.is_insert and result.rowcount == 0:
+        return
+    from app.db import dialect_insert
+    stmt = dialect_insert(conn, TableGeneration).values(name=table, generation=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TableGeneration.name],
+        set_={'generation': TableGeneration.generation + 1}
+    ).returning(TableGeneration.generation)
+    generation = conn.execute(stmt).scalar()
+    conn.info.setdefault(_PENDING_KEY, {})[table] = generation
+
+
+def _after_commit(conn):
+    pending = conn.info.pop(_PENDING_KEY, None)
+    if pending:
+        generation_store.store(pending)
+
+
+def _after_rollback(conn):
+    conn.info.pop(_PENDING_KEY, None)
+
+
+def track_generations(engine):
+    """在引擎上注册写入监听：受跟踪表的写入在同一事务中递增代数"""
+    event.listen(engine, 'after_execute', _after_execute)
+    event.listen(engine, 'commit', _after_commit)
+    event.listen(engine, 'rollback', _after_rollback)
+
+
+def list_etag(request: Request, generations: dict) -> str:
+    """列表响应的弱 ETag：由相关表的代数与查询参数决定"""
+    state = ','.join(f"{table}:{generations[table]}" for table in sorted(generations))
+    return make_etag(f"{state}?{request.url.query}", weak=True)
+
+
+async def conditional_list(request: Request, response: Response, session, *tables):
+    """列表接口的条件请求：If-None-Match 命中时返回 304 响应，否则设置 ETag 并返回 None
+
+    代数在查询数据之前读取，查询期间发生的写入只会让 ETag 偏旧，下次轮询即可取到新数据。
+    """
+    etag = list_etag(request, await generation_store.get_async(session, tables))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,49 +1,100 @@
 # 密钥管理配置
 import os
 import secrets
+import threading
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
+from sqlalchemy import update
 from app.models import AppSecret
 
+# 生成或轮换密钥后重新读取的最多次数
+KEY_REFRESH_ATTEMPTS = 5
+
 
 class KeyManager:
-    """JWT密钥管理器"""
+    """JWT密钥管理器
+
+    当前与前一个密钥缓存在内存中，轮换截止时间在加载时计算一次。
+    只有到达截止时间，或 app_secrets 表代数变化（其他 worker 已轮换）时才重新读取数据库；
+    代数检查走 generation_store 的本地缓存，不是每次都查询。
+    """
 
-    def __init__(self):
+    def __init__(self, session_factory=None):
         self.key_rotation_days = int(os.environ.get('JWT_KEY_ROTATION_DAYS', '30'))
         self.current_key_name = 'JWT_SECRET_KEY'
         self.previous_key_name = 'JWT_PREVIOUS_KEY'
         self.key_timestamp_name = 'JWT_KEY_TIMESTAMP'
-
-    def get_current_key(self) -> str:
-        """获取当前有效的JWT密钥"""
+        self._session_factory = session_factory
+        self._current = None
+        self._previous = None
+        self._deadline = None
+        self._generation = None
+        self._lock = threading.RLock()
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
         from app.main import SessionLocal
-        session = SessionLocal()
+        return SessionLocal()
 
-        try:
-            # 获取当前密钥
-            current_key_record = session.query(AppSecret).filter_by(
-                name=self.current_key_name
-            ).first()
+    def _is_fresh(self) -> bool:
+        if self._current is None or datetime.utcnow() >= self._deadline:
+            return False
+        from app.generations import generation_store
+        cached = generation_store.cached(['app_secrets'])
+        return cached is not None and cached['app_secrets'] == self._generation
 
-            if not current_key_record:
+    def get_current_key(self) -> str:
+        """获取当前有效的JWT密钥"""
+        return self.get_keys()[0]
+
+    def get_keys(self) -> tuple:
+        """返回 (当前密钥, 前一个密钥)；前一个密钥可能为 None"""
+        if self._is_fresh():
+            return self._current, self._previous
+        with self._lock:
+            if self._is_fresh():
+                return self._current, self._previous
+            session = self._session()
+            try:
+                self._refresh(session)
+            finally:
+                session.close()
+            return self._current, self._previous
+
+    def _refresh(self, session):
+        from app.generations import generation_store
+        # 生成或轮换密钥后重新读取；有限次数后仍读不到有效密钥时报错，而不是无限重试
+        for _ in range(KEY_REFRESH_ATTEMPTS):
+            # 先读代数再读密钥：两者之间发生的轮换会使代数在下次检查时不一致，从而再次加载
+            generation = generation_store.get(session, ['app_secrets'])['app_secrets']
+            if self._current is not None and generation == self._generation and datetime.utcnow() < self._deadline:
+                return
+            records = {
+                record.name: record.value
+                for record in session.query(AppSecret).filter(AppSecret.name.in_(
+                    [self.current_key_name, self.previous_key_name, self.key_timestamp_name]
+                ))
+            }
+            current = records.get(self.current_key_name)
+            timestamp = records.get(self.key_timestamp_name)
+            if not current:
                 # 如果没有密钥，生成新密钥
-                return self._generate_new_key(session)
-
-            # 检查是否需要轮换
-            timestamp_record = session.query(AppSecret).filter_by(
-                name=self.key_timestamp_name
-            ).first()
-
-            if timestamp_record:
-                key_age = datetime.utcnow() - datetime.fromisoformat(timestamp_record.value)
-                if key_age.days >= self.key_rotation_days:
-                    return self._rotate_key(session, current_key_record.value)
-
-            return current_key_record.value
-
-        finally:
-            session.close()
+                self._generate_new_key(session)
+                continue
+            if timestamp:
+                deadline = datetime.fromisoformat(timestamp) + timedelta(days=self.key_rotation_days)
+                if datetime.utcnow() >= deadline:
+                    self._rotate_key(session, current, timestamp)
+                    continue
+            else:
+                deadline = datetime.max
+            self._current = current
+            self._previous = records.get(self.previous_key_name)
+            self._deadline = deadline
+            self._generation = generation
+            return
+        raise RuntimeError(f"无法加载 JWT 密钥：生成或轮换 {KEY_REFRESH_ATTEMPTS} 次后仍未读取到有效密钥")
 
     def _generate_new_key(self, session) -> str:
         """生成新密钥"""
@@ -63,13 +114,31 @@ class KeyManager:
         )
         session.add(timestamp_record)
 
-        session.commit()
+        try:
+            session.commit()
+        except Exception:
+            # 其他 worker 同时生成了密钥（name 唯一），使用对方的密钥
+            session.rollback()
         return new_key
 
-    def _rotate_key(self, session, old_key: str) -> str:
-        """轮换密钥"""
+    def _rotate_key(self, session, old_key: str, old_timestamp: str) -> str:
+        """轮换密钥
+
+        以时间戳做比较并交换：其他 worker 已完成本轮轮换时放弃，避免覆盖对方刚生成的密钥。
+        """
         new_key = secrets.token_urlsafe(32)
 
+        # 更新时间戳
+        claimed = session.execute(
+            update(AppSecret)
+            .where(AppSecret.name == self.key_timestamp_name, AppSecret.value == old_timestamp)
+            .values(value=datetime.utcnow().isoformat()),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if not claimed:
+            session.rollback()
+            return None
+
         # 将当前密钥移到previous
         previous_record = session.query(AppSecret).filter_by(
             name=self.previous_key_name
@@ -90,48 +159,36 @@ class KeyManager:
         ).first()
         current_record.value = new_key
 
-        # 更新时间戳
-        timestamp_record = session.query(AppSecret).filter_by(
-            name=self.key_timestamp_name
-        ).first()
-        timestamp_record.value = datetime.utcnow().isoformat()
-
         session.commit()
         return new_key
 
-    def validate_token_with_previous(self, token: str) -> tuple[bool, str]:
-        """使用当前和前一个密钥验证token"""
+    def decode(self, token: str, algorithms=("HS256",)) -> dict:
+        """依次使用当前和前一个密钥验证token，均失败时抛出 JWTError"""
         from jose import jwt, JWTError
 
-        current_key = self.get_current_key()
-
-        # 先尝试当前密钥
+        current_key, previous_key = self.get_keys()
         try:
-            payload = jwt.decode(token, current_key, algorithms=["HS256"])
-            return True, payload.get("sub")
+            return jwt.decode(token, current_key, algorithms=list(algorithms))
         except JWTError:
-            pass
+            # 尝试前一个密钥（用于过渡期）
+            if not previous_key:
+                raise
+        return jwt.decode(token, previous_key, algorithms=list(algorithms))
 
-        # 尝试前一个密钥（用于过渡期）
-        from app.main import SessionLocal
-        session = SessionLocal()
+    def validate_token_with_previous(self, token: str) -> tuple[bool, str]:
+        """使用当前和前一个密钥验证token"""
+        from jose import JWTError
 
         try:
-            previous_record = session.query(AppSecret).filter_by(
-                name=self.previous_key_name
-            ).first()
-
-            if previous_record:
-                try:
-                    payload = jwt.decode(token, previous_record.value, algorithms=["HS256"])
-                    return True, payload.get("sub")
-                except JWTError:
-                    pass
-        finally:
-            session.close()
+            return True, self.decode(token).get("sub")
+        except JWTError:
+            return False, None
 
-        return False, None
+    def invalidate(self):
+        """丢弃内存中的密钥，下次使用时重新加载"""
+        with self._lock:
+            self._current = None
 
 
 # 全局密钥管理器实例
-key_manager = KeyManager()
\ No newline at end of file
+key_manager = KeyManager()
@@ -0,0 +1,135 @@
+"""列表接口的游标分页、过滤与字段投影
+
+游标为 (排序值, id) 的 base64 编码，按 (排序列, id) 做 keyset 翻页，
+与偏移量无关，翻到任意一页的代价都相同。只查询投影所需的列。
+"""
+import base64
+import ipaddress
+import json
+from datetime import datetime
+from functools import lru_cache
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select
+
+from app.config import LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE
+
+
+def escape_like(value: str) -> str:
+    """转义 LIKE 通配符，配合 escape='\\' 使用"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def parse_fields(fields: str, allowed) -> list:
+    """解析 fields=a,b,c；为空时返回全部允许的字段"""
+    if not fields:
+        return list(allowed)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(unknown)}")
+    return names
+
+
+def parse_sort(sort: str, sortable) -> tuple:
+    """解析 sort=name 或 sort=-name（降序），默认按 id 升序"""
+    if not sort:
+        return 'id', False
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in sortable:
+        raise HTTPException(status_code=400, detail=f"不支持的排序字段: {name}")
+    return name, descending
+
+
+def page_limit(limit) -> int:
+    if limit is None:
+        return LIST_PAGE_SIZE
+    if limit < 1 or limit > LIST_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit 必须在 1 到 {LIST_MAX_PAGE_SIZE} 之间")
+    return limit
+
+
+def encode_cursor(sort: str, descending: bool, value, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, descending, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool, sort_expr) -> tuple:
+    """返回 (排序值, id)；游标与当前排序不一致或格式错误时返回 400"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_desc, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if value is not None and sort_expr.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor 无效")
+    if cursor_sort != sort or cursor_desc != descending:
+        raise HTTPException(status_code=400, detail="cursor 与当前排序不一致")
+    return value, last_id
+
+
+@lru_cache(maxsize=65536)
+def parse_network(value: str):
+    """解析 IP/CIDR（带缓存），无法解析时返回 None"""
+    try:
+        return ipaddress.ip_network(value.strip(), strict=False)
+    except (ValueError, AttributeError):
+        return None
+
+
+def network_contains(outer, inner) -> bool:
+    return outer is not None and inner is not None and outer.version == inner.version and inner.subnet_of(outer)
+
+
+async def keyset_page(session, id_column, columns: dict, selected: list, filters: list,
+                      sort_expr, sort: str, descending: bool, cursor: str, limit: int,
+                      row_filter=None, extra_columns: dict = None):
+    """按 (排序列, id) 查询一页，返回 (记录列表, 下一页游标)
+
+    columns 为 字段名 -> 列表达式；只查询 selected 中的列。
+    row_filter 用于无法在 SQL 中表达的条件（如 CIDR 包含），按批继续读取直到凑满一页；
+    它需要而投影中没有的列通过 extra_columns 额外查询。
+    """
+    stmt = select(
+        id_column.label('_id'),
+        sort_expr.label('_sort'),
+        *[column.label(name) for name, column in (extra_columns or {}).items()],
+        *[columns[name].label(name) for name in selected]
+    ).where(*filters)
+    if descending:
+        stmt = stmt.order_by(sort_expr.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(sort_expr.asc(), id_column.asc())
+
+    position = decode_cursor(cursor, sort, descending, sort_expr) if cursor else None
+    batch_size = limit + 1 if row_filter is None else max(limit * 4, 256)
+    items = []
+    while True:
+        batch_stmt = stmt
+        if position is not None:
+            value, last_id = position
+            if sort_expr is id_column:
+                # 按 id 排序时只需单列范围条件，复合索引 (过滤列, id) 可直接定位
+                batch_stmt = batch_stmt.where(id_column < last_id if descending else id_column > last_id)
+            elif descending:
+                batch_stmt = batch_stmt.where(or_(sort_expr < value, and_(sort_expr == value, id_column < last_id)))
+            else:
+                batch_stmt = batch_stmt.where(or_(sort_expr > value, and_(sort_expr == value, id_column > last_id)))
+        rows = (await session.execute(batch_stmt.limit(batch_size))).all()
+        for row in rows:
+            if row_filter is None or row_filter(row):
+                items.append(row)
+                if len(items) > limit:
+                    break
+        if len(items) > limit or len(rows) < batch_size:
+            break
+        position = (rows[-1]._sort, rows[-1]._id)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(sort, descending, items[-1]._sort, items[-1]._id)
+    return [{name: getattr(row, name) for name in selected} for row in items], next_cursor
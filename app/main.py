@@ -1,9 +1,9 @@
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from app.db import engine, SessionLocal, describe_engine
 from app.models import Base, User, AppSecret
+from app.migrations import run_migrations
 from app.peer import router as peer_router
 from app.acl import router as acl_router
 from app.auth import router as auth_router
@@ -14,19 +14,15 @@ from cryptography.fernet import Fernet
 from app.sync import sync_acl_and_wireguard
 from app.system_status import router as system_status_router
 from app.activity import router as activity_router
+from app.changes import router as changes_router
+from app.events import router as events_router
 from app.system_settings import router as system_settings_router
 app = FastAPI()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
-# SQLite 数据库路径 - 移动到 data 文件夹
-DB_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
-os.makedirs(DB_DIR, exist_ok=True)  # 确保 data 目录存在
-DB_PATH = os.path.join(DB_DIR, 'wireguard_acl.db')
-DB_URL = f'sqlite:///{DB_PATH}'
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 数据库引擎与会话工厂由 app.db 根据 WG_DB_URL 创建（默认 data 目录下的 SQLite）
 
 # 从数据库获取或生成 FERNET_KEY
 def get_fernet_key_from_db():
@@ -39,10 +35,10 @@ def get_fernet_key_from_db():
         session.commit()
     session.close()
 
-# 启动时自动建表
+# 启动时自动建表并执行版本化迁移
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    logger.info(f"数据库初始化完成，路径: {DB_PATH}")
+    run_migrations(engine)
+    logger.info(f"数据库初始化完成: {describe_engine(engine)}")
     # 自动生成并持久化FERNET_KEY
     get_fernet_key_from_db()
 
@@ -70,6 +66,47 @@ def sync_wg_on_startup():
     logger.info("启动时自动同步 WireGuard 配置...")
     sync_acl_and_wireguard()
 
+# 启动活动日志保留清理（后台线程）
+@app.on_event("startup")
+def start_activity_retention():
+    from app.retention import activity_retention
+    activity_retention.start()
+
+# 启动系统资源采样（后台线程），采样写入性能历史
+@app.on_event("startup")
+def start_metrics_sampler():
+    from app.metrics import metrics_sampler
+    from app.timeseries import performance_history
+    performance_history.open()
+    if performance_history.record not in metrics_sampler.listeners:
+        metrics_sampler.listeners.append(performance_history.record)
+    metrics_sampler.start()
+
+# 启动 WireGuard 状态轮询（事件循环中的后台任务），各状态接口共用快照
+@app.on_event("startup")
+async def start_wireguard_state():
+    from app.wg_state import wireguard_state
+    wireguard_state.start()
+
+@app.on_event("shutdown")
+async def stop_wireguard_state():
+    from app.wg_state import wireguard_state
+    await wireguard_state.stop()
+
+# 退出前写完活动日志队列，并写回尚未落库的 API 令牌最后使用时间
+@app.on_event("shutdown")
+def flush_on_shutdown():
+    from app.activity import activity_writer
+    from app.api_tokens import api_token_usage
+    from app.metrics import metrics_sampler
+    from app.retention import activity_retention
+    from app.timeseries import performance_history
+    metrics_sampler.stop()
+    performance_history.close()
+    activity_retention.stop()
+    activity_writer.stop()
+    api_token_usage.flush()
+
 @app.get("/health")
 def health_check():
     """健康检查接口"""
@@ -81,5 +118,7 @@ app.include_router(acl_router, prefix="")
 app.include_router(auth_router, prefix="")
 app.include_router(system_status_router, prefix="")
 app.include_router(activity_router, prefix="")
+app.include_router(changes_router, prefix="")
+app.include_router(events_router, prefix="")
 app.include_router(backup_router, prefix="")
 app.include_router(system_settings_router, prefix="")
@@ -0,0 +1,135 @@
+"""系统资源后台采样
+
+后台线程按固定间隔采集 CPU、内存、磁盘与各网卡（含 WireGuard 接口）计数器，
+按相邻两次采样计算速率后放入环形缓冲。/system/stats 直接返回最新一次采样，
+请求中不再等待采样间隔。每个 worker 进程各自采样，单次采样只读取 /proc 等计数器。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import psutil
+
+from app.config import METRICS_BUFFER_SIZE, METRICS_SAMPLE_INTERVAL, METRICS_DISK_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def _rate(current: int, previous: int, elapsed: float) -> float:
+    delta = current - previous
+    # 计数器回绕或接口重建（wg-quick down/up）后从 0 开始计数
+    if delta < 0:
+        delta = current
+    return round(delta / elapsed, 1) if elapsed > 0 else 0.0
+
+
+class MetricsSampler:
+    """系统资源采样器：后台线程采样，最近 buffer_size 次采样保存在内存环形缓冲中"""
+
+    def __init__(self, interval: float = METRICS_SAMPLE_INTERVAL, buffer_size: int = METRICS_BUFFER_SIZE,
+                 disk_path: str = METRICS_DISK_PATH):
+        self.interval = interval
+        self.disk_path = disk_path
+        self._samples = deque(maxlen=max(buffer_size, 1))
+        self._previous = None  # (monotonic 时间, 总计数器, 各网卡计数器)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.listeners = []  # 每次采样后调用 listener(sample)，如性能历史（第一次采样除外）
+        self.sample_ms = 0.0  # 最近一次采样耗时
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"采集系统资源失败: {e}")
+            self._stop.wait(self.interval)
+
+    def sample(self) -> dict:
+        """采集一次并放入缓冲；第一次采样没有上次计数器，速率与 CPU 为 0"""
+        started = time.perf_counter()
+        now = time.monotonic()
+        cpu_percent = psutil.cpu_percent(interval=None)
+        mem = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        net = psutil.net_io_counters()
+        nics = psutil.net_io_counters(pernic=True)
+        with self._lock:
+            previous, self._previous = self._previous, (now, net, nics)
+            if previous is None:
+                cpu_percent = 0.0
+                elapsed, previous_net, previous_nics = 0, net, nics
+            else:
+                previous_time, previous_net, previous_nics = previous
+                elapsed = now - previous_time
+            interfaces = {}
+            for name, counters in nics.items():
+                before = previous_nics.get(name, counters)
+                interfaces[name] = {
+                    'bytes_sent': counters.bytes_sent,
+                    'bytes_recv': counters.bytes_recv,
+                    'bytes_sent_per_s': _rate(counters.bytes_sent, before.bytes_sent, elapsed),
+                    'bytes_recv_per_s': _rate(counters.bytes_recv, before.bytes_recv, elapsed)
+                }
+            sample = {
+                'timestamp': datetime.utcnow().isoformat(),
+                'cpu_percent': cpu_percent,
+                'memory': {'total': mem.total, 'used': mem.used, 'percent': mem.percent},
+                'disk': {'total': disk.total, 'used': disk.used, 'percent': disk.percent},
+                'network': {
+                    'bytes_sent_per_s': _rate(net.bytes_sent, previous_net.bytes_sent, elapsed),
+                    'bytes_recv_per_s': _rate(net.bytes_recv, previous_net.bytes_recv, elapsed)
+                },
+                'interfaces': interfaces
+            }
+            self._samples.append(sample)
+        self.sample_ms = (time.perf_counter() - started) * 1000
+        if previous is None:
+            # 第一次采样没有速率，不交给 listener（避免历史中出现一个 0 值点）
+            return sample
+        for listener in self.listeners:
+            try:
+                listener(sample)
+            except Exception as e:
+                logger.warning(f"处理系统资源采样失败: {e}")
+        return sample
+
+    def latest(self) -> dict:
+        """最新一次采样；后台线程尚未采样时（如未启动）当场采样一次，不等待间隔"""
+        with self._lock:
+            if self._samples:
+                return self._samples[-1]
+        return self.sample()
+
+    def samples(self) -> list:
+        with self._lock:
+            return list(self._samples)
+
+    def stats(self) -> dict:
+        return {
+            'interval_seconds': self.interval,
+            'buffered': len(self._samples),
+            'buffer_size': self._samples.maxlen,
+            'sample_ms': round(self.sample_ms, 2),
+            'running': self._thread is not None and self._thread.is_alive()
+        }
+
+
+# 全局系统资源采样器实例
+metrics_sampler = MetricsSampler()
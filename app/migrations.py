@@ -0,0 +1,338 @@
+"""版本化数据库迁移
+
+schema_version 表记录当前结构版本，启动时依次执行尚未应用的迁移。
+- 已是最新版本：只执行一条版本查询，不做任何结构探测
+- 全新数据库：直接按模型建表并记为最新版本
+- 无版本记录的旧数据库：先执行基线迁移（替代原 scripts/migration 下的 sqlite3 脚本），
+  把各历史结构统一到版本 0，再依次执行后续迁移
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import MetaData, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable
+
+from app.config import MIGRATION_BATCH_SIZE
+from app.models import Base, ACL, Peer, Activity, TableGeneration, ChangeLog, ApiToken, ActivityRollup, create_activity_fts
+
+logger = logging.getLogger(__name__)
+
+
+def _column_names(conn, table: str) -> set:
+    return {col['name'] for col in inspect(conn).get_columns(table)}
+
+
+def _create_indexes(conn, table):
+    # SQLite 的 inspector 不返回表达式索引，这里统一使用 CREATE INDEX IF NOT EXISTS 语义
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _column_default(column):
+    """旧表缺失字段时的填充值：取模型中的标量默认值，否则为 NULL"""
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    if column.server_default is not None:
+        return str(column.server_default.arg)
+    return None
+
+
+def _needs_rebuild(conn, table) -> bool:
+    """SQLite 无法 ALTER 的差异（多余字段、可空性、主键）需要重建表"""
+    existing = {col['name']: col for col in inspect(conn).get_columns(table.name)}
+    if set(existing) - set(table.columns.keys()):
+        return True
+    for column in table.columns:
+        old = existing.get(column.name)
+        if old is None:
+            continue
+        if column.primary_key != bool(old.get('primary_key')):
+            return True
+        if column.nullable and not old['nullable']:
+            return True
+    return False
+
+
+def _add_missing_columns(conn, table):
+    existing = _column_names(conn, table.name)
+    preparer = conn.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        default = _column_default(column)
+        if default is None and not column.nullable:
+            raise RuntimeError(f"无法为 {table.name}.{column.name} 补充字段：缺少默认值")
+        ddl = (
+            f"ALTER TABLE {preparer.quote(table.name)} "
+            f"ADD COLUMN {preparer.quote(column.name)} {column.type.compile(conn.dialect)}"
+        )
+        if default is not None:
+            if not column.nullable:
+                ddl += " NOT NULL"
+            ddl += f" DEFAULT {_sql_literal(default)}"
+        conn.execute(text(ddl))
+        logger.info(f"迁移: {table.name} 表增加字段 {column.name}")
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def rebuild_table(conn, table, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """按模型重建 SQLite 表：新建表 → 按 rowid 分批复制 → 删除旧表 → 改名
+
+    旧表缺失的字段使用模型默认值填充，多余的字段被丢弃；索引由后续迁移统一创建。
+    返回复制的行数。
+    """
+    preparer = conn.dialect.identifier_preparer
+    new_name = f"{table.name}__new"
+    # 复制到独立的 MetaData，外键引用的表也一并复制，以便生成 CREATE TABLE
+    scratch = MetaData()
+    for model_table in Base.metadata.sorted_tables:
+        model_table.to_metadata(scratch)
+    new_table = table.to_metadata(scratch, name=new_name)
+    conn.execute(text(f"DROP TABLE IF EXISTS {preparer.quote(new_name)}"))
+    conn.execute(CreateTable(new_table))
+
+    existing = _column_names(conn, table.name)
+    targets, sources, params = [], [], {}
+    for column in table.columns:
+        targets.append(preparer.quote(column.name))
+        if column.name == 'id' and column.name in existing:
+            # 历史迁移脚本曾把 id 建为普通可空字段，新插入的行 id 为空，此时 rowid 即应用看到的 id
+            sources.append("COALESCE(id, rowid)")
+        elif column.name in existing:
+            sources.append(preparer.quote(column.name))
+        else:
+            params[f"d_{column.name}"] = _column_default(column)
+            sources.append(f":d_{column.name}")
+
+    copy_sql = text(
+        f"INSERT INTO {preparer.quote(new_name)} ({', '.join(targets)}) "
+        f"SELECT {', '.join(sources)} FROM {preparer.quote(table.name)} "
+        f"WHERE rowid > :last ORDER BY rowid LIMIT :batch"
+    )
+    last_sql = text(
+        f"SELECT MAX(rowid) FROM (SELECT rowid FROM {preparer.quote(table.name)} "
+        f"WHERE rowid > :last ORDER BY rowid LIMIT :batch)"
+    )
+    copied, last = 0, 0
+    while True:
+        batch_last = conn.execute(last_sql, {"last": last, "batch": batch_size}).scalar()
+        if batch_last is None:
+            break
+        copied += conn.execute(copy_sql, {**params, "last": last, "batch": batch_size}).rowcount
+        last = batch_last
+
+    conn.execute(text(f"DROP TABLE {preparer.quote(table.name)}"))
+    conn.execute(text(f"ALTER TABLE {preparer.quote(new_name)} RENAME TO {preparer.quote(table.name)}"))
+    logger.info(f"迁移: 重建 {table.name} 表，复制 {copied} 行")
+    return copied
+
+
+def migration_baseline(conn):
+    """旧数据库基线：补充 client_allowed_ips/direction 等字段、移除 endpoint、peer_id 改为可空"""
+    for table in Base.metadata.sorted_tables:
+        if not inspect(conn).has_table(table.name):
+            continue
+        if conn.dialect.name == 'sqlite' and _needs_rebuild(conn, table):
+            rebuild_table(conn, table)
+        else:
+            _add_missing_columns(conn, table)
+
+
+def migration_0001_peer_version(conn):
+    """peers 表增加 version 字段（客户端配置缓存失效）"""
+    if 'version' not in _column_names(conn, 'peers'):
+        conn.execute(text("ALTER TABLE peers ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _normalize_global_acls(conn) -> int:
+    updated = conn.execute(text("UPDATE acls SET peer_id = NULL WHERE peer_id = -1")).rowcount
+    if updated:
+        logger.info(f"迁移: {updated} 条全局 ACL 规则的 peer_id 由 -1 改为 NULL")
+    return updated
+
+
+def migration_0002_query_indexes(conn):
+    """为热点查询建立索引，并以唯一索引约束 ACL 规则标识"""
+    # 旧版 /acls/create 以 peer_id=-1 表示全局规则，统一为 NULL 后再去重
+    _normalize_global_acls(conn)
+    # 建唯一索引前清理重复规则，保留每组中最新的一条
+    identity = ", ".join([
+        "rule_type",
+        "COALESCE(peer_id, -1)",
+        "target",
+        "COALESCE(destination, '')",
+        "COALESCE(source_interface, '')",
+        "COALESCE(destination_interface, '')",
+        "port",
+        "protocol",
+        "direction",
+    ])
+    removed = conn.execute(text(
+        f"DELETE FROM acls WHERE id NOT IN (SELECT MAX(id) FROM acls GROUP BY {identity})"
+    )).rowcount
+    if removed:
+        logger.info(f"迁移: 删除 {removed} 条重复的 ACL 规则")
+    for model in (Peer, ACL, Activity):
+        _create_indexes(conn, model.__table__)
+
+
+def migration_0003_table_generations(conn):
+    """新增 table_generations 表（列表接口 ETag）"""
+    TableGeneration.__table__.create(conn, checkfirst=True)
+
+
+def migration_0004_change_log(conn):
+    """新增 change_log 表（增量同步）"""
+    ChangeLog.__table__.create(conn, checkfirst=True)
+
+
+def migration_0005_user_token_version(conn):
+    """users 表增加 token_version 字段（令牌失效）"""
+    if 'token_version' not in _column_names(conn, 'users'):
+        conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 1"))
+
+
+def migration_0006_api_tokens(conn):
+    """新增 api_tokens 表（自动化脚本使用的 API 令牌）"""
+    ApiToken.__table__.create(conn, checkfirst=True)
+
+
+def migration_0007_activity_rollups(conn):
+    """新增 activity_rollups 表并按已有活动回填小时 / 按天计数"""
+    from app.activity import record_rollups, rollup_counts
+    ActivityRollup.__table__.create(conn, checkfirst=True)
+    if conn.execute(select(func.count()).select_from(ActivityRollup)).scalar():
+        return
+    # 流式读取 (type, created_at) 在内存中聚合，内存占用只与时段数有关
+    result = conn.execution_options(yield_per=MIGRATION_BATCH_SIZE).execute(
+        select(Activity.type, Activity.created_at).where(Activity.created_at.is_not(None))
+    )
+    counts = rollup_counts(result)
+    record_rollups(conn, counts)
+    logger.info(f"迁移: 回填 {len(counts)} 条活动汇总")
+
+
+def migration_0008_activity_events(conn):
+    """activities 表增加 event_type/actor/entity 字段与索引，建立消息全文索引"""
+    existing = _column_names(conn, 'activities')
+    for name in ('event_type', 'actor', 'entity_type'):
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE activities ADD COLUMN {name} VARCHAR"))
+    if 'entity_id' not in existing:
+        conn.execute(text("ALTER TABLE activities ADD COLUMN entity_id INTEGER"))
+    # 历史记录只有消息文本：按固定前缀补充最常用的事件类型（备份导出用于 /backup/status）
+    for event_type, prefix in (('backup.export', '导出系统配置'), ('backup.import', '导入系统配置')):
+        conn.execute(
+            text("UPDATE activities SET event_type = :event_type WHERE event_type IS NULL AND message LIKE :prefix"),
+            {"event_type": event_type, "prefix": f"{prefix}%"}
+        )
+    _create_indexes(conn, Activity.__table__)
+    if create_activity_fts(conn):
+        conn.exec_driver_sql("INSERT INTO activities_fts(activities_fts) VALUES ('rebuild')")
+
+
+def migration_0009_global_acl_peer_id(conn):
+    """全局 ACL 规则的 peer_id 统一为 NULL（已执行过迁移 2 的数据库）"""
+    # 唯一索引按 COALESCE(peer_id, -1) 计算，-1 与 NULL 不会同时存在，直接更新不会冲突
+    _normalize_global_acls(conn)
+
+
+# (版本号, 迁移函数)；只允许追加，不可修改已发布的版本
+MIGRATIONS = [
+    (1, migration_0001_peer_version),
+    (2, migration_0002_query_indexes),
+    (3, migration_0003_table_generations),
+    (4, migration_0004_change_log),
+    (5, migration_0005_user_token_version),
+    (6, migration_0006_api_tokens),
+    (7, migration_0007_activity_rollups),
+    (8, migration_0008_activity_events),
+    (9, migration_0009_global_acl_peer_id),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+
+
+def get_schema_version(conn):
+    _ensure_version_table(conn)
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+
+
+def _set_schema_version(conn, version: int):
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+
+
+def read_schema_version(engine):
+    """只读查询版本号；版本表不存在时返回 None"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    except DBAPIError:
+        return None
+
+
+@contextmanager
+def _migration_transaction(engine):
+    """迁移事务：SQLite 显式 BEGIN IMMEDIATE，使 DDL 与数据复制一起提交或回滚，
+    并取得写锁，防止多个进程同时迁移"""
+    with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        yield conn
+
+
+def run_migrations(engine) -> int:
+    """执行未应用的迁移，返回迁移后的结构版本"""
+    # 快速路径：已是最新版本时只需一条查询
+    if read_schema_version(engine) == LATEST_VERSION:
+        return LATEST_VERSION
+
+    with _migration_transaction(engine) as conn:
+        # 取得写锁后重新读取，其他进程可能已完成迁移
+        version = get_schema_version(conn)
+        if version is None:
+            if not inspect(conn).has_table('peers'):
+                # 全新数据库：按当前模型建表即为最新结构
+                Base.metadata.create_all(bind=conn)
+                _set_schema_version(conn, LATEST_VERSION)
+                logger.info(f"新建数据库结构，版本 {LATEST_VERSION}")
+                return LATEST_VERSION
+            start = time.perf_counter()
+            migration_baseline(conn)
+            version = 0
+            _set_schema_version(conn, version)
+            logger.info(f"旧数据库基线迁移完成，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+        if version < LATEST_VERSION:
+            # 先补建缺失的表（按模型创建，已含最新索引），迁移只需处理已存在的旧表
+            Base.metadata.create_all(bind=conn)
+
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info(f"执行数据库迁移 {target}: {migration.__doc__}")
+        start = time.perf_counter()
+        # 每个迁移在独立事务中执行并记录版本，失败时不会留下半完成的版本号
+        with _migration_transaction(engine) as conn:
+            if get_schema_version(conn) >= target:
+                version = target
+                continue
+            migration(conn)
+            _set_schema_version(conn, target)
+        version = target
+        logger.info(f"数据库迁移 {target} 完成，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    return version
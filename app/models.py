@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, event, func, literal_column
 from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -9,6 +9,7 @@ class User(Base):
 	id = Column(Integer, primary_key=True, autoincrement=True)
 	username = Column(String, unique=True, nullable=False)
 	password_hash = Column(String, nullable=False)
+	token_version = Column(Integer, nullable=False, default=1, server_default='1')  # 修改密码时递增，旧令牌随之失效
 
 class Peer(Base):
 	__tablename__ = 'peers'
@@ -23,6 +24,15 @@ class Peer(Base):
 	keepalive = Column(Integer, default=30)  # 默认 30 秒，最大 120 秒
 	preshared_key = Column(String, nullable=True)  # 新增字段
 	created_at = Column(DateTime, default=datetime.utcnow)
+	version = Column(Integer, nullable=False, default=1, server_default='1')  # 每次更新递增，用于配置缓存失效
+
+	__table_args__ = (
+		Index('ix_peers_status', 'status'),
+	)
+
+@event.listens_for(Peer, 'before_update')
+def _bump_peer_version(mapper, connection, target):
+	target.version = (target.version or 0) + 1
 
 class ACL(Base):
 	__tablename__ = 'acls'
@@ -39,6 +49,25 @@ class ACL(Base):
 	direction = Column(String, nullable=False, default='both')  # 方向 for firewall
 	enabled = Column(Boolean, default=True, nullable=False)  # 是否启用
 
+	# 规则唯一标识：可空列用 COALESCE 归一，使全局规则（peer_id 为空）同样参与唯一约束
+	IDENTITY = (
+		rule_type,
+		func.coalesce(peer_id, literal_column('-1')),
+		target,
+		func.coalesce(destination, literal_column("''")),
+		func.coalesce(source_interface, literal_column("''")),
+		func.coalesce(destination_interface, literal_column("''")),
+		port,
+		protocol,
+		direction,
+	)
+
+	__table_args__ = (
+		Index('ix_acls_peer_id', 'peer_id'),
+		Index('ix_acls_enabled', 'enabled'),
+		Index('uq_acls_identity', *IDENTITY, unique=True),
+	)
+
 class ServerKey(Base):
     __tablename__ = 'server_keys'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -60,6 +89,86 @@ class Activity(Base):
 	type = Column(String, nullable=False)
 	message = Column(String, nullable=False)
 	created_at = Column(DateTime, default=datetime.utcnow)
+	event_type = Column(String, nullable=True)  # 如 peer.create / acl.delete / backup.export
+	actor = Column(String, nullable=True)  # 操作用户
+	entity_type = Column(String, nullable=True)  # peer / acl
+	entity_id = Column(Integer, nullable=True)
+
+	# 审计查询按 id 倒序翻页，索引以 id 结尾即可按索引顺序读取
+	__table_args__ = (
+		Index('ix_activities_created_at', 'created_at'),
+		Index('ix_activities_event_type', 'event_type', 'id'),
+		Index('ix_activities_actor', 'actor', 'id'),
+		Index('ix_activities_entity', 'entity_type', 'entity_id', 'id'),
+	)
+
+# 活动消息全文索引：SQLite FTS5 外部内容表（trigram 分词，支持中文子串搜索），由触发器与 activities 同步
+ACTIVITY_FTS_DDL = (
+	"CREATE VIRTUAL TABLE IF NOT EXISTS activities_fts USING fts5("
+	"message, content='activities', content_rowid='id', tokenize='trigram')",
+	"CREATE TRIGGER IF NOT EXISTS activities_fts_ai AFTER INSERT ON activities BEGIN "
+	"INSERT INTO activities_fts(rowid, message) VALUES (new.id, new.message); END",
+	"CREATE TRIGGER IF NOT EXISTS activities_fts_ad AFTER DELETE ON activities BEGIN "
+	"INSERT INTO activities_fts(activities_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+	"CREATE TRIGGER IF NOT EXISTS activities_fts_au AFTER UPDATE OF message ON activities BEGIN "
+	"INSERT INTO activities_fts(activities_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+	"INSERT INTO activities_fts(rowid, message) VALUES (new.id, new.message); END",
+)
+
+def create_activity_fts(conn) -> bool:
+	"""创建活动全文索引；非 SQLite 或 SQLite 未编译 FTS5 / trigram 时返回 False（搜索退回 LIKE）"""
+	from sqlalchemy.exc import OperationalError
+	if conn.dialect.name != 'sqlite':
+		return False
+	try:
+		for ddl in ACTIVITY_FTS_DDL:
+			conn.exec_driver_sql(ddl)
+	except OperationalError:
+		return False
+	return True
+
+@event.listens_for(Activity.__table__, 'after_create')
+def _create_activity_fts(target, connection, **kw):
+	create_activity_fts(connection)
+
+class ActivityRollup(Base):
+	"""活动按小时 / 按天、按类型的计数，写入活动时同批更新；原始记录清理后仍保留"""
+	__tablename__ = 'activity_rollups'
+	period = Column(String, primary_key=True)  # hour / day
+	bucket = Column(DateTime, primary_key=True)  # 时段起点（UTC）
+	type = Column(String, primary_key=True)
+	count = Column(Integer, nullable=False, default=0)
+
+class TableGeneration(Base):
+	"""每张表的代数：该表每次写入都在同一事务中递增，作为列表接口的 ETag（多 worker 共享）"""
+	__tablename__ = 'table_generations'
+	name = Column(String, primary_key=True)
+	generation = Column(Integer, nullable=False, default=0)
+
+class ChangeLog(Base):
+	"""peers / acls 的变更记录，自增 id 即变更版本号（GET /changes?since=N）"""
+	__tablename__ = 'change_log'
+	id = Column(Integer, primary_key=True, autoincrement=True)
+	entity = Column(String, nullable=False)  # peer / acl
+	entity_id = Column(Integer, nullable=False)
+	op = Column(String, nullable=False)  # created / updated / deleted
+	created_at = Column(DateTime, default=datetime.utcnow)
+
+	# 压缩后不复用已删除的版本号
+	__table_args__ = {'sqlite_autoincrement': True}
+
+class ApiToken(Base):
+	"""自动化脚本使用的长期 API 令牌：prefix 明文用于查找，密钥只保存 HMAC 摘要"""
+	__tablename__ = 'api_tokens'
+	id = Column(Integer, primary_key=True, autoincrement=True)
+	name = Column(String, nullable=False)
+	prefix = Column(String, unique=True, nullable=False)
+	token_hash = Column(String, nullable=False)
+	scopes = Column(String, nullable=False)  # 逗号分隔：read / peers:write / acls:write / admin
+	user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+	created_at = Column(DateTime, default=datetime.utcnow)
+	expires_at = Column(DateTime, nullable=True)
+	last_used_at = Column(DateTime, nullable=True)  # 批量写回，精度为 API_TOKEN_USAGE_FLUSH_SECONDS
 
 class SystemSetting(Base):
 	__tablename__ = 'system_settings'
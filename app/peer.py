@@ -1,11 +1,15 @@
-import subprocess
 import ipaddress
 from app.sync import generate_preshared_key
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
 from app.models import  Peer, User, ServerKey
 from app.activity import log_activity
 from app.settings import get_available_peer_ips
-from app.auth import get_current_user
+from app.auth import get_current_user, get_current_user_async
+from app.commands import check_output
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db import get_db, get_async_db
 import logging
 
 router = APIRouter()
@@ -13,16 +17,13 @@ logger = logging.getLogger(__name__)
 
 # 获取一个可用 peer_ip（GET /peers/available-ip）
 @router.get("/peers/available-ip")
-def get_available_peer_ip(current_user: User = Depends(get_current_user)):
+def get_available_peer_ip(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     try:
-        from app.main import SessionLocal
-        session = SessionLocal()
         used_ips = set()
         for p in session.query(Peer).all():
             for ip in p.peer_ip.split(','):
                 used_ips.add(ip.strip())
         available_ips = [ip for ip in get_available_peer_ips() if ip not in used_ips]
-        session.close()
 
         if not available_ips:
             logger.warning("没有可用的Peer IP地址")
@@ -47,18 +48,16 @@ def create_peer_api(
 	client_allowed_ips: str = Body("0.0.0.0/0"),
 	peer_ip: str = Body(''),
 	keepalive: int = Body(30),
-	current_user: User = Depends(get_current_user)
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
 ):
     try:
         logger.info(f"用户 {current_user.username} 尝试创建Peer")
 
         public_key, private_key = generate_wg_keypair()
-        enc_private_key = encrypt_private_key(private_key)
+        enc_private_key = encrypt_private_key(private_key, session)
         preshared_key = generate_preshared_key()
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
         # 获取已分配的 IP
         used_ips = set()
         for p in session.query(Peer).all():
@@ -67,7 +66,6 @@ def create_peer_api(
         # 获取可用 IP
         available_ips = [ip for ip in get_available_peer_ips() if ip not in used_ips]
         if not available_ips:
-            session.close()
             logger.warning("创建Peer失败：没有可用的IP地址")
             raise HTTPException(status_code=400, detail="可分配的 Peer IP 已用尽")
 
@@ -87,7 +85,6 @@ def create_peer_api(
 
         session.add(peer)
         session.commit()
-        session.close()
 
         from app.sync import sync_acl_and_wireguard
         sync_success = sync_acl_and_wireguard()
@@ -97,7 +94,8 @@ def create_peer_api(
 
         # 记录活动
         try:
-            log_activity(f"创建 节点: {peer.remark or peer.peer_ip}", type='success')
+            log_activity(f"创建 节点: {peer.remark or peer.peer_ip}", type='success', session=session,
+                         event_type='peer.create', actor=current_user.username, entity_type='peer', entity_id=peer.id)
         except Exception as e:
             logger.warning(f"记录活动日志失败: {str(e)}")
 
@@ -114,84 +112,112 @@ def create_peer_api(
         raise HTTPException(status_code=500, detail="创建Peer失败，请稍后重试")
 
 
-# WireGuard 在线节点统计接口（10分钟内有握手的节点数）
-import subprocess
-import time
+# WireGuard 在线节点统计接口（10分钟内有握手的节点数，读取共享的状态快照）
 @router.get("/wg/online-nodes-count")
-def get_wg_online_nodes_count():
-	try:
-		result = subprocess.check_output(["wg", "show", "wg0", "latest-handshakes"]).decode().strip()
-		now = int(time.time())
-		threshold = 600  # 10分钟
-		count = 0
-		for line in result.splitlines():
-			parts = line.strip().split()
-			if len(parts) == 2:
-				handshake = int(parts[1])
-				if handshake > 0 and now - handshake <= threshold:
-					count += 1
-	except Exception as e:
-		count = 0
-	return {"wg_online_nodes_count": count}
+async def get_wg_online_nodes_count():
+	from app.sync import WG_INTERFACE
+	from app.wg_state import wireguard_state
+	snapshot = await wireguard_state.snapshot()
+	return {"wg_online_nodes_count": len(snapshot.online_peers(WG_INTERFACE))}
 
 # Peer 密钥生成接口
 @router.post("/peers/generate-key")
-def generate_key_api(current_user: User = Depends(get_current_user)):
+def generate_key_api(current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	public_key, private_key = generate_wg_keypair()
-	enc_private_key = encrypt_private_key(private_key)
+	enc_private_key = encrypt_private_key(private_key, session)
 	return {
 		"public_key": public_key,
 		"private_key": private_key,
 		"encrypted_private_key": enc_private_key
 	}
 
-# Peer 列表接口
+# Peer 列表可返回（fields= 可投影）的字段，不含私钥与预共享密钥
+PEER_LIST_FIELDS = {
+	"id": Peer.id,
+	"public_key": Peer.public_key,
+	"allowed_ips": Peer.allowed_ips,
+	"client_allowed_ips": Peer.client_allowed_ips,
+	"remark": Peer.remark,
+	"status": Peer.status,
+	"peer_ip": Peer.peer_ip,
+	"created_at": Peer.created_at,
+	"keepalive": Peer.keepalive,
+}
+
+# 可排序字段（可空列归一为空串，保证 keyset 比较有序）
+PEER_SORT_FIELDS = {
+	"id": Peer.id,
+	"remark": func.coalesce(Peer.remark, ''),
+	"peer_ip": Peer.peer_ip,
+}
+
+# Peer 列表接口（异步查询，高频轮询不占用线程池）
+# 不带参数时返回完整数组；带 limit/cursor/fields/sort 或过滤参数时返回 {"items", "next_cursor"}
+# 响应带弱 ETag（peers 表代数），If-None-Match 命中时返回 304
 @router.get("/peers")
-def get_peers(current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
-	peers = session.query(Peer).all()
-	session.close()
-	return [
-		{
-			"id": p.id,
-			"public_key": p.public_key,
-			"allowed_ips": p.allowed_ips,
-			"client_allowed_ips": p.client_allowed_ips,
-			"remark": p.remark,
-			"status": p.status,
-			"peer_ip": p.peer_ip,
-			"created_at": p.created_at,
-			"keepalive": p.keepalive
-		} for p in peers
-	]
+async def get_peers(
+	request: Request,
+	response: Response,
+	limit: int = None,
+	cursor: str = None,
+	fields: str = None,
+	sort: str = None,
+	status: bool = None,
+	remark: str = None,
+	current_user: User = Depends(get_current_user_async),
+	session: AsyncSession = Depends(get_async_db)
+):
+	from app.generations import conditional_list
+	from app.listing import escape_like, keyset_page, page_limit, parse_fields, parse_sort
+	not_modified = await conditional_list(request, response, session, 'peers')
+	if not_modified is not None:
+		return not_modified
+	if all(v is None for v in (limit, cursor, fields, sort, status, remark)):
+		columns = [column.label(name) for name, column in PEER_LIST_FIELDS.items()]
+		rows = (await session.execute(select(*columns).order_by(Peer.id))).all()
+		return [dict(row._mapping) for row in rows]
+
+	selected = parse_fields(fields, PEER_LIST_FIELDS)
+	sort_name, descending = parse_sort(sort, PEER_SORT_FIELDS)
+	filters = []
+	if status is not None:
+		filters.append(Peer.status == status)
+	if remark:
+		filters.append(Peer.remark.ilike(f"%{escape_like(remark)}%", escape='\\'))
+	items, next_cursor = await keyset_page(
+		session, Peer.id, PEER_LIST_FIELDS, selected, filters,
+		PEER_SORT_FIELDS[sort_name], sort_name, descending, cursor, page_limit(limit)
+	)
+	return {"items": items, "next_cursor": next_cursor}
 
 # WireGuard 密钥生成
 def generate_wg_keypair():
-	private_key = subprocess.check_output(['wg', 'genkey']).decode().strip()
-	public_key = subprocess.check_output(['wg', 'pubkey'], input=private_key.encode()).decode().strip()
+	private_key = check_output(['wg', 'genkey']).decode().strip()
+	public_key = check_output(['wg', 'pubkey'], input=private_key.encode()).decode().strip()
 	return public_key, private_key
 
-# 加密密钥（环境变量或默认）
-def get_fernet_key_from_db():
+# 加密密钥（环境变量或默认）；传入请求会话时复用，不再单独打开会话
+def get_fernet_key_from_db(session=None):
 	from app.models import AppSecret
-	from app.main import SessionLocal
-	
-	session = SessionLocal()
-	secret = session.query(AppSecret).filter_by(name='FERNET_KEY').first()
-	secret=secret.value
-	session.close()
+	if session is None:
+		from app.main import SessionLocal
+		own_session = SessionLocal()
+		try:
+			return get_fernet_key_from_db(own_session)
+		finally:
+			own_session.close()
+	secret = session.query(AppSecret.value).filter_by(name='FERNET_KEY').scalar()
 	return secret
 
 # 删除环境变量相关的密钥逻辑，只保留数据库密钥获取
 from cryptography.fernet import Fernet
-def encrypt_private_key(private_key: str) -> str:
-    key = get_fernet_key_from_db()
+def encrypt_private_key(private_key: str, session=None) -> str:
+    key = get_fernet_key_from_db(session)
     fernet = Fernet(key.encode())
     return fernet.encrypt(private_key.encode()).decode()
 
-def decrypt_private_key(enc: str) -> str:
-    key = get_fernet_key_from_db()
+def decrypt_private_key(enc: str, session=None) -> str:
+    key = get_fernet_key_from_db(session)
     fernet = Fernet(key.encode())
     return fernet.decrypt(enc.encode()).decode()
 
@@ -216,22 +242,18 @@ def edit_peer_api(
 	status: bool = Body(None),
 	endpoint: str = Body(None),  # 保留参数以保持兼容性，但不再使用
 	keepalive: int = Body(None),
-	current_user: User = Depends(get_current_user)
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
 ):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	peer = session.query(Peer).get(peer_id)
 	if not peer:
-		session.close()
 		raise HTTPException(status_code=404, detail="Peer not found")
 	if allowed_ips is not None:
 		if not validate_allowed_ips(allowed_ips):
-			session.close()
 			raise HTTPException(status_code=400, detail="AllowedIPs 格式非法")
 		peer.allowed_ips = allowed_ips
 	if client_allowed_ips is not None:
 		if not validate_allowed_ips(client_allowed_ips):
-			session.close()
 			raise HTTPException(status_code=400, detail="Client AllowedIPs 格式非法")
 		peer.client_allowed_ips = client_allowed_ips
 	if remark is not None:
@@ -241,13 +263,13 @@ def edit_peer_api(
 	if keepalive is not None:
 		peer.keepalive = min(max(keepalive, 30), 120)
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	msg = "Peer updated"
 	# 记录活动
 	try:
-		log_activity(f"更新 节点: {peer.remark or peer.peer_ip}", type='info')
+		log_activity(f"更新 节点: {peer.remark or peer.peer_ip}", type='info', session=session, event_type='peer.update',
+			actor=current_user.username, entity_type='peer', entity_id=peer_id)
 	except Exception:
 		pass
 	if not sync_success:
@@ -256,49 +278,38 @@ def edit_peer_api(
 
 # Peer 启用/禁用接口
 @router.post("/peers/{peer_id}/toggle")
-def toggle_peer_status(peer_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
+def toggle_peer_status(peer_id: int, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
 	peer = session.query(Peer).get(peer_id)
 	if not peer:
-		session.close()
 		raise HTTPException(status_code=404, detail="Peer not found")
 	peer.status = not peer.status
 	session.commit()
-	session.close()
 	from app.sync import sync_acl_and_wireguard
 	sync_success = sync_acl_and_wireguard()
 	msg = "Peer status toggled"
 	# 记录活动
 	try:
-		log_activity(f"切换 节点 状态: {peer.remark or peer.peer_ip} -> {'启用' if peer.status else '禁用'}", type='info')
+		log_activity(f"切换 节点 状态: {peer.remark or peer.peer_ip} -> {'启用' if peer.status else '禁用'}", type='info', session=session,
+			event_type='peer.toggle', actor=current_user.username, entity_type='peer', entity_id=peer_id)
 	except Exception:
 		pass
 	if not sync_success:
 		msg += " (警告: WireGuard 同步失败)"
 	return {"msg": msg, "status": peer.status, "sync_success": sync_success}
 
-# 生成客户端配置内容
-def generate_client_config(peer, server_public_key=None):
-	from app.peer import decrypt_private_key
-	from app.main import SessionLocal
+# 获取全局端点：优先系统设置（内存缓存），否则使用环境变量默认值
+def get_global_endpoint():
 	from app.settings import WG_GLOBAL_ENDPOINT
-	
-	private_key = decrypt_private_key(peer.private_key)
-	
-	# 从数据库获取全局端点设置，如果没有则使用环境变量默认值
-	global_endpoint = WG_GLOBAL_ENDPOINT  # 默认使用环境变量
-	session = SessionLocal()
+	from app.settings_service import settings_service
 	try:
-		from app.models import SystemSetting
-		setting = session.query(SystemSetting).filter_by(key='global_endpoint').first()
-		if setting and setting.value.strip():
-			global_endpoint = setting.value.strip()
+		global_endpoint = settings_service.get('global_endpoint').strip()
 	except Exception as e:
 		logger.warning(f"获取全局端点设置失败，使用默认值: {str(e)}")
-	finally:
-		session.close()
-	
+		global_endpoint = ''
+	return global_endpoint or WG_GLOBAL_ENDPOINT
+
+# 按已解密的私钥格式化客户端配置（不访问数据库，可在工作线程中调用）
+def format_client_config(peer, private_key, server_public_key=None, global_endpoint=''):
 	# 如果端点为空，则不包含Endpoint字段
 	endpoint_line = f"Endpoint = {global_endpoint}\n" if global_endpoint else ""
 	
@@ -316,47 +327,91 @@ AllowedIPs = {peer.client_allowed_ips}
 """
 	return config
 
-# 下载客户端配置文件接口
-from fastapi import Response
-@router.get("/peers/{peer_id}/config")
-def download_peer_config(peer_id: int, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
-	peer = session.query(Peer).get(peer_id)
-	server_key = session.query(ServerKey).first()
-	session.close()
-	if not peer:
+# 生成客户端配置内容
+def generate_client_config(peer, server_public_key=None, session=None):
+	private_key = decrypt_private_key(peer.private_key, session)
+	return format_client_config(peer, private_key, server_public_key, get_global_endpoint())
+
+# 加载（或从缓存获取）已渲染的客户端配置
+def load_rendered_config(peer_id: int, session):
+	from app.client_config import cache_version, get_cached_config, store_config
+	peer_version = session.query(Peer.version).filter(Peer.id == peer_id).scalar()
+	if peer_version is None:
 		raise HTTPException(status_code=404, detail="Peer not found")
+	server_key = session.query(ServerKey.id, ServerKey.public_key).first()
 	if not server_key:
 		raise HTTPException(status_code=500, detail="Server key not found")
-	server_public_key = server_key.public_key
-	config = generate_client_config(peer, server_public_key)
-	return Response(content=config, media_type="text/plain", headers={
-		"Content-Disposition": f"attachment; filename=peer_{peer_id}_config.conf"
-	})
+	version = cache_version(peer_version, server_key.id)
+	rendered = get_cached_config(peer_id, version)
+	if rendered is None:
+		peer = session.query(Peer).get(peer_id)
+		config = generate_client_config(peer, server_key.public_key, session)
+		rendered = store_config(peer_id, version, config)
+	return rendered
 
-# 显示客户端配置文件二维码接口
+# 下载客户端配置文件接口
+from fastapi import Header, Response
 from fastapi.responses import StreamingResponse
-import qrcode
-from io import BytesIO
+from app.cache import etag_matches
+@router.get("/peers/{peer_id}/config")
+def download_peer_config(peer_id: int, if_none_match: str = Header(None), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
+	rendered = load_rendered_config(peer_id, session)
+	if etag_matches(if_none_match, rendered.etag):
+		return Response(status_code=304, headers={"ETag": rendered.etag})
+	return Response(content=rendered.config, media_type="text/plain", headers={
+		"Content-Disposition": f"attachment; filename=peer_{peer_id}_config.conf",
+		"ETag": rendered.etag,
+		"Cache-Control": "private, no-cache"
+	})
+
+# 显示客户端配置文件二维码接口（format=png|svg）
 @router.get("/peers/{peer_id}/config/qrcode")
-def get_peer_config_qrcode(peer_id: int, current_user: User = Depends(get_current_user)):
+def get_peer_config_qrcode(
+	peer_id: int,
+	format: str = "png",
+	if_none_match: str = Header(None),
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
+):
+	from app.client_config import QR_MEDIA_TYPES, qrcode_etag, render_qrcode
+	if format not in QR_MEDIA_TYPES:
+		raise HTTPException(status_code=400, detail="format 必须为 png 或 svg")
+	rendered = load_rendered_config(peer_id, session)
+	etag = qrcode_etag(rendered, format)
+	headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+	if etag_matches(if_none_match, etag):
+		return Response(status_code=304, headers=headers)
+	return Response(content=render_qrcode(rendered, format), media_type=QR_MEDIA_TYPES[format], headers=headers)
+
+# 批量导出客户端配置（ZIP 流式输出，可附带二维码）
+@router.get("/peers/export")
+def export_peer_configs(
+	ids: str = None,
+	remark_prefix: str = None,
+	include_qr: str = None,
+	current_user: User = Depends(get_current_user),
+	session: Session = Depends(get_db)
+):
 	from app.main import SessionLocal
-	session = SessionLocal()
-	peer = session.query(Peer).get(peer_id)
-	server_key = session.query(ServerKey).first()
-	session.close()
-	if not peer:
-		raise HTTPException(status_code=404, detail="Peer not found")
-	if not server_key:
-		raise HTTPException(status_code=500, detail="Server key not found")
-	server_public_key = server_key.public_key
-	config = generate_client_config(peer, server_public_key)
-	img = qrcode.make(config)
-	buf = BytesIO()
-	img.save(buf, format="PNG")
-	buf.seek(0)
-	return StreamingResponse(buf, media_type="image/png")
+	from app.client_config import QR_MEDIA_TYPES
+	from app.config_export import iter_peer_export_files, iter_zip
+	peer_ids = None
+	if ids:
+		try:
+			peer_ids = [int(i) for i in ids.split(',') if i.strip()]
+		except ValueError:
+			raise HTTPException(status_code=400, detail="ids 必须为逗号分隔的整数")
+	if include_qr and include_qr not in QR_MEDIA_TYPES:
+		raise HTTPException(status_code=400, detail="include_qr 必须为 png 或 svg")
+	try:
+		log_activity(f"批量导出 客户端配置: ids={ids or '-'} 前缀={remark_prefix or '-'}", type='info', session=session,
+			event_type='peer.export_configs', actor=current_user.username)
+	except Exception:
+		pass
+	files = iter_peer_export_files(SessionLocal, peer_ids, remark_prefix, include_qr)
+	return StreamingResponse(iter_zip(files), media_type="application/zip", headers={
+		"Content-Disposition": "attachment; filename=peer_configs.zip"
+	})
 
 # 批量操作接口
 from typing import List
@@ -369,7 +424,7 @@ class BatchACLRequest(BaseModel):
     acls: List[dict]
 
 @router.post("/peers/batch")
-def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(get_current_user)):
+def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量创建Peers"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量创建 {len(request.peers)} 个Peer")
@@ -378,9 +433,6 @@ def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(g
         success_count = 0
         fail_count = 0
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
         for i, peer_data in enumerate(request.peers):
             try:
                 # 验证必需字段
@@ -389,7 +441,7 @@ def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(g
 
                 # 生成密钥
                 public_key, private_key = generate_wg_keypair()
-                enc_private_key = encrypt_private_key(private_key)
+                enc_private_key = encrypt_private_key(private_key, session)
                 preshared_key = generate_preshared_key()
 
                 # 获取可用IP
@@ -440,7 +492,6 @@ def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(g
                 fail_count += 1
 
         session.commit()
-        session.close()
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -450,7 +501,8 @@ def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(g
 
         # 记录活动
         try:
-            log_activity(f"批量创建节点: 成功{success_count}, 失败{fail_count}", type='success')
+            log_activity(f"批量创建节点: 成功{success_count}, 失败{fail_count}", type='success', session=session,
+                         event_type='peer.batch_create', actor=current_user.username)
         except Exception:
             pass
 
@@ -466,23 +518,25 @@ def batch_create_peers(request: BatchPeerRequest, current_user: User = Depends(g
 
 
 @router.post("/peers/batch-toggle")
-def batch_toggle_peers(peer_ids: List[int] = Body(...), current_user: User = Depends(get_current_user)):
+def batch_toggle_peers(peer_ids: List[int] = Body(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量启用/禁用Peers"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量操作 {len(peer_ids)} 个Peer")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
-        updated_count = 0
-        for peer_id in peer_ids:
-            peer = session.query(Peer).get(peer_id)
-            if peer:
-                peer.status = not peer.status
-                updated_count += 1
-
+        # 单条 UPDATE ... SET status = NOT status（按 id 分块），批量语句不触发 ORM 事件，版本号在此递增
+        from sqlalchemy import not_, update
+        from app.changes import execute_returning_ids
+        from app.client_config import invalidate_peer
+        updated_ids = execute_returning_ids(
+            session,
+            lambda chunk: update(Peer).where(Peer.id.in_(chunk))
+            .values(status=not_(Peer.status), version=Peer.version + 1).returning(Peer.id),
+            peer_ids, 'peer', 'updated'
+        )
+        updated_count = len(updated_ids)
         session.commit()
-        session.close()
+        for peer_id in updated_ids:
+            invalidate_peer(peer_id)
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -492,13 +546,15 @@ def batch_toggle_peers(peer_ids: List[int] = Body(...), current_user: User = Dep
 
         # 记录活动
         try:
-            log_activity(f"批量切换节点状态: 更新{updated_count}个", type='info')
+            log_activity(f"批量切换节点状态: 更新{updated_count}个", type='info', session=session,
+                         event_type='peer.batch_toggle', actor=current_user.username)
         except Exception:
             pass
 
         return {
             "msg": f"批量操作完成: 更新{updated_count}个节点",
             "updated_count": updated_count,
+            "updated_ids": updated_ids,
             "sync_success": sync_success
         }
 
@@ -508,26 +564,26 @@ def batch_toggle_peers(peer_ids: List[int] = Body(...), current_user: User = Dep
 
 
 @router.delete("/peers/batch")
-def batch_delete_peers(peer_ids: List[int] = Body(...), current_user: User = Depends(get_current_user)):
+def batch_delete_peers(peer_ids: List[int] = Body(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_db)):
     """批量删除Peers"""
     try:
         logger.info(f"用户 {current_user.username} 尝试批量删除 {len(peer_ids)} 个Peer")
 
-        from app.main import SessionLocal
-        session = SessionLocal()
-
-        deleted_count = 0
-        for peer_id in peer_ids:
-            peer = session.query(Peer).get(peer_id)
-            if peer:
-                # 删除关联的ACL
-                from app.models import ACL
-                session.query(ACL).filter_by(peer_id=peer_id).delete()
-                session.delete(peer)
-                deleted_count += 1
+        from sqlalchemy import delete
+        from app.acl import delete_peer_acls
+        from app.changes import execute_returning_ids
+        from app.client_config import invalidate_peer
 
+        # 先删除关联的ACL，再删除节点：DELETE ... WHERE peer_id IN (...) / id IN (...)
+        delete_peer_acls(session, peer_ids)
+        deleted_ids = execute_returning_ids(
+            session, lambda chunk: delete(Peer).where(Peer.id.in_(chunk)).returning(Peer.id),
+            peer_ids, 'peer', 'deleted'
+        )
+        deleted_count = len(deleted_ids)
         session.commit()
-        session.close()
+        for peer_id in deleted_ids:
+            invalidate_peer(peer_id)
 
         # 同步WireGuard
         from app.sync import sync_acl_and_wireguard
@@ -537,13 +593,15 @@ def batch_delete_peers(peer_ids: List[int] = Body(...), current_user: User = Dep
 
         # 记录活动
         try:
-            log_activity(f"批量删除节点: 删除{deleted_count}个", type='warning')
+            log_activity(f"批量删除节点: 删除{deleted_count}个", type='warning', session=session,
+                         event_type='peer.batch_delete', actor=current_user.username)
         except Exception:
             pass
 
         return {
             "msg": f"批量删除完成: 删除{deleted_count}个节点",
             "deleted_count": deleted_count,
+            "deleted_ids": deleted_ids,
             "sync_success": sync_success
         }
 
@@ -0,0 +1,161 @@
+"""活动日志保留与归档
+
+后台线程按间隔清理超过保留期的活动：每批按 id 顺序取出至多 batch_size 条，
+（配置了归档目录时）按月追加写入 activities-YYYY-MM.ndjson.gz，再按 id 范围删除，
+每批一个短事务，不会长时间持有写锁。小时汇总同样按保留期清理，按天汇总永久保留。
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from app.config import (
+    ACTIVITY_ARCHIVE_DIR, ACTIVITY_HOURLY_ROLLUP_DAYS, ACTIVITY_PRUNE_BATCH, ACTIVITY_PRUNE_INTERVAL,
+    ACTIVITY_RETENTION_DAYS,
+)
+from app.models import Activity, ActivityRollup
+
+logger = logging.getLogger(__name__)
+
+
+def archive_rows(archive_dir: str, rows) -> int:
+    """把活动按月追加到 NDJSON.gz 分段（每次追加一个 gzip 成员，整个文件仍可直接解压）"""
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row.created_at.strftime('%Y-%m'), []).append(row)
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, f"activities-{month}.ndjson.gz")
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            for row in month_rows:
+                f.write(json.dumps({
+                    'id': row.id, 'type': row.type, 'message': row.message,
+                    'created_at': row.created_at.isoformat()
+                }, ensure_ascii=False) + '\n')
+    return len(rows)
+
+
+class ActivityRetention:
+    """活动保留策略：清理过期原始记录与小时汇总"""
+
+    def __init__(self, retention_days: int = ACTIVITY_RETENTION_DAYS,
+                 hourly_rollup_days: int = ACTIVITY_HOURLY_ROLLUP_DAYS,
+                 batch_size: int = ACTIVITY_PRUNE_BATCH, interval: float = ACTIVITY_PRUNE_INTERVAL,
+                 archive_dir: str = ACTIVITY_ARCHIVE_DIR, session_factory=None):
+        self.retention_days = retention_days
+        self.hourly_rollup_days = hourly_rollup_days
+        self.batch_size = max(batch_size, 1)
+        self.interval = interval
+        self.archive_dir = archive_dir
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread = None
+        self.pruned = 0
+        self.archived = 0
+        self.last_run = None
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.main import SessionLocal
+        return SessionLocal()
+
+    def start(self):
+        # 未设置保留天数时永久保留，不启动清理线程（小时汇总也不清理）
+        if self.retention_days <= 0 or self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='activity-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"清理活动日志失败: {e}")
+            self._stop.wait(self.interval)
+
+    def run_once(self, now: datetime = None) -> int:
+        """执行一轮清理，返回删除的活动条数"""
+        now = now or datetime.utcnow()
+        removed = 0
+        if self.retention_days > 0:
+            cutoff = now - timedelta(days=self.retention_days)
+            while not self._stop.is_set():
+                count = self._prune_batch(cutoff)
+                removed += count
+                if count == 0:
+                    break
+        if self.hourly_rollup_days > 0:
+            self._prune_hourly(now - timedelta(days=self.hourly_rollup_days))
+        self.pruned += removed
+        self.last_run = now
+        if removed:
+            logger.info(f"清理 {removed} 条超过 {self.retention_days} 天的活动记录")
+        return removed
+
+    def _prune_batch(self, cutoff: datetime) -> int:
+        session = self._session()
+        try:
+            conn = session.connection()
+            if self.archive_dir:
+                rows = conn.execute(
+                    select(Activity.id, Activity.type, Activity.message, Activity.created_at)
+                    .where(Activity.created_at < cutoff).order_by(Activity.id).limit(self.batch_size)
+                ).all()
+                ids = [row.id for row in rows]
+            else:
+                ids = conn.execute(
+                    select(Activity.id).where(Activity.created_at < cutoff).order_by(Activity.id).limit(self.batch_size)
+                ).scalars().all()
+            if not ids:
+                return 0
+            # 新记录的 id 更大且时间更新，按 id 范围加时间条件删除即为本批记录，无需长 IN 列表
+            deleted = conn.execute(delete(Activity).where(
+                Activity.id.between(ids[0], ids[-1]), Activity.created_at < cutoff
+            )).rowcount
+            if self.archive_dir and deleted:
+                # 归档写在提交之前：写入失败时本批记录不删除；已被其他 worker 删除时不重复归档
+                self.archived += archive_rows(self.archive_dir, rows)
+            session.commit()
+            return deleted
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _prune_hourly(self, cutoff: datetime):
+        session = self._session()
+        try:
+            session.connection().execute(delete(ActivityRollup).where(
+                ActivityRollup.period == 'hour', ActivityRollup.bucket < cutoff
+            ))
+            session.commit()
+        finally:
+            session.close()
+
+    def stats(self) -> dict:
+        return {
+            'retention_days': self.retention_days,
+            'hourly_rollup_days': self.hourly_rollup_days,
+            'archive_dir': self.archive_dir or None,
+            'pruned': self.pruned,
+            'archived': self.archived,
+            'last_run': self.last_run.isoformat() if self.last_run else None
+        }
+
+
+# 全局活动保留策略实例
+activity_retention = ActivityRetention()
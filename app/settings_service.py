@@ -0,0 +1,149 @@
+# 系统设置服务
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from app.config import SETTINGS_REFRESH_SECONDS
+from app.models import SystemSetting
+
+logger = logging.getLogger(__name__)
+
+# 已知设置项的类型与默认值；未声明的设置项按字符串处理
+SETTING_DEFINITIONS = {
+    'global_endpoint': (str, ''),
+}
+
+
+def _encode(value) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _decode(raw: str, value_type):
+    if value_type is str:
+        return raw
+    if value_type is bool:
+        return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+    return value_type(json.loads(raw))
+
+
+class SettingsService:
+    """系统设置内存缓存
+
+    所有设置一次性加载到内存，写入时使用单条 upsert 语句并立即重新加载，
+    同时递增代数（generation）并通知订阅者，依赖设置的缓存据此精确失效。
+    """
+
+    def __init__(self, refresh_seconds: float = SETTINGS_REFRESH_SECONDS, session_factory=None):
+        self.refresh_seconds = refresh_seconds
+        self._session_factory = session_factory
+        self.generation = 0
+        self._values = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def _session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.main import SessionLocal
+        return SessionLocal()
+
+    def reload(self):
+        """从数据库重新加载全部设置；内容有变化时递增代数并通知订阅者"""
+        session = self._session()
+        try:
+            values = {s.key: s.value for s in session.query(SystemSetting.key, SystemSetting.value)}
+        finally:
+            session.close()
+        with self._lock:
+            previous = self._values
+            self._values = values
+            self._loaded_at = time.monotonic()
+        if previous is not None and previous != values:
+            changed = {k for k in previous.keys() | values.keys() if previous.get(k) != values.get(k)}
+            self._notify(changed)
+        return values
+
+    def _current(self) -> dict:
+        values = self._values
+        if values is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            values = self.reload()
+        return values
+
+    def refresh(self) -> int:
+        """缓存超过刷新间隔时重新加载（其他 worker 或直接写库的修改在此时触发变更通知），返回当前代数"""
+        self._current()
+        return self.generation
+
+    def all(self) -> dict:
+        return dict(self._current())
+
+    def get_raw(self, key: str, default=None):
+        return self._current().get(key, default)
+
+    def get(self, key: str, default=None):
+        """按声明的类型返回设置值"""
+        value_type, declared_default = SETTING_DEFINITIONS.get(key, (str, None))
+        if default is None:
+            default = declared_default
+        raw = self._current().get(key)
+        if raw is None:
+            return default
+        try:
+            return _decode(raw, value_type)
+        except (ValueError, TypeError):
+            logger.warning(f"系统设置 {key} 的值无法解析为 {value_type.__name__}，使用默认值")
+            return default
+
+    def update(self, values: dict) -> set:
+        """批量写入设置（单条 INSERT ... ON CONFLICT DO UPDATE），返回发生变化的键"""
+        if not values:
+            return set()
+        from app.db import dialect_insert
+        now = datetime.utcnow()
+        rows = [
+            {'key': key, 'value': _encode(value), 'created_at': now, 'updated_at': now}
+            for key, value in values.items()
+        ]
+        before = self._current()
+        session = self._session()
+        try:
+            stmt = dialect_insert(session, SystemSetting).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[SystemSetting.key],
+                set_={'value': stmt.excluded.value, 'updated_at': stmt.excluded.updated_at}
+            )
+            session.execute(stmt)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        # 写穿透：立即重新加载，reload 负责递增代数并通知订阅者
+        after = self.reload()
+        return {k for k in values if before.get(k) != after.get(k)}
+
+    def subscribe(self, callback):
+        """注册设置变化回调：callback(changed_keys: set)"""
+        with self._lock:
+            self._listeners.append(callback)
+        return callback
+
+    def _notify(self, changed: set):
+        with self._lock:
+            self.generation += 1
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.warning(f"系统设置变更回调执行失败: {str(e)}")
+
+
+# 全局系统设置服务实例
+settings_service = SettingsService()
@@ -1,7 +1,12 @@
+import itertools
 import os
 import subprocess
+import time
 from sqlalchemy.orm import sessionmaker
 from app.models import Peer, ACL, ServerKey
+from app.commands import run, check_output
+from app.config import WG_QUICK_TIMEOUT
+from app.events import event_broker
 WG_SERVER_PRIVATE_KEY_PATH = os.environ.get('WG_SERVER_PRIVATE_KEY_PATH', '/etc/wireguard/server_private.key')
 
 WG_CONFIG_PATH = os.environ.get('WG_CONFIG_PATH', '/etc/wireguard/wg0.conf')
@@ -17,8 +22,8 @@ def generate_wg_config():
 	if not server_key:
 		# 自动生成
 		print("[日志] 数据库无服务端密钥，自动生成...")
-		private_key = subprocess.check_output(['wg', 'genkey']).decode().strip()
-		public_key = subprocess.check_output(['wg', 'pubkey'], input=private_key.encode()).decode().strip()
+		private_key = check_output(['wg', 'genkey']).decode().strip()
+		public_key = check_output(['wg', 'pubkey'], input=private_key.encode()).decode().strip()
 		server_key = ServerKey(public_key=public_key, private_key=private_key)
 		session.add(server_key)
 		session.commit()
@@ -55,7 +60,7 @@ def generate_wg_config():
 	return '\n'.join(config)
 
 def generate_preshared_key():
-	return subprocess.check_output(['wg', 'genpsk']).decode().strip()
+	return check_output(['wg', 'genpsk']).decode().strip()
 
 def write_wg_config():
 	config_text = generate_wg_config()
@@ -92,7 +97,7 @@ def reload_wireguard(action):
 			try:
 				print(f"[日志] 执行: {wg_quick_path} down {WG_INTERFACE}")
 				if action == 'down':
-					subprocess.run([wg_quick_path, "down", WG_INTERFACE], check=True, capture_output=True)
+					run([wg_quick_path, "down", WG_INTERFACE], timeout=WG_QUICK_TIMEOUT, check=True)
 			except subprocess.CalledProcessError as e:
 				# 忽略 'is not a WireGuard interface' 错误
 				if b'is not a WireGuard interface' in e.stderr:
@@ -101,7 +106,7 @@ def reload_wireguard(action):
 					print(f"wg-quick down 错误: {e.stderr.decode().strip()}")
 		print(f"[日志] 执行: {wg_quick_path} up {WG_INTERFACE}")
 		if action == 'up':
-			subprocess.run([wg_quick_path, "up", WG_INTERFACE], check=True)
+			run([wg_quick_path, "up", WG_INTERFACE], timeout=WG_QUICK_TIMEOUT, check=True)
 		return True
 	except Exception as e:
 		print(f"WireGuard 重载失败: {e}")
@@ -113,7 +118,7 @@ def reload_wireguard(action):
 def get_default_interface():
 	import re
 	try:
-		route_info = subprocess.check_output("ip route | grep default", shell=True).decode()
+		route_info = check_output(["ip", "route", "show", "default"]).decode()
 		match = re.search(r'dev (\S+)', route_info)
 		if match:
 			return match.group(1)
@@ -282,14 +287,29 @@ def apply_acl_to_iptables(acls):
 
 	return post_up_cmds, post_down_cmds
 
-def sync_wireguard():
+def sync_wireguard(progress=None):
+	progress = progress or (lambda stage: None)
 	success = reload_wireguard('down')
+	progress('down')
 	remove_old_wg_config()
 	write_wg_config()
+	progress('config_written')
 	success = reload_wireguard('up')
+	progress('up')
 	return success
 
+# 同步任务编号（进程内递增），用于关联同一次同步的进度事件
+_sync_jobs = itertools.count(1)
+
 def sync_acl_and_wireguard():
-	wg_success = sync_wireguard()
+	job = next(_sync_jobs)
+	start = time.monotonic()
+	publish = lambda stage, **data: event_broker.publish('sync', {'job': job, 'stage': stage, **data})
+	publish('started')
+	wg_success = False
+	try:
+		wg_success = sync_wireguard(progress=publish)
+	finally:
+		publish('finished', success=wg_success, duration_ms=round((time.monotonic() - start) * 1000))
 	return wg_success
 
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from app.models import SystemSetting
 from app.auth import get_current_user, User
+from app.settings_service import settings_service
 import logging
 
 router = APIRouter()
@@ -9,61 +9,34 @@ logger = logging.getLogger(__name__)
 # 获取系统设置
 @router.get("/system/settings")
 def get_system_settings(current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	try:
-		settings = session.query(SystemSetting).all()
-		result = {setting.key: setting.value for setting in settings}
-		return result
+		return settings_service.all()
 	except Exception as e:
 		logger.error(f"获取系统设置失败: {str(e)}")
 		raise HTTPException(status_code=500, detail="获取系统设置失败")
-	finally:
-		session.close()
 
-# 更新系统设置
+# 更新系统设置（单条 upsert 语句批量写入）
 @router.put("/system/settings")
 def update_system_settings(settings: dict, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	try:
-		for key, value in settings.items():
-			setting = session.query(SystemSetting).filter_by(key=key).first()
-			if setting:
-				setting.value = value
-			else:
-				setting = SystemSetting(key=key, value=value)
-				session.add(setting)
-		session.commit()
+		settings_service.update(settings)
 		return {"msg": "系统设置更新成功"}
 	except Exception as e:
-		session.rollback()
 		logger.error(f"更新系统设置失败: {str(e)}")
 		raise HTTPException(status_code=500, detail="更新系统设置失败")
-	finally:
-		session.close()
 
 # 获取单个系统设置
 @router.get("/system/settings/{key}")
 def get_system_setting(key: str, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	try:
-		setting = session.query(SystemSetting).filter_by(key=key).first()
-		if not setting:
-			return {"value": ""}
-		return {"value": setting.value}
+		return {"value": settings_service.get_raw(key, "")}
 	except Exception as e:
 		logger.error(f"获取系统设置失败: {str(e)}")
 		raise HTTPException(status_code=500, detail="获取系统设置失败")
-	finally:
-		session.close()
 
 # 更新单个系统设置
 @router.put("/system/settings/{key}", response_model=None)
 async def update_system_setting(key: str, request: Request, current_user: User = Depends(get_current_user)):
-	from app.main import SessionLocal
-	session = SessionLocal()
 	try:
 		# 支持text/plain和json
 		if request.headers.get("content-type","").startswith("text/plain"):
@@ -72,17 +45,8 @@ async def update_system_setting(key: str, request: Request, current_user: User =
 		else:
 			data = await request.json()
 			value = data.get("value", "") if isinstance(data, dict) else str(data)
-		setting = session.query(SystemSetting).filter_by(key=key).first()
-		if setting:
-			setting.value = value
-		else:
-			setting = SystemSetting(key=key, value=value)
-			session.add(setting)
-		session.commit()
+		settings_service.update({key: value})
 		return {"msg": f"系统设置 {key} 更新成功"}
 	except Exception as e:
-		session.rollback()
 		logger.error(f"更新系统设置失败: {str(e)}")
 		raise HTTPException(status_code=500, detail="更新系统设置失败")
-	finally:
-		session.close()
@@ -1,96 +1,74 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
-from app.models import Peer, ACL, Activity, User
-from app.auth import get_current_user
+from app.models import Peer, ACL, User
+from app.activity import activity_writer, recent_activity_count_stmt
+from app.retention import activity_retention
+from app.events import event_broker
+from app.metrics import metrics_sampler
+from app.timeseries import performance_history
+from app.wg_state import wireguard_state
+from app.auth import get_current_user_async
+from app.db import get_async_db
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import psutil
 import time
-import subprocess
 import os
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-
 @router.get('/system/stats')
-def system_stats(current_user: User = Depends(get_current_user)):
-    """返回基础的系统资源占用信息：CPU%、内存、磁盘、网络速率（单位：bytes/s）"""
-    try:
-        # CPU 百分比（按总体）
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-
-        # 内存使用情况
-        mem = psutil.virtual_memory()
-        mem_total = mem.total
-        mem_used = mem.used
-        mem_percent = mem.percent
-
-        # 磁盘使用情况（根分区）
-        disk = psutil.disk_usage('/')
-        disk_total = disk.total
-        disk_used = disk.used
-        disk_percent = disk.percent
-
-        # 网络速率：采样两次计算速率
-        net1 = psutil.net_io_counters()
-        time.sleep(0.5)
-        net2 = psutil.net_io_counters()
-        interval = 0.5
-        bytes_sent_per_s = (net2.bytes_sent - net1.bytes_sent) / interval
-        bytes_recv_per_s = (net2.bytes_recv - net1.bytes_recv) / interval
-
-        data = {
-            'cpu_percent': cpu_percent,
-            'memory': {
-                'total': mem_total,
-                'used': mem_used,
-                'percent': mem_percent
-            },
-            'disk': {
-                'total': disk_total,
-                'used': disk_used,
-                'percent': disk_percent
-            },
-            'network': {
-                'bytes_sent_per_s': bytes_sent_per_s,
-                'bytes_recv_per_s': bytes_recv_per_s
-            }
-        }
+async def system_stats(current_user: User = Depends(get_current_user_async)):
+    """返回基础的系统资源占用信息：CPU%、内存、磁盘、网络速率（单位：bytes/s）
 
-        return JSONResponse(content=data)
+    直接返回后台采样器的最新一次采样（速率已按相邻两次采样计算），请求中不等待；
+    interfaces 为各网卡（含 WireGuard 接口）的累计字节数与速率。
+    """
+    try:
+        return JSONResponse(content=metrics_sampler.latest())
 
     except Exception as e:
         logger.error(f"获取系统统计信息时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取系统统计失败")
 
 
+def cache_stats() -> dict:
+    """各进程内缓存的命中率等指标（当前 worker）"""
+    from app.api_tokens import api_token_cache
+    from app.auth import user_cache
+    from app.client_config import config_cache, qr_cache
+    return {
+        'auth_users': user_cache.stats(),
+        'api_tokens': api_token_cache.stats(),
+        'client_config': config_cache.stats(),
+        'qrcode': qr_cache.stats()
+    }
+
+
 @router.get('/system/advanced-stats')
-def advanced_system_stats(current_user: User = Depends(get_current_user)):
+async def advanced_system_stats(current_user: User = Depends(get_current_user_async), session: AsyncSession = Depends(get_async_db)):
     """返回高级系统统计信息"""
     try:
-        from app.main import SessionLocal
-        session = SessionLocal()
-
-        # 数据库统计
-        peer_count = session.query(Peer).count()
-        active_peer_count = session.query(Peer).filter_by(status=True).count()
-        acl_count = session.query(ACL).count()
-        enabled_acl_count = session.query(ACL).filter_by(enabled=True).count()
-
-        # 活动统计（最近24小时）
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        recent_activities = session.query(Activity).filter(
-            Activity.created_at >= yesterday
-        ).count()
-
-        session.close()
-
-        # WireGuard接口统计
-        wg_stats = get_wireguard_stats()
-
-        # 进程统计
-        process_stats = get_process_stats()
+        # 数据库统计（单条语句完成所有计数）
+        counts = (await session.execute(select(
+            select(func.count()).select_from(Peer).scalar_subquery(),
+            select(func.count()).select_from(Peer).where(Peer.status == True).scalar_subquery(),
+            select(func.count()).select_from(ACL).scalar_subquery(),
+            select(func.count()).select_from(ACL).where(ACL.enabled == True).scalar_subquery(),
+            # 活动统计（最近24小时）读取小时汇总，不扫描活动表
+            recent_activity_count_stmt(24).scalar_subquery(),
+        ))).one()
+        peer_count, active_peer_count, acl_count, enabled_acl_count, recent_activities = counts
+
+        # WireGuard接口统计与进程统计（进程遍历在线程中执行）并发进行
+        wg_stats, process_stats = await asyncio.gather(
+            get_wireguard_stats(),
+            asyncio.to_thread(get_process_stats)
+        )
 
         data = {
             'database': {
@@ -102,6 +80,13 @@ def advanced_system_stats(current_user: User = Depends(get_current_user)):
             },
             'wireguard': wg_stats,
             'processes': process_stats,
+            'caches': cache_stats(),
+            'activity_writer': activity_writer.stats(),
+            'activity_retention': activity_retention.stats(),
+            'events': event_broker.stats(),
+            'metrics_sampler': metrics_sampler.stats(),
+            'performance_history': performance_history.stats(),
+            'wireguard_state': wireguard_state.stats(),
             'timestamp': datetime.utcnow().isoformat()
         }
 
@@ -112,47 +97,22 @@ def advanced_system_stats(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="获取高级统计失败")
 
 
-def get_wireguard_stats():
-    """获取WireGuard接口统计"""
-    try:
-        # 检查WireGuard接口状态
-        result = subprocess.run(['wg', 'show', 'wg0'], capture_output=True, text=True)
-        if result.returncode != 0:
-            return {'status': 'down', 'peers': 0, 'transfer': {'rx': 0, 'tx': 0}}
-
-        # 解析wg show输出
-        lines = result.stdout.strip().split('\n')
-        peer_count = 0
-        total_rx = 0
-        total_tx = 0
-
-        for line in lines:
-            if 'peer:' in line:
-                peer_count += 1
-            elif 'transfer:' in line:
-                # 解析传输数据
-                parts = line.split()
-                if len(parts) >= 3:
-                    rx_str = parts[1].replace(',', '')
-                    tx_str = parts[2].replace(',', '')
-                    try:
-                        total_rx += int(rx_str)
-                        total_tx += int(tx_str)
-                    except ValueError:
-                        pass
-
-        return {
-            'status': 'up',
-            'peers': peer_count,
-            'transfer': {
-                'rx': total_rx,
-                'tx': total_tx
-            }
-        }
-
-    except Exception as e:
-        logger.warning(f"获取WireGuard统计失败: {str(e)}")
-        return {'status': 'error', 'peers': 0, 'transfer': {'rx': 0, 'tx': 0}}
+async def get_wireguard_stats():
+    """获取WireGuard接口统计（读取共享的 wg show all dump 快照，字节数为精确整数）"""
+    from app.sync import WG_INTERFACE
+    snapshot = await wireguard_state.snapshot()
+    interface = snapshot.interface(WG_INTERFACE)
+    peers = interface.peers if interface else ()
+    return {
+        'status': snapshot.status(WG_INTERFACE),
+        'peers': len(peers),
+        'online_peers': len(snapshot.online_peers(WG_INTERFACE)),
+        'transfer': {
+            'rx': sum(peer.rx_bytes for peer in peers),
+            'tx': sum(peer.tx_bytes for peer in peers)
+        },
+        'updated_at': datetime.utcfromtimestamp(snapshot.taken_at).isoformat()
+    }
 
 
 def get_process_stats():
@@ -182,31 +142,48 @@ def get_process_stats():
         return {'python_processes': [], 'total_python_processes': 0}
 
 
-@router.get('/system/performance-history')
-def get_performance_history(hours: int = 24, current_user: User = Depends(get_current_user)):
-    """获取性能历史数据"""
-    try:
-        # 这里可以实现历史数据收集和存储
-        # 目前返回实时数据作为示例
-        current_stats = system_stats(current_user)
-
-        # 模拟历史数据（实际应用中应该从数据库或时间序列数据库获取）
-        history_data = {
-            'period': f'{hours} hours',
-            'data_points': 1,
-            'current': current_stats.body.decode() if hasattr(current_stats, 'body') else current_stats,
-            'note': '历史数据功能待实现'
-        }
+def _epoch(moment: datetime) -> float:
+    # 未带时区的时间按 UTC 处理
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
 
-        return JSONResponse(content=history_data)
 
+@router.get('/system/performance-history')
+async def get_performance_history(hours: int = 24, start: datetime = None, end: datetime = None, metrics: str = None,
+                                  max_points: int = None,
+                                  current_user: User = Depends(get_current_user_async)):
+    """获取性能历史数据（列式数组）
+
+    默认最近 hours 小时；也可用 start / end 指定范围。按范围自动选择精度：
+    覆盖起点的最细归档（默认 6 小时内 10 秒、7 天内 1 分钟、更早 1 小时）；
+    指定 max_points 时改用点数不超过该值的最细归档。
+    """
+    try:
+        now = time.time()
+        end_ts = _epoch(end) if end is not None else now
+        start_ts = _epoch(start) if start is not None else end_ts - hours * 3600
+        if start_ts >= end_ts:
+            raise HTTPException(status_code=400, detail="start 必须早于 end")
+        try:
+            history = performance_history.query(
+                start_ts, end_ts, metrics.split(',') if metrics else None, now=now, max_points=max_points
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        history['period'] = f'{hours} hours' if start is None else f'{(end_ts - start_ts) / 3600:g} hours'
+        history['data_points'] = len(history['timestamps'])
+        return JSONResponse(content=history)
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取性能历史时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取性能历史失败")
 
 
 @router.get('/system/health-detailed')
-def detailed_health_check(current_user: User = Depends(get_current_user)):
+async def detailed_health_check(current_user: User = Depends(get_current_user_async), session: AsyncSession = Depends(get_async_db)):
     """详细健康检查"""
     try:
         health_status = {
@@ -217,17 +194,14 @@ def detailed_health_check(current_user: User = Depends(get_current_user)):
 
         # 数据库连接检查
         try:
-            from app.main import SessionLocal
-            session = SessionLocal()
-            session.execute("SELECT 1")
-            session.close()
+            await session.execute(text("SELECT 1"))
             health_status['checks']['database'] = {'status': 'ok', 'message': '数据库连接正常'}
         except Exception as e:
             health_status['checks']['database'] = {'status': 'error', 'message': str(e)}
             health_status['overall'] = 'unhealthy'
 
         # WireGuard服务检查
-        wg_stats = get_wireguard_stats()
+        wg_stats = await get_wireguard_stats()
         if wg_stats['status'] == 'up':
             health_status['checks']['wireguard'] = {'status': 'ok', 'message': 'WireGuard服务正常'}
         else:
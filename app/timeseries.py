@@ -0,0 +1,261 @@
+"""性能历史：内嵌的轮转时间序列存储（RRD 风格）
+
+每个精度一个定长归档（默认 10 秒 × 6 小时、1 分钟 × 7 天、1 小时 × 1 年），
+槽位按时间取模复用，数据用 array 连续存放；同一时间段内的采样取平均值。
+系统资源采样器每次采样后写入全部归档，定期整体写入一个定长文件，重启后继续。
+无论运行多久，内存与磁盘占用都只取决于归档配置。
+
+多 worker 时只有取得文件锁的进程记录并写文件，其他进程查询时读取文件（按修改时间缓存）。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows：不加锁，按单进程处理
+    fcntl = None
+
+from app.config import METRICS_ARCHIVES, METRICS_HISTORY_FLUSH_SECONDS, METRICS_HISTORY_PATH
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WGRRD1\n'
+# 记录的指标（列顺序即文件中的存储顺序）
+METRICS = (
+    'cpu_percent', 'memory_percent', 'disk_percent',
+    'net_sent_per_s', 'net_recv_per_s', 'wg_sent_per_s', 'wg_recv_per_s',
+)
+
+
+def parse_archives(spec: str) -> list:
+    """解析 "精度秒数:槽位数,..."，按精度从细到粗排序"""
+    archives = []
+    for item in spec.split(','):
+        resolution, _, slots = item.strip().partition(':')
+        archives.append((int(resolution), int(slots)))
+    return sorted(archives)
+
+
+def sample_values(sample: dict, interface: str) -> list:
+    """从采样中取出各指标的值；WireGuard 接口不存在时记为 0"""
+    wg = sample['interfaces'].get(interface, {})
+    return [
+        sample['cpu_percent'], sample['memory']['percent'], sample['disk']['percent'],
+        sample['network']['bytes_sent_per_s'], sample['network']['bytes_recv_per_s'],
+        wg.get('bytes_sent_per_s', 0.0), wg.get('bytes_recv_per_s', 0.0),
+    ]
+
+
+class RoundRobinArchive:
+    """单一精度的定长归档：slots 个槽位，每个槽位保存时间段起点、采样次数与各指标之和"""
+
+    def __init__(self, resolution: int, slots: int, width: int):
+        self.resolution = resolution
+        self.slots = slots
+        self.width = width
+        self.buckets = array('q', [-1]) * slots
+        self.counts = array('q', [0]) * slots
+        self.sums = array('d', [0.0]) * (slots * width)
+
+    @property
+    def span(self) -> int:
+        return self.resolution * self.slots
+
+    def add(self, timestamp: float, values):
+        bucket = int(timestamp // self.resolution) * self.resolution
+        index = (bucket // self.resolution) % self.slots
+        base = index * self.width
+        if self.buckets[index] != bucket:
+            # 槽位上是一轮之前的数据：覆盖
+            self.buckets[index] = bucket
+            self.counts[index] = 0
+            for i in range(self.width):
+                self.sums[base + i] = 0.0
+        self.counts[index] += 1
+        for i, value in enumerate(values):
+            self.sums[base + i] += value
+
+    def query(self, start: float, end: float, columns) -> tuple:
+        """返回 (时间段起点列表, {列序号: 平均值列表})，只包含有采样的时间段"""
+        first = max(int(start // self.resolution), int(end // self.resolution) - self.slots + 1)
+        timestamps, values = [], {column: [] for column in columns}
+        for step in range(first, int(end // self.resolution) + 1):
+            bucket = step * self.resolution
+            index = step % self.slots
+            count = self.counts[index]
+            if self.buckets[index] != bucket or not count:
+                continue
+            timestamps.append(bucket)
+            base = index * self.width
+            for column in columns:
+                values[column].append(round(self.sums[base + column] / count, 2))
+        return timestamps, values
+
+    def dump(self, f):
+        self.buckets.tofile(f)
+        self.counts.tofile(f)
+        self.sums.tofile(f)
+
+    def load(self, f):
+        for name in ('buckets', 'counts', 'sums'):
+            data = array(getattr(self, name).typecode)
+            data.fromfile(f, len(getattr(self, name)))
+            setattr(self, name, data)
+
+
+class PerformanceHistory:
+    """性能历史存储：由系统资源采样器写入，按查询范围选择精度"""
+
+    def __init__(self, archives=None, path: str = METRICS_HISTORY_PATH,
+                 flush_interval: float = METRICS_HISTORY_FLUSH_SECONDS, interface: str = None):
+        self.archive_spec = parse_archives(METRICS_ARCHIVES) if archives is None else sorted(archives)
+        self.archives = [RoundRobinArchive(r, s, len(METRICS)) for r, s in self.archive_spec]
+        self.path = path
+        self.flush_interval = flush_interval
+        if interface is None:
+            from app.sync import WG_INTERFACE
+            interface = WG_INTERFACE
+        self.interface = interface
+        self.recorder = True
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._loaded_mtime = None
+        self._last_flush = time.monotonic()
+        self.recorded = 0
+        self.flushes = 0
+
+    def _layout(self) -> bytes:
+        return json.dumps({'metrics': METRICS, 'archives': self.archive_spec}).encode() + b'\n'
+
+    def open(self):
+        """取得文件锁（取不到时本进程只读）并加载已有历史"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if fcntl is not None and self._lock_file is None:
+            self._lock_file = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.recorder = True
+            except OSError:
+                self.recorder = False
+        self.load()
+
+    def close(self):
+        if self.recorder:
+            self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def record(self, sample: dict, now: float = None):
+        """写入一次采样（采样器线程调用）；到达间隔时顺带写文件"""
+        if not self.recorder:
+            return
+        now = time.time() if now is None else now
+        values = sample_values(sample, self.interface)
+        with self._lock:
+            for archive in self.archives:
+                archive.add(now, values)
+            self.recorded += 1
+        if self.path and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把全部归档写入文件（先写临时文件再替换，文件大小固定）"""
+        if not self.path:
+            return
+        self._last_flush = time.monotonic()
+        tmp_path = self.path + '.tmp'
+        try:
+            with self._lock, open(tmp_path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(self._layout())
+                for archive in self.archives:
+                    archive.dump(f)
+            os.replace(tmp_path, self.path)
+            self.flushes += 1
+        except OSError as e:
+            logger.warning(f"写入性能历史失败: {e}")
+
+    def load(self) -> bool:
+        """从文件加载；文件不存在或归档配置已改变时从空历史开始"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                if f.readline() != MAGIC or f.readline() != self._layout():
+                    logger.warning(f"性能历史文件 {self.path} 的格式或归档配置不一致，忽略")
+                    return False
+                # 读完整个文件再替换，文件不完整时保留原有数据
+                archives = [RoundRobinArchive(r, s, len(METRICS)) for r, s in self.archive_spec]
+                for archive in archives:
+                    archive.load(f)
+        except (OSError, EOFError) as e:
+            logger.warning(f"读取性能历史失败: {e}")
+            return False
+        with self._lock:
+            self.archives = archives
+        self._loaded_mtime = mtime
+        return True
+
+    def _refresh(self):
+        """只读进程：文件更新后重新加载"""
+        if self.recorder or not self.path:
+            return
+        try:
+            if os.path.getmtime(self.path) != self._loaded_mtime:
+                self.load()
+        except OSError:
+            pass
+
+    def choose(self, start: float, end: float, now: float, max_points: int = None) -> RoundRobinArchive:
+        """覆盖查询起点、且点数不超过 max_points 的最细精度归档；都不满足时使用最粗的"""
+        for archive in self.archives:
+            if now - start > archive.span:
+                continue
+            if max_points and (end - start) / archive.resolution > max_points:
+                continue
+            return archive
+        return self.archives[-1]
+
+    def query(self, start: float, end: float, metrics=None, now: float = None, max_points: int = None) -> dict:
+        now = time.time() if now is None else now
+        names = list(metrics or METRICS)
+        unknown = set(names) - set(METRICS)
+        if unknown:
+            raise ValueError(f"不支持的指标: {', '.join(sorted(unknown))}")
+        self._refresh()
+        archive = self.choose(start, min(end, now), now, max_points)
+        columns = [METRICS.index(name) for name in names]
+        with self._lock:
+            timestamps, values = archive.query(start, min(end, now), columns)
+        return {
+            'resolution': archive.resolution,
+            'start': int(start),
+            'end': int(min(end, now)),
+            'timestamps': timestamps,
+            'series': {name: values[column] for name, column in zip(names, columns)}
+        }
+
+    def stats(self) -> dict:
+        return {
+            'archives': [{'resolution': r, 'slots': s} for r, s in self.archive_spec],
+            'recorder': self.recorder,
+            'recorded': self.recorded,
+            'flushes': self.flushes,
+            'path': self.path or None,
+            'memory_bytes': sum(
+                a.buckets.itemsize * a.slots * 2 + a.sums.itemsize * len(a.sums) for a in self.archives
+            )
+        }
+
+
+# 全局性能历史实例
+performance_history = PerformanceHistory()
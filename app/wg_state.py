@@ -0,0 +1,191 @@
+"""WireGuard 运行状态快照
+
+后台任务按间隔执行一次 `wg show all dump`，解析为各接口、各节点的结构化快照
+（最近握手时间、收发字节数、endpoint 等）。在线节点数、接口统计、健康检查与实时在线事件
+都读取同一份快照，请求中不再执行 wg 命令；dump 输出的字节数是整数，不需要解析
+"1.5 MiB" 之类的可读格式。快照不保存接口私钥与预共享密钥。
+"""
+import asyncio
+import logging
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+from app.commands import run_async
+from app.config import WG_STATE_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# 最近握手在此秒数内视为在线（10分钟）
+ONLINE_THRESHOLD = 600
+
+
+@dataclass(frozen=True)
+class WgPeerState:
+    public_key: str
+    endpoint: str
+    allowed_ips: tuple
+    latest_handshake: int  # Unix 秒，0 表示从未握手
+    rx_bytes: int
+    tx_bytes: int
+    persistent_keepalive: int  # 秒，0 表示关闭
+
+
+@dataclass(frozen=True)
+class WgInterfaceState:
+    name: str
+    public_key: str
+    listen_port: int
+    peers: tuple = ()
+
+
+@dataclass(frozen=True)
+class WgSnapshot:
+    """一次 wg show all dump 的结果；命令失败时 interfaces 为空并带 error"""
+    taken_at: float
+    interfaces: dict = field(default_factory=dict)
+    error: str = None
+    command_failed: bool = False  # 命令已执行但返回非零（如接口未启动、权限不足）
+
+    def interface(self, name: str):
+        return self.interfaces.get(name)
+
+    def status(self, name: str) -> str:
+        """接口状态：up / down（命令返回失败或接口不存在）/ error（命令无法执行）"""
+        if name in self.interfaces:
+            return 'up'
+        return 'error' if self.error and not self.command_failed else 'down'
+
+    def online_peers(self, name: str, now: float = None, threshold: int = ONLINE_THRESHOLD) -> dict:
+        """在线节点 {公钥: 最近握手时间}"""
+        interface = self.interfaces.get(name)
+        if interface is None:
+            return {}
+        now = time.time() if now is None else now
+        return {
+            peer.public_key: peer.latest_handshake for peer in interface.peers
+            if peer.latest_handshake > 0 and now - peer.latest_handshake <= threshold
+        }
+
+
+def _optional(value: str) -> str:
+    return None if value in ('(none)', '') else value
+
+
+def _number(value: str) -> int:
+    # persistent-keepalive 关闭时为 off
+    return int(value) if value.isdigit() else 0
+
+
+def parse_dump(output: str) -> dict:
+    """解析 wg show all dump：接口行 5 列（名称、私钥、公钥、端口、fwmark），节点行 9 列"""
+    interfaces, peers = {}, {}
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) == 5:
+            name, _private_key, public_key, listen_port, _fwmark = parts
+            interfaces[name] = (public_key, _number(listen_port))
+            peers.setdefault(name, [])
+        elif len(parts) == 9:
+            name, public_key, _psk, endpoint, allowed_ips, handshake, rx, tx, keepalive = parts
+            peers.setdefault(name, []).append(WgPeerState(
+                public_key=public_key,
+                endpoint=_optional(endpoint),
+                allowed_ips=tuple(ip for ip in allowed_ips.split(',') if _optional(ip)),
+                latest_handshake=_number(handshake),
+                rx_bytes=_number(rx),
+                tx_bytes=_number(tx),
+                persistent_keepalive=_number(keepalive)
+            ))
+    return {
+        name: WgInterfaceState(name=name, public_key=public_key, listen_port=port, peers=tuple(peers.get(name, ())))
+        for name, (public_key, port) in interfaces.items()
+    }
+
+
+class WireGuardState:
+    """wg 状态轮询：事件循环中的后台任务，每 interval 秒刷新一次快照并通知 listener
+
+    listener 为 async 函数 listener(snapshot)。轮询任务未运行时（如测试或启动前），
+    读取快照会在快照过期后当场刷新一次。
+    """
+
+    def __init__(self, interval: float = WG_STATE_POLL_INTERVAL):
+        self.interval = interval
+        self.listeners = []
+        self._snapshot = None
+        self._task = None
+        self.polls = 0
+        self.failures = 0
+        self.poll_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.interval <= 0 or self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"刷新 WireGuard 状态失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> WgSnapshot:
+        started = time.perf_counter()
+        try:
+            result = await run_async(['wg', 'show', 'all', 'dump'])
+            if result.returncode != 0:
+                snapshot = WgSnapshot(time.time(), error=result.stderr.decode().strip(), command_failed=True)
+            else:
+                snapshot = WgSnapshot(time.time(), parse_dump(result.stdout.decode()))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            snapshot = WgSnapshot(time.time(), error=str(e))
+        self.polls += 1
+        if snapshot.error:
+            self.failures += 1
+        self.poll_ms = (time.perf_counter() - started) * 1000
+        self._snapshot = snapshot
+        for listener in self.listeners:
+            try:
+                await listener(snapshot)
+            except Exception as e:
+                logger.warning(f"处理 WireGuard 状态失败: {e}")
+        return snapshot
+
+    async def snapshot(self) -> WgSnapshot:
+        """最新快照；轮询任务未运行且快照已过期时当场刷新"""
+        snapshot = self._snapshot
+        if snapshot is None or (not self.running and time.time() - snapshot.taken_at > max(self.interval, 1)):
+            snapshot = await self.refresh()
+        return snapshot
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            'interval_seconds': self.interval,
+            'running': self.running,
+            'polls': self.polls,
+            'failures': self.failures,
+            'poll_ms': round(self.poll_ms, 2),
+            'age_seconds': round(time.time() - snapshot.taken_at, 1) if snapshot else None,
+            'error': snapshot.error if snapshot else None
+        }
+
+
+# 全局 WireGuard 状态实例
+wireguard_state = WireGuardState()
@@ -46,8 +46,8 @@ export const peerAPI = {
     return request.get('/peers/available-ip')
   },
   // 获取 Peer 列表
-  getPeers() {
-    return request.get('/peers')
+  getPeers(params) {
+    return request.get('/peers', { params })
   },
   // 获取 wg 活跃节点数量（10分钟内有握手的节点数）
   getOnlineNodesCount() {
@@ -96,8 +96,8 @@ export const peerAPI = {
 // ACL 相关 API
 export const aclAPI = {
   // 获取 ACL 列表
-  getACLs() {
-    return request.get('/acls')
+  getACLs(params) {
+    return request.get('/acls', { params })
   },
   // 创建 防火墙（支持多类型规则）
   createACL(data) {
@@ -143,6 +143,14 @@ export const activitiesAPI = {
   }
 }
 
+// 实时事件流（SSE）：EventSource 不能设置请求头，先换取一次性票据再通过查询参数传递
+export const eventsAPI = {
+  async open() {
+    const { ticket } = await request.post('/events/ticket')
+    return new EventSource(`/api/events/stream?ticket=${encodeURIComponent(ticket)}`)
+  }
+}
+
 // 批量操作接口
 export const batchAPI = {
   // Peer批量操作
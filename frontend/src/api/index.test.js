@@ -215,4 +215,20 @@ describe('API modules', () => {
       })
     })
   })
+
+  describe('eventsAPI', () => {
+    describe('open', () => {
+      it('should open an EventSource with a one-time ticket in the query string', async () => {
+        const EventSourceMock = vi.fn()
+        vi.stubGlobal('EventSource', EventSourceMock)
+        request.post.mockResolvedValueOnce({ ticket: 'a b', expires_in: 30 })
+
+        await api.eventsAPI.open()
+
+        expect(request.post).toHaveBeenCalledWith('/events/ticket')
+        expect(EventSourceMock).toHaveBeenCalledWith('/api/events/stream?ticket=a%20b')
+        vi.unstubAllGlobals()
+      })
+    })
+  })
 })
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+ACL 热点查询基准测试
+在临时 SQLite 数据库中生成 10 万条 ACL，对比建索引前后各热点查询的耗时
+
+用法: python scripts/benchmark/bench_acl_queries.py [ACL数量]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.models import Base, ACL, Peer, Activity  # noqa: E402
+from app.migrations import migration_0002_query_indexes  # noqa: E402
+
+PEER_COUNT = 2000
+ACTIVITY_COUNT = 100000
+
+
+def populate(engine, acl_count):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(Peer.__table__.insert(), [
+            {
+                "public_key": f"pub{i}", "private_key": "x", "allowed_ips": "",
+                "client_allowed_ips": "0.0.0.0/0", "remark": f"peer-{i}",
+                "status": i % 10 != 0, "peer_ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+                "keepalive": 30, "version": 1
+            } for i in range(1, PEER_COUNT + 1)
+        ])
+        conn.execute(ACL.__table__.insert(), [
+            {
+                "peer_id": (i % PEER_COUNT) + 1 if i % 20 else None,
+                "rule_type": "firewall", "action": rng.choice(["allow", "deny"]),
+                "target": f"172.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32",
+                "port": str(rng.choice(["", "22", "80", "443"])),
+                "protocol": rng.choice(["", "tcp", "udp"]),
+                "direction": rng.choice(["inbound", "outbound", "both"]),
+                "enabled": i % 7 != 0
+            } for i in range(acl_count)
+        ])
+        conn.execute(Activity.__table__.insert(), [
+            {"type": "info", "message": f"activity {i}", "created_at": now - timedelta(minutes=i)}
+            for i in range(ACTIVITY_COUNT)
+        ])
+
+
+def queries(session):
+    sample = session.query(ACL).filter(ACL.id == 50000).first() or session.query(ACL).first()
+    return {
+        "ACL.filter_by(peer_id=N)": lambda: session.query(ACL).filter_by(peer_id=123).all(),
+        "ACL.filter_by(enabled=True)": lambda: session.query(ACL.id).filter_by(enabled=True).count(),
+        "ACL 9 列重复检查": lambda: session.query(ACL).filter_by(
+            rule_type=sample.rule_type, peer_id=sample.peer_id, target=sample.target,
+            destination=None, source_interface=None, destination_interface=None,
+            port=sample.port, protocol=sample.protocol, direction=sample.direction
+        ).first(),
+        "Peer.filter_by(status=True)": lambda: session.query(Peer.id).filter_by(status=True).count(),
+        "Activity 最近20条": lambda: session.query(Activity).order_by(Activity.created_at.desc()).limit(20).all(),
+    }
+
+
+def measure(session, repeat=20):
+    results = {}
+    for name, fn in queries(session).items():
+        fn()  # 预热
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def main():
+    acl_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        engine = create_engine(f"sqlite:///{db_path}")
+        # 先建不含索引的表，模拟迁移前的结构
+        for table in Base.metadata.sorted_tables:
+            indexes = set(table.indexes)
+            table.indexes.clear()
+            table.create(engine, checkfirst=True)
+            table.indexes.update(indexes)
+        print(f"生成测试数据: {PEER_COUNT} 个节点, {acl_count} 条规则, {ACTIVITY_COUNT} 条活动...")
+        populate(engine, acl_count)
+
+        Session = sessionmaker(bind=engine)
+        session = Session()
+        before = measure(session)
+        session.close()
+
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            migration_0002_query_indexes(conn)
+        print(f"建索引耗时: {(time.perf_counter() - start) * 1000:.0f} ms")
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+        session = Session()
+        after = measure(session)
+        session.close()
+
+        print(f"\n{'查询':<32}{'无索引(ms)':>12}{'有索引(ms)':>12}")
+        for name in before:
+            print(f"{name:<32}{before[name]:>12.2f}{after[name]:>12.2f}")
+        engine.dispose()
+    finally:
+        os.unlink(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+活动审计查询基准测试
+在临时数据库中生成约一年的活动记录（默认 200 万条），通过 /activities 接口测量
+按事件类型、操作用户、关联对象、全文搜索过滤的翻页耗时，以及 /backup/status 的耗时
+
+用法: python scripts/benchmark/bench_activity_search.py [活动数量]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ.setdefault('WG_DB_URL', f"sqlite:///{os.path.join(DATA_DIR, 'bench.db')}")
+os.environ.setdefault('WG_DATA_DIR', DATA_DIR)
+
+import httpx  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.activity import record_rollups, rollup_counts  # noqa: E402
+from app.main import app, engine  # noqa: E402
+from app.models import Activity  # noqa: E402
+
+EVENTS = [
+    ('peer.create', 'success', '创建 节点: {name}'),
+    ('peer.update', 'info', '更新 节点: {name}'),
+    ('peer.toggle', 'info', '切换 节点 状态: {name} -> 启用'),
+    ('acl.enable', 'info', '启用 防火墙 规则: {id}'),
+    ('acl.delete', 'warning', '删除 防火墙 规则: {id}'),
+    ('auth.login', 'info', '用户 登录: {actor}'),
+]
+ACTORS = ['admin', 'ci-bot', 'ops', 'alice', 'bob']
+
+
+def populate(count):
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / count
+    batch = []
+    with engine.begin() as conn:
+        for i in range(count):
+            event_type, type_, template = rng.choice(EVENTS)
+            entity_id = rng.randint(1, 5000)
+            actor = rng.choice(ACTORS)
+            batch.append({
+                'type': type_, 'created_at': start + step * i, 'event_type': event_type, 'actor': actor,
+                'entity_type': None if event_type == 'auth.login' else event_type.split('.')[0],
+                'entity_id': entity_id,
+                'message': template.format(name=f"office-{entity_id}", id=entity_id, actor=actor)
+            })
+            if i % 1000 == 999:
+                batch.append({**batch[-1], 'event_type': 'backup.export', 'message': '导出系统配置: 10个节点, 20个规则'})
+            if len(batch) >= 50000:
+                conn.execute(Activity.__table__.insert(), batch)
+                record_rollups(conn, rollup_counts(batch))
+                batch = []
+        if batch:
+            conn.execute(Activity.__table__.insert(), batch)
+            record_rollups(conn, rollup_counts(batch))
+        conn.execute(text("ANALYZE"))
+
+
+async def measure(client, headers, path, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings), max(timings)
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    print(f"生成 {count} 条活动（约一年）...")
+    start = time.perf_counter()
+    populate(count)
+    print(f"写入耗时 {time.perf_counter() - start:.1f} s")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        token = (await client.post('/login', data={'username': 'admin', 'password': os.environ.get('WG_ADMIN_INIT_PWD', 'admin123')})).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        first = (await client.get('/activities?event_type=acl.delete&limit=50', headers=headers)).json()
+        cases = {
+            '事件类型': '/activities?event_type=acl.delete&limit=50',
+            '事件类型（第 2 页）': f"/activities?event_type=acl.delete&limit=50&cursor={first['next_cursor']}",
+            '操作用户': '/activities?actor=ci-bot&limit=50',
+            '关联对象': '/activities?entity_type=peer&entity_id=1234&limit=50',
+            '全文搜索（稀有词）': '/activities?q=office-1234&limit=50',
+            '全文搜索 + 事件类型': '/activities?q=office-42&event_type=peer.update&limit=50',
+            '时间范围': f"/activities?since={(datetime.utcnow() - timedelta(days=200)).isoformat()}&until={(datetime.utcnow() - timedelta(days=199)).isoformat()}&limit=50",
+            '/backup/status': '/backup/status',
+        }
+        print(f"\n{'查询':<24}{'中位数(ms)':>12}{'最大(ms)':>12}")
+        for name, path in cases.items():
+            median, worst = await measure(client, headers, path)
+            print(f"{name:<24}{median:>12.2f}{worst:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+实时事件推送基准测试
+在进程内打开 N 个事件流（与 GET /events/stream 相同的生成器），测量：
+空闲期间（只有心跳）的 CPU 占用，以及发布事件到全部连接收到的延迟
+
+用法: python scripts/benchmark/bench_events.py [连接数] [事件数]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ.setdefault('WG_DB_URL', f"sqlite:///{os.path.join(DATA_DIR, 'bench.db')}")
+os.environ.setdefault('WG_DATA_DIR', DATA_DIR)
+
+from app.config import EVENT_KEEPALIVE_SECONDS  # noqa: E402
+from app.events import _stream, event_broker  # noqa: E402
+
+IDLE_SECONDS = 20
+
+
+async def consume(subscription, received):
+    async for chunk in _stream(subscription, EVENT_KEEPALIVE_SECONDS):
+        if chunk.startswith(b'id:'):
+            received.append(time.perf_counter())
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    received = [[] for _ in range(clients)]
+    tasks = [asyncio.create_task(consume(event_broker.subscribe(), received[i])) for i in range(clients)]
+    await asyncio.sleep(0.1)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.sleep(IDLE_SECONDS)
+    cpu = time.process_time() - cpu_start
+    print(f"{clients} 个连接空闲 {IDLE_SECONDS} s（心跳 {EVENT_KEEPALIVE_SECONDS:g} s）: "
+          f"CPU {cpu * 1000:.1f} ms ({cpu / (time.perf_counter() - wall_start) * 100:.2f}%)")
+
+    latencies = []
+    for _ in range(count):
+        for r in received:
+            r.clear()
+        start = time.perf_counter()
+        event_broker.publish('activity', {'message': 'bench', 'type': 'info'})
+        while any(not r for r in received):
+            await asyncio.sleep(0)
+        latencies.append((max(r[0] for r in received) - start) * 1000)
+    print(f"发布 {count} 个事件到 {clients} 个连接: 全部收到延迟 中位数 {statistics.median(latencies):.2f} ms, "
+          f"最大 {max(latencies):.2f} ms")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"断开后连接数: {event_broker.subscriber_count}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+登录吞吐基准测试
+在临时数据库上并发发起登录请求，统计每秒成功登录数、503 拒绝数，
+以及登录洪峰期间 /health 的响应延迟（验证 bcrypt 不阻塞其他接口）
+
+用法: python scripts/benchmark/bench_login.py [并发数] [请求总数]
+可通过 WG_BCRYPT_ROUNDS / WG_PASSWORD_WORKERS / WG_PASSWORD_QUEUE_SIZE 调整参数
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ.setdefault('WG_DB_URL', f"sqlite:///{os.path.join(DATA_DIR, 'bench.db')}")
+os.environ.setdefault('WG_DATA_DIR', DATA_DIR)
+
+import httpx  # noqa: E402
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_QUEUE_SIZE, PASSWORD_WORKERS  # noqa: E402
+from app.main import app  # noqa: E402
+
+PASSWORD = os.environ.get('WG_ADMIN_INIT_PWD', 'admin123')
+
+
+async def login(client, results):
+    start = time.perf_counter()
+    response = await client.post('/login', data={'username': 'admin', 'password': PASSWORD})
+    results.setdefault(response.status_code, []).append(time.perf_counter() - start)
+
+
+async def probe_health(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get('/health')
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"bcrypt 轮数 {BCRYPT_ROUNDS}, 线程 {PASSWORD_WORKERS}, 排队上限 {PASSWORD_QUEUE_SIZE}, "
+          f"并发 {concurrency}, 请求 {total}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await login(client, {})  # 预热
+        results, latencies = {}, []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, latencies))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                await login(client, results)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[limited() for _ in range(total)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    ok = results.get(200, [])
+    print(f"耗时 {elapsed:.2f} s, 成功 {len(ok)} ({len(ok) / elapsed:.1f} 次/秒), "
+          f"拒绝(503) {len(results.get(503, []))}, 其他 {sum(len(v) for k, v in results.items() if k not in (200, 503))}")
+    if ok:
+        print(f"成功登录延迟: 中位数 {statistics.median(ok) * 1000:.0f} ms, 最大 {max(ok) * 1000:.0f} ms")
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"/health 延迟: 中位数 {statistics.median(latencies):.1f} ms, p99 {p99:.1f} ms ({len(latencies)} 次)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+性能历史存储基准测试
+模拟一年的采样（每 60 秒一次，近 6 小时按每 5 秒一次）写入默认归档，
+测量写入耗时、不同查询范围的耗时与返回点数、内存与文件大小
+
+用法: python scripts/benchmark/bench_performance_history.py
+"""
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ.setdefault('WG_DATA_DIR', DATA_DIR)
+
+from app.timeseries import PerformanceHistory  # noqa: E402
+
+
+def sample(i):
+    return {
+        'cpu_percent': i % 100, 'memory': {'percent': 40.0}, 'disk': {'percent': 20.0},
+        'network': {'bytes_sent_per_s': i * 1.5, 'bytes_recv_per_s': i * 2.5},
+        'interfaces': {'wg0': {'bytes_sent_per_s': 100.0, 'bytes_recv_per_s': 200.0}}
+    }
+
+
+def main():
+    path = os.path.join(DATA_DIR, 'metrics.rrd')
+    history = PerformanceHistory(path=path, interface='wg0')
+    now = time.time()
+    start = now - 365 * 86400
+    points = [start + i * 60 for i in range(int((now - 6 * 3600 - start) // 60))]
+    points += [now - 6 * 3600 + i * 5 for i in range(6 * 3600 // 5)]
+    began = time.perf_counter()
+    for i, moment in enumerate(points):
+        history.record(sample(i), now=moment)
+    elapsed = time.perf_counter() - began
+    print(f"写入 {len(points)} 次采样: {elapsed:.1f} s（每次 {elapsed / len(points) * 1e6:.1f} µs）")
+    history.flush()
+    print(f"内存 {history.stats()['memory_bytes'] / 1024:.0f} KiB, 文件 {os.path.getsize(path) / 1024:.0f} KiB")
+
+    print(f"\n{'范围':<10}{'精度(s)':>8}{'点数':>8}{'中位数(ms)':>12}{'JSON(KiB)':>11}")
+    for label, hours in (('1 小时', 1), ('6 小时', 6), ('24 小时', 24), ('7 天', 168), ('30 天', 720), ('1 年', 8760)):
+        timings = []
+        for _ in range(20):
+            t = time.perf_counter()
+            result = history.query(now - hours * 3600, now, now=now)
+            timings.append((time.perf_counter() - t) * 1000)
+        size = len(json.dumps(result)) / 1024
+        print(f"{label:<10}{result['resolution']:>8}{len(result['timestamps']):>8}"
+              f"{statistics.median(timings):>12.2f}{size:>11.0f}")
+
+    t = time.perf_counter()
+    reloaded = PerformanceHistory(path=path, interface='wg0')
+    reloaded.open()
+    print(f"\n重新加载文件: {(time.perf_counter() - t) * 1000:.1f} ms")
+    reloaded.close()
+
+
+if __name__ == "__main__":
+    main()
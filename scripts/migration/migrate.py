@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+数据库迁移工具：执行版本化迁移（app/migrations.py）
+服务启动时会自动执行迁移，本脚本用于在停机窗口内提前升级或查看当前版本
+运行此脚本前请备份数据库
+
+用法:
+    python scripts/migration/migrate.py            # 升级到最新版本
+    python scripts/migration/migrate.py --status   # 仅查看当前版本
+数据库位置由 WG_DB_URL（或 WG_DATA_DIR）决定，也可使用 --db 指定 SQLite 文件
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WireGuard ACL 数据库迁移工具")
+    parser.add_argument('--db', help="SQLite 数据库文件路径（默认使用 WG_DB_URL）")
+    parser.add_argument('--status', action='store_true', help="仅显示当前结构版本")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from app.db import build_engine, describe_engine
+    from app.config import DB_URL
+    from app.migrations import run_migrations, LATEST_VERSION, read_schema_version
+
+    engine = build_engine(f"sqlite:///{os.path.abspath(args.db)}" if args.db else DB_URL)
+    print(f"数据库: {describe_engine(engine)}")
+    current = read_schema_version(engine)
+    print(f"当前版本: {'未记录' if current is None else current}，最新版本: {LATEST_VERSION}")
+    if args.status:
+        return 0
+
+    try:
+        version = run_migrations(engine)
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        print("所有更改已回滚，请检查错误信息。")
+        return 1
+    print(f"\n✅ 迁移完成，当前版本: {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
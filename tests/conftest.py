@@ -92,4 +92,77 @@ def setup_test_data(db_session):
         admin_user = User(username="admin", password_hash=hash_password("admin123"))
         db_session.add(admin_user)
         db_session.commit()
-        db_session.refresh(admin_user)
\ No newline at end of file
+        db_session.refresh(admin_user)
+
+@pytest.fixture
+def api_engine(tmp_path):
+    """API 测试用的临时 SQLite 数据库（同步与异步引擎指向同一文件）"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    db_path = tmp_path / 'api.db'
+    sync_engine = create_engine(f'sqlite:///{db_path}', connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=sync_engine)
+    async_engine = create_async_engine(f'sqlite+aiosqlite:///{db_path}')
+    yield sync_engine, async_engine
+    sync_engine.dispose()
+    async_engine.sync_engine.dispose()
+
+
+@pytest.fixture
+def api_client(api_engine, monkeypatch):
+    """请求级会话依赖、活动日志写入与后台组件的会话替换为临时数据库的测试客户端；不触发启动事件，WireGuard 同步视为成功"""
+    from fastapi.testclient import TestClient
+    from app import activity, api_tokens, sync
+    from app import main as app_main
+    from app.db import AsyncSessionLocal, SessionLocal as RequestSession, get_async_db, get_db
+    from app.main import app as api
+    sync_engine, async_engine = api_engine
+
+    def override_db():
+        session = RequestSession(bind=sync_engine)
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def override_async_db():
+        async with AsyncSessionLocal(bind=async_engine) as session:
+            yield session
+
+    monkeypatch.setattr(sync, 'sync_acl_and_wireguard', lambda *args, **kwargs: True)
+    monkeypatch.setattr(activity.activity_writer, '_session_factory', lambda: RequestSession(bind=sync_engine))
+    # 密钥管理等后台组件按 app.main.SessionLocal 取会话，同样指向临时数据库
+    monkeypatch.setattr(app_main, 'SessionLocal', sessionmaker(bind=sync_engine))
+    monkeypatch.setattr(api_tokens, '_pepper', b'test-pepper')
+    api_tokens.api_token_cache.clear()
+    api.dependency_overrides[get_db] = override_db
+    api.dependency_overrides[get_async_db] = override_async_db
+    try:
+        yield TestClient(api)
+    finally:
+        # 活动日志写入临时数据库，关闭前写完队列
+        activity.activity_writer.flush()
+        api.dependency_overrides.clear()
+        api_tokens.api_token_cache.clear()
+
+
+@pytest.fixture
+def api_token(api_engine, api_client):
+    """在临时数据库中创建用户并签发指定权限的 API 令牌，返回请求头"""
+    from app.api_tokens import create_api_token
+    from app.models import User
+    from app.db import SessionLocal as RequestSession
+
+    def issue(*scopes):
+        session = RequestSession(bind=api_engine[0])
+        try:
+            user = session.query(User).filter_by(username='robot').first()
+            if user is None:
+                user = User(username='robot', password_hash='x')
+                session.add(user)
+                session.flush()
+            _, token = create_api_token(session, user.id, 'test', scopes)
+            session.commit()
+        finally:
+            session.close()
+        return {"Authorization": f"Bearer {token}"}
+    return issue
@@ -0,0 +1,116 @@
+from app.db import SessionLocal
+from app.models import ACL
+
+
+def _acls(api_engine):
+    session = SessionLocal(bind=api_engine[0])
+    try:
+        return [(a.peer_id, a.target, a.action) for a in session.query(ACL).order_by(ACL.id)]
+    finally:
+        session.close()
+
+
+class TestCreateACL:
+    """单条 ACL 创建接口测试"""
+
+    def test_create_then_update_message(self, api_client, api_token, api_engine):
+        """测试相同规则再次提交时返回 updated 并覆盖 action"""
+        headers = api_token('acls:write')
+        rule = {"action": "allow", "target": "10.1.0.0/16", "port": "443", "protocol": "tcp"}
+        assert api_client.post("/acls", json=rule, headers=headers).json()["msg"] == "ACL created"
+        response = api_client.post("/acls", json={**rule, "action": "deny"}, headers=headers)
+        assert response.json()["msg"] == "ACL updated"
+        assert _acls(api_engine) == [(None, "10.1.0.0/16", "deny")]
+
+    def test_minimal_global_rule_shares_identity(self, api_client, api_token, api_engine):
+        """测试 /acls/create 的全局规则存为 NULL，与 POST /acls 写入的同一规则按 upsert 覆盖"""
+        headers = api_token('acls:write')
+        response = api_client.post("/acls", json={"action": "allow", "target": "10.2.0.0/16"}, headers=headers)
+        assert response.json()["msg"] == "ACL created"
+        response = api_client.post("/acls/create", json={"peer_id": -1, "action": "deny", "target": "10.2.0.0/16"}, headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {"msg": "ACL updated"}
+        response = api_client.post("/acls/create", json={"peer_id": -1, "action": "allow", "target": "10.3.0.0/16"}, headers=headers)
+        assert response.json() == {"msg": "ACL created"}
+        assert _acls(api_engine) == [(None, "10.2.0.0/16", "deny"), (None, "10.3.0.0/16", "allow")]
+
+
+class TestBatchACL:
+    """批量 ACL 接口测试"""
+
+    def _add_peer(self, api_engine):
+        from app.models import Peer
+        session = SessionLocal(bind=api_engine[0])
+        try:
+            peer = Peer(public_key='pk', private_key='x', allowed_ips='10.0.0.2/32', peer_ip='10.0.0.2')
+            session.add(peer)
+            session.commit()
+            return peer.id
+        finally:
+            session.close()
+
+    def test_upsert_returns_ids(self, api_engine):
+        """测试 executemany upsert 对新增与已存在的规则都返回 id（含全局规则）"""
+        from app.acl import normalize_batch_acl, upsert_acls
+        session = SessionLocal(bind=api_engine[0])
+        try:
+            rows = [normalize_batch_acl({"action": "allow", "target": f"10.0.{i}.0/24"}) for i in range(3)]
+            assert upsert_acls(session, rows) == [1, 2, 3]
+            session.commit()
+            rows[1]["action"] = "deny"
+            rows.append(normalize_batch_acl({"action": "allow", "target": "10.0.9.0/24"}))
+            assert upsert_acls(session, rows[1:]) == [2, 3, 4]
+            session.commit()
+        finally:
+            session.close()
+        assert [action for _, _, action in _acls(api_engine)] == ["allow", "deny", "allow", "allow"]
+
+    def test_batch_create(self, api_client, api_token, api_engine):
+        """测试批量创建：新增与更新、全局规则、批内重复标识与失败计数"""
+        headers = api_token('acls:write')
+        peer_id = self._add_peer(api_engine)
+        api_client.post("/acls", json={"peer_id": peer_id, "action": "allow", "target": "10.1.0.0/16"}, headers=headers)
+
+        response = api_client.post("/acls/batch", json={"acls": [
+            {"peer_id": peer_id, "action": "deny", "target": "10.1.0.0/16"},
+            {"action": "allow", "target": "10.2.0.0/16"},
+            {"peer_id": None, "action": "allow", "target": "10.3.0.0/16"},
+            {"action": "deny", "target": "10.2.0.0/16"},
+            {"peer_id": 999, "action": "allow", "target": "10.4.0.0/16"},
+            {"action": "drop", "target": "10.5.0.0/16"},
+        ]}, headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["msg"] == "批量创建完成: 成功4, 失败2"
+        assert [(r["index"], r["success"], r.get("message")) for r in data["results"]] == [
+            (0, True, "ACL updated"),
+            (1, True, "ACL created"),
+            (2, True, "ACL created"),
+            (3, True, "ACL updated"),
+            (4, False, None),
+            (5, False, None),
+        ]
+        # 未指定 peer_id 的为全局规则；批内重复标识以最后一条为准
+        assert _acls(api_engine) == [
+            (peer_id, "10.1.0.0/16", "deny"),
+            (None, "10.2.0.0/16", "deny"),
+            (None, "10.3.0.0/16", "allow"),
+        ]
+
+    def test_batch_toggle_and_delete(self, api_client, api_token, api_engine):
+        """测试批量切换与删除返回实际受影响的 id 与数量，忽略不存在与重复的 id"""
+        headers = api_token('acls:write')
+        api_client.post("/acls/batch", json={"acls": [
+            {"action": "allow", "target": f"10.{i}.0.0/16"} for i in range(3)
+        ]}, headers=headers)
+
+        data = api_client.post("/acls/batch-toggle", json=[1, 3, 3, 99], headers=headers).json()
+        assert (data["updated_count"], data["updated_ids"]) == (2, [1, 3])
+        data = api_client.request("DELETE", "/acls/batch", json=[2, 3, 99], headers=headers).json()
+        assert (data["deleted_count"], data["deleted_ids"]) == (2, [2, 3])
+
+        session = SessionLocal(bind=api_engine[0])
+        try:
+            assert [(a.id, a.enabled) for a in session.query(ACL)] == [(1, False)]
+        finally:
+            session.close()
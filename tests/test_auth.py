@@ -0,0 +1,198 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app import api_tokens, auth
+from app.auth import Principal, UserCache, create_access_token, create_user_token, get_current_user, user_cache
+from app.models import Base, User
+
+
+class TestUserCache:
+    """认证用户缓存测试"""
+
+    def test_ttl_and_stats(self):
+        """测试缓存过期与命中率统计"""
+        cache = UserCache(max_entries=2, ttl=60)
+        cache.set(Principal(id=1, username='admin', token_version=1))
+        assert cache.get('admin').id == 1
+        assert cache.get('other') is None
+        assert cache.stats()['hit_ratio'] == 0.5
+        cache.invalidate('admin')
+        assert cache.get('admin') is None
+        expired = UserCache(ttl=-1)
+        expired.set(Principal(id=1, username='admin', token_version=1))
+        assert expired.get('admin') is None
+
+
+class TestCurrentUser:
+    """认证依赖测试"""
+
+    def setup_method(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.user = User(username='admin', password_hash='x')
+        self.session.add(self.user)
+        self.session.commit()
+        self.token = create_user_token(self.user)
+        self.queries = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        user_cache.clear()
+
+    def teardown_method(self):
+        self.session.close()
+        self.engine.dispose()
+        user_cache.clear()
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def test_cached_principal_skips_database(self):
+        """测试命中缓存时不查询数据库，修改用户后缓存失效"""
+        assert get_current_user(self.token, self.session).username == 'admin'
+        assert get_current_user(self.token, self.session).username == 'admin'
+        assert self.queries == 1
+        self.user.password_hash = 'y'
+        self.session.commit()
+        assert user_cache.peek('admin') is None
+
+    def test_token_version_revokes_old_tokens(self):
+        """测试令牌版本递增后旧令牌失效，不含版本的旧格式令牌仍可使用"""
+        old_token = self.token
+        legacy_token = create_access_token(data={"sub": "admin"})
+        self.user.token_version += 1
+        self.session.commit()
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(old_token, self.session)
+        assert exc.value.status_code == 401
+        assert get_current_user(create_user_token(self.user), self.session).token_version == 2
+        assert get_current_user(legacy_token, self.session).username == 'admin'
+
+    def test_trust_claims(self, monkeypatch):
+        """测试信任签名声明时完全不查询数据库"""
+        monkeypatch.setattr(auth, 'AUTH_TRUST_CLAIMS', True)
+        principal = get_current_user(self.token, self.session)
+        assert self.queries == 0
+        assert principal == Principal(id=self.user.id, username='admin', token_version=1)
+
+
+class TestPasswordPool:
+    """测试密码哈希线程池"""
+
+    def test_rejects_when_saturated(self):
+        """测试执行与排队名额用尽时立即返回 503，任务结束后名额恢复"""
+        import threading
+        pool = auth.PasswordPool(workers=1, queue_size=1)
+        gate = threading.Event()
+        futures = [pool.submit(gate.wait), pool.submit(gate.wait)]
+        with pytest.raises(HTTPException) as exc:
+            pool.submit(gate.wait)
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "1"
+        assert pool.rejected == 1
+        gate.set()
+        for future in futures:
+            future.result()
+        assert pool.call(lambda: 42) == 42
+
+    def test_rehash_on_cost_change(self):
+        """测试轮数与配置不同的哈希在验证时返回新哈希"""
+        from passlib.context import CryptContext
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+        context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+        valid, new_hash = context.verify_and_update("secret", old_hash)
+        assert valid and new_hash and "$05$" in new_hash
+        assert context.verify_and_update("secret", new_hash) == (True, None)
+        assert context.verify_and_update("wrong", old_hash) == (False, None)
+
+
+class TestApiTokens:
+    """API 令牌测试"""
+
+    def setup_method(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.user = User(username='robot', password_hash='x')
+        self.session.add(self.user)
+        self.session.commit()
+        self.queries = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        api_tokens.api_token_cache.clear()
+
+    def teardown_method(self):
+        self.session.close()
+        self.engine.dispose()
+        api_tokens.api_token_cache.clear()
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def test_required_scope(self):
+        """测试按方法与路径确定所需权限"""
+        assert api_tokens.required_scope('GET', '/peers') == 'read'
+        assert api_tokens.required_scope('POST', '/peers/batch') == 'peers:write'
+        assert api_tokens.required_scope('PUT', '/acls/3') == 'acls:write'
+        assert api_tokens.required_scope('GET', '/backup/export') == 'admin'
+        assert api_tokens.required_scope('PUT', '/system/settings') == 'admin'
+        assert api_tokens.scope_allows(('peers:write',), 'read')
+        assert not api_tokens.scope_allows(('peers:write',), 'acls:write')
+        assert api_tokens.scope_allows(('admin',), 'acls:write')
+
+    def test_required_scope_for_private_key_paths(self):
+        """测试返回客户端私钥的导出、配置与二维码接口不只需要 read 权限"""
+        assert api_tokens.required_scope('GET', '/peers/export') == 'admin'
+        assert api_tokens.required_scope('GET', '/peers/3/config') == 'peers:write'
+        assert api_tokens.required_scope('GET', '/peers/3/config/qrcode') == 'peers:write'
+        assert api_tokens.required_scope('GET', '/peers/3') == 'read'
+
+    def test_verify_cached_and_usage_batched(self, monkeypatch):
+        """测试验证结果缓存后不查询数据库，使用时间批量写回，吊销后立即失效"""
+        monkeypatch.setattr(api_tokens, '_pepper', b'test-pepper')
+        usage = api_tokens.ApiTokenUsage(interval=3600, session_factory=self.Session)
+        monkeypatch.setattr(api_tokens, 'api_token_usage', usage)
+        record, token = api_tokens.create_api_token(self.session, self.user.id, 'ci', ['peers:write', 'read'])
+        self.session.commit()
+        assert record.scopes == 'read,peers:write'
+
+        self.queries = 0
+        for _ in range(3):
+            principal = get_current_user(token, self.session)
+        assert self.queries == 1
+        assert principal == Principal(id=self.user.id, username='robot', token_version=0, scopes=('read', 'peers:write'))
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(token[:-1] + ('A' if token[-1] != 'A' else 'B'), self.session)
+        assert exc.value.status_code == 401
+
+        assert record.last_used_at is None
+        assert usage.flush() == 1
+        self.session.refresh(record)
+        assert record.last_used_at is not None
+
+        self.session.delete(record)
+        self.session.commit()
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(token, self.session)
+        assert exc.value.status_code == 401
+
+
+class TestApiTokenScopes:
+    """API 令牌权限范围接口测试"""
+
+    @pytest.mark.parametrize('path', ['/peers/export', '/peers/1/config', '/peers/1/config/qrcode'])
+    def test_read_token_cannot_fetch_private_keys(self, api_client, api_token, path):
+        """测试 read 令牌访问含私钥的接口返回 403，写权限令牌按各自范围放行"""
+        assert api_client.get(path, headers=api_token('read')).status_code == 403
+        if path != '/peers/export':
+            # 通过权限检查后因节点不存在返回 404
+            assert api_client.get(path, headers=api_token('peers:write')).status_code == 404
+        else:
+            assert api_client.get(path, headers=api_token('peers:write')).status_code == 403
+
+    def test_activities_requires_authentication(self, api_client, api_token):
+        """测试活动日志查询与搜索需要认证，read 令牌即可访问"""
+        assert api_client.get('/activities', params={'q': 'login'}).status_code == 401
+        response = api_client.get('/activities', params={'q': 'login'}, headers=api_token('read'))
+        assert response.status_code == 200
+        assert response.json()['items'] == []
@@ -0,0 +1,175 @@
+import pytest
+from app.cache import LRUCache, make_etag, etag_matches
+from app import client_config
+
+
+class TestLRUCache:
+    """LRU缓存测试"""
+
+    def test_evicts_least_recently_used(self):
+        """测试超过容量时淘汰最久未使用的条目"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+
+        assert 'b' not in cache
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_stats(self):
+        """测试命中率统计"""
+        cache = LRUCache(max_entries=4)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('missing')
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+    def test_evicts_by_total_bytes(self):
+        """测试超过字节上限时淘汰旧条目"""
+        cache = LRUCache(max_entries=10, max_bytes=10)
+        cache.set('a', b'12345')
+        cache.set('b', b'12345')
+        cache.set('c', b'123')
+
+        assert 'a' not in cache
+        assert cache.stats()['bytes'] == 8
+        cache.set('huge', b'x' * 11)
+        assert 'huge' not in cache
+
+    def test_zero_capacity_disables_cache(self):
+        """测试容量为0时不缓存"""
+        cache = LRUCache(max_entries=0)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+
+class TestETag:
+    """ETag工具测试"""
+
+    def test_strong_etag_is_stable(self):
+        """测试相同内容生成相同的强ETag"""
+        assert make_etag("config") == make_etag("config")
+        assert make_etag("config") != make_etag("other")
+        assert not make_etag("config").startswith('W/')
+
+    def test_etag_matches(self):
+        """测试If-None-Match匹配"""
+        etag = make_etag("config")
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", {etag}', etag)
+        assert etag_matches(f'W/{etag}', etag)
+        assert etag_matches('*', etag)
+        assert not etag_matches(None, etag)
+        assert not etag_matches('"other"', etag)
+
+
+class TestClientConfigCache:
+    """客户端配置缓存测试"""
+
+    def test_version_mismatch_misses(self):
+        """测试Peer版本或相关设置变化后缓存失效"""
+        version = client_config.cache_version(1, 1)
+        client_config.store_config(42, version, "[Interface]")
+        assert client_config.get_cached_config(42, version).config == "[Interface]"
+
+        assert client_config.get_cached_config(42, client_config.cache_version(2, 1)) is None
+
+        client_config._on_settings_changed({'unrelated'})
+        assert client_config.get_cached_config(42, client_config.cache_version(1, 1)) is not None
+        client_config._on_settings_changed({'global_endpoint'})
+        assert client_config.get_cached_config(42, client_config.cache_version(1, 1)) is None
+
+    def test_settings_changed_elsewhere_misses(self, test_db, monkeypatch):
+        """测试绕过设置服务直接写库的修改在刷新后使缓存失效"""
+        from app.models import SystemSetting
+        from app.settings_service import SettingsService
+        session = test_db()
+        session.query(SystemSetting).delete()
+        session.commit()
+        service = SettingsService(refresh_seconds=0, session_factory=test_db)
+        service.subscribe(client_config._on_settings_changed)
+        monkeypatch.setattr(client_config, 'settings_service', service)
+        try:
+            version = client_config.cache_version(1, 1)
+            client_config.store_config(45, version, "[Interface]")
+            assert client_config.get_cached_config(45, client_config.cache_version(1, 1)) is not None
+
+            session.add(SystemSetting(key='global_endpoint', value='other.example.com:51820'))
+            session.commit()
+            assert client_config.get_cached_config(45, client_config.cache_version(1, 1)) is None
+        finally:
+            session.query(SystemSetting).delete()
+            session.commit()
+            session.close()
+
+    def test_invalidate_peer(self):
+        """测试删除Peer时清除缓存"""
+        version = client_config.cache_version(1, 1)
+        client_config.store_config(43, version, "[Interface]")
+        client_config.invalidate_peer(43)
+        assert client_config.get_cached_config(43, version) is None
+
+    def test_qrcode_cached_by_fingerprint(self, monkeypatch):
+        """测试二维码按配置指纹缓存，SVG与PNG分别缓存"""
+        calls = []
+        original = client_config.make_qrcode
+        monkeypatch.setattr(client_config, 'make_qrcode',
+                            lambda config, fmt='png': calls.append(fmt) or original(config, fmt))
+        rendered = client_config.store_config(44, client_config.cache_version(1, 1), "[Interface]\nAddress = 10.0.0.2/32")
+
+        svg = client_config.render_qrcode(rendered, 'svg')
+        assert svg.startswith(b'<?xml')
+        assert client_config.render_qrcode(rendered, 'svg') == svg
+        assert calls == ['svg']
+        assert client_config.qrcode_etag(rendered, 'svg') != client_config.qrcode_etag(rendered, 'png')
+
+        with pytest.raises(ValueError):
+            client_config.render_qrcode(rendered, 'gif')
+
+
+class TestTableGenerations:
+    """表代数（列表 ETag）测试"""
+
+    def test_writes_bump_generation_on_commit(self):
+        """测试受跟踪表的写入在提交后递增代数，回滚不生效"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.generations import GenerationStore, generation_store, track_generations
+        from app.models import Base, Activity, TableGeneration
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        track_generations(engine)
+        generation_store.clear()
+        session = sessionmaker(bind=engine)()
+        try:
+            session.add(Activity(type='info', message='a'))
+            session.commit()
+            assert generation_store.cached(['activities']) == {'activities': 1}
+            session.add(Activity(type='info', message='b'))
+            session.flush()
+            session.rollback()
+            assert generation_store.cached(['activities']) == {'activities': 1}
+            # 其他 worker 视角：无缓存时从数据库读取
+            assert GenerationStore().get(session, ['activities', 'peers']) == {'activities': 1, 'peers': 0}
+            assert session.get(TableGeneration, 'activities').generation == 1
+        finally:
+            session.close()
+            engine.dispose()
+            generation_store.clear()
+
+    def test_store_is_monotonic_and_expires(self):
+        """测试缓存代数只增不减，过期后需重新读取"""
+        from app.generations import GenerationStore
+        store = GenerationStore(ttl=60)
+        store.store({'peers': 5})
+        store.store({'peers': 3})
+        assert store.cached(['peers']) == {'peers': 5}
+        assert store.cached(['peers', 'acls']) is None
+        assert GenerationStore(ttl=-1).cached(['peers']) is None
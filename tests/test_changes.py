@@ -0,0 +1,113 @@
+from sqlalchemy import create_engine, select
+from app.changes import compact_change_log, record_changes
+from app.db import SessionLocal
+from app.models import Base, ChangeLog, Peer
+
+
+class TestChangeLog:
+    """增量同步变更记录测试"""
+
+    def setup_method(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+
+    def teardown_method(self):
+        self.engine.dispose()
+
+    def _log(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op).order_by(ChangeLog.id)
+            ).all()
+
+    def test_flush_records_changes(self):
+        """测试会话 flush 自动记录新增、修改与删除，回滚时不记录"""
+        session = SessionLocal(bind=self.engine)
+        try:
+            peer = Peer(public_key='pk', private_key='x', allowed_ips='', peer_ip='10.0.0.2')
+            session.add(peer)
+            session.commit()
+            peer.remark = 'office'
+            session.commit()
+            session.delete(peer)
+            session.commit()
+            session.add(Peer(public_key='pk2', private_key='x', allowed_ips='', peer_ip='10.0.0.3'))
+            session.flush()
+            session.rollback()
+        finally:
+            session.close()
+        assert [(e, i, op) for _, e, i, op in self._log()] == [
+            ('peer', 1, 'created'), ('peer', 1, 'updated'), ('peer', 1, 'deleted')
+        ]
+
+    def test_compaction_keeps_latest_entries(self):
+        """测试压缩只保留最新的记录，版本号不复用"""
+        with self.engine.begin() as conn:
+            record_changes(conn, [('acl', i, 'created') for i in range(10)])
+            assert compact_change_log(conn, keep=3) == 7
+            assert compact_change_log(conn, keep=3) == 0
+            record_changes(conn, [('acl', 99, 'deleted')])
+        assert [row.id for row in self._log()] == [8, 9, 10, 11]
+
+    def test_set_based_batch_operations(self):
+        """测试批量切换/删除使用分块的集合语句，返回受影响的 id 并记录变更"""
+        from app.acl import delete_acls, delete_peer_acls, toggle_acls
+        from app.db import chunked
+        from app.models import ACL
+        assert list(chunked([3, 1, 3, 2, 5], size=2)) == [[3, 1], [2, 5]]
+        with self.engine.begin() as conn:
+            conn.execute(ACL.__table__.insert(), [
+                {'peer_id': i % 2 + 1, 'action': 'allow', 'target': f'10.0.{i}.0/24', 'enabled': True}
+                for i in range(5)
+            ])
+        session = SessionLocal(bind=self.engine)
+        try:
+            assert toggle_acls(session, [1, 2, 3, 99]) == [1, 2, 3]
+            assert delete_acls(session, [3]) == [3]
+            assert sorted(delete_peer_acls(session, [2])) == [2, 4]
+            session.commit()
+            assert [(a.id, a.enabled) for a in session.query(ACL).order_by(ACL.id)] == [(1, False), (5, True)]
+        finally:
+            session.close()
+        assert [(i, op) for _, _, i, op in self._log()] == [
+            (1, 'updated'), (2, 'updated'), (3, 'updated'), (3, 'deleted'), (2, 'deleted'), (4, 'deleted')
+        ]
+
+    def test_upsert_records_created_and_updated(self):
+        """测试 upsert 按预取的规则标识分别记录新增与更新"""
+        from app.acl import normalize_batch_acl, upsert_acls
+        session = SessionLocal(bind=self.engine)
+        try:
+            assert upsert_acls(session, [normalize_batch_acl({"action": "allow", "target": "10.0.1.0/24"})]) == [1]
+            session.commit()
+            rows = [
+                normalize_batch_acl({"action": "deny", "target": "10.0.1.0/24"}),
+                normalize_batch_acl({"action": "allow", "target": "10.0.2.0/24"}),
+            ]
+            assert upsert_acls(session, rows) == [1, 2]
+            session.commit()
+        finally:
+            session.close()
+        assert [(e, i, op) for _, e, i, op in self._log()] == [
+            ('acl', 1, 'created'), ('acl', 1, 'updated'), ('acl', 2, 'created')
+        ]
+
+    def test_async_session_records_changes(self, tmp_path):
+        """测试异步会话的 flush 同样记录变更"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from app.db import AsyncSessionLocal
+        db_path = tmp_path / 'changes.db'
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+
+        async def run():
+            async with AsyncSessionLocal(bind=async_engine) as session:
+                session.add(Peer(public_key='pk', private_key='x', allowed_ips='', peer_ip='10.0.0.2'))
+                await session.commit()
+            await async_engine.dispose()
+        asyncio.run(run())
+        with engine.connect() as conn:
+            assert conn.execute(select(ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)).all() == [('peer', 1, 'created')]
+        engine.dispose()
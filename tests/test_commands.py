@@ -0,0 +1,35 @@
+import asyncio
+import subprocess
+import sys
+import pytest
+from app.commands import run, check_output, run_async, check_output_async
+
+
+class TestCommands:
+    """外部命令执行测试"""
+
+    def test_run_captures_output(self):
+        """测试同步执行并捕获输出"""
+        assert check_output([sys.executable, "-c", "print('ok')"]).strip() == b"ok"
+        assert run([sys.executable, "-c", "import sys; sys.exit(3)"]).returncode == 3
+
+    def test_run_timeout(self):
+        """测试同步执行超时"""
+        with pytest.raises(subprocess.TimeoutExpired):
+            run([sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.2)
+
+    def test_run_async_with_input(self):
+        """测试异步执行并传入标准输入"""
+        script = "import sys; print(sys.stdin.read().upper())"
+        output = asyncio.run(check_output_async([sys.executable, "-c", script], input=b"wg"))
+        assert output.strip() == b"WG"
+
+    def test_run_async_failure(self):
+        """测试异步执行返回非零时 check 抛出异常"""
+        with pytest.raises(subprocess.CalledProcessError):
+            asyncio.run(run_async([sys.executable, "-c", "import sys; sys.exit(1)"], check=True))
+
+    def test_run_async_timeout_kills_process(self):
+        """测试异步执行超时后终止子进程"""
+        with pytest.raises(subprocess.TimeoutExpired):
+            asyncio.run(run_async([sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.2))
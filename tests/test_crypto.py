@@ -128,4 +128,69 @@ class TestKeyManagement:
 
         # 测试解密无效数据
         with pytest.raises(Exception):
-            decrypt_private_key("invalid_encrypted_data")
\ No newline at end of file
+            decrypt_private_key("invalid_encrypted_data")
+
+class TestJWTKeyManager:
+    """JWT 密钥管理器缓存与轮换测试"""
+
+    def setup_method(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from app.generations import generation_store, track_generations
+        from app.models import Base
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        track_generations(self.engine)
+        generation_store.clear()
+        self.Session = sessionmaker(bind=self.engine)
+        self.queries = 0
+
+    def teardown_method(self):
+        from app.generations import generation_store
+        self.engine.dispose()
+        generation_store.clear()
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def test_keys_cached_until_other_worker_rotates(self):
+        """测试密钥缓存在内存中，其他 worker 轮换后通过代数变化重新加载"""
+        from jose import jwt
+        from sqlalchemy import event
+        from app.generations import generation_store
+        from app.key_manager import KeyManager
+        from app.models import AppSecret
+        manager = KeyManager(session_factory=self.Session)
+        key = manager.get_current_key()
+        token = jwt.encode({"sub": "admin"}, key, algorithm="HS256")
+
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        for _ in range(10):
+            assert manager.decode(token)["sub"] == "admin"
+        assert self.queries == 0
+
+        # 另一个 worker 发现密钥过期并轮换
+        session = self.Session()
+        session.query(AppSecret).filter_by(name='JWT_KEY_TIMESTAMP').update({'value': '2000-01-01T00:00:00'})
+        session.commit()
+        session.close()
+        other = KeyManager(session_factory=self.Session)
+        new_key, previous_key = other.get_keys()
+        assert previous_key == key and new_key != key
+
+        generation_store.clear()  # 模拟本地代数缓存过期
+        assert manager.get_keys() == (new_key, key)
+        # 轮换过渡期内旧令牌仍可验证
+        assert manager.validate_token_with_previous(token) == (True, "admin")
+        assert manager.validate_token_with_previous("invalid") == (False, None)
+
+    def test_refresh_gives_up_when_key_cannot_be_stored(self, monkeypatch):
+        """测试密钥无法写入时有限次重试后报错，而不是无限递归"""
+        from app.key_manager import KEY_REFRESH_ATTEMPTS, KeyManager
+        manager = KeyManager(session_factory=self.Session)
+        calls = []
+        monkeypatch.setattr(manager, '_generate_new_key', lambda session: calls.append(1))
+        with pytest.raises(RuntimeError):
+            manager.get_current_key()
+        assert len(calls) == KEY_REFRESH_ATTEMPTS
@@ -0,0 +1,169 @@
+import os
+import tempfile
+from sqlalchemy import text
+from app.db import build_engine
+
+
+class TestDatabaseEngine:
+    """数据库引擎配置测试"""
+
+    def test_sqlite_file_pragmas(self):
+        """测试SQLite文件数据库启用WAL等参数"""
+        db_dir = tempfile.mkdtemp()
+        engine = build_engine(f"sqlite:///{os.path.join(db_dir, 'sub', 'test.db')}")
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+        engine.dispose()
+
+    def test_sqlite_memory_skips_wal(self):
+        """测试内存数据库不设置WAL"""
+        engine = build_engine("sqlite:///:memory:")
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == 'memory'
+        engine.dispose()
+
+    def test_async_fallback_to_threaded_session(self):
+        """测试没有异步驱动的数据库不在导入时报错，异步接口改用线程池中的同步会话"""
+        import asyncio
+        from sqlalchemy import create_engine, select
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from app.db import build_async_engine, threaded_sessionmaker
+        from app.models import Base, Peer
+        assert build_async_engine("mysql://user:pw@localhost/wg") is None
+
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        factory = threaded_sessionmaker(sessionmaker(bind=engine, expire_on_commit=False))
+
+        async def run():
+            async with factory() as session:
+                assert session.bind.dialect.name == 'sqlite'
+                session.add(Peer(public_key='pk', private_key='x', allowed_ips='', peer_ip='10.0.0.2'))
+                await session.commit()
+                rows = await session.execute(select(Peer.id, Peer.peer_ip))
+                return rows.all()
+        assert asyncio.run(run()) == [(1, '10.0.0.2')]
+        engine.dispose()
+
+
+class TestMigrations:
+    """版本化迁移测试"""
+
+    def _legacy_engine(self):
+        from sqlalchemy import create_engine
+        engine = create_engine("sqlite:///:memory:")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE peers (id INTEGER PRIMARY KEY AUTOINCREMENT, public_key TEXT NOT NULL, "
+                "private_key TEXT NOT NULL, allowed_ips TEXT NOT NULL, client_allowed_ips TEXT NOT NULL, "
+                "remark TEXT, status BOOLEAN, peer_ip TEXT NOT NULL UNIQUE, keepalive INTEGER, "
+                "preshared_key TEXT, created_at DATETIME)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE acls (id INTEGER PRIMARY KEY AUTOINCREMENT, peer_id INTEGER, rule_type TEXT NOT NULL, "
+                "action TEXT NOT NULL, target TEXT NOT NULL, destination TEXT, source_interface TEXT, "
+                "destination_interface TEXT, port TEXT NOT NULL, protocol TEXT NOT NULL, "
+                "direction TEXT NOT NULL, enabled BOOLEAN NOT NULL)"
+            ))
+            # 旧版 /acls/create 写入的全局规则 peer_id 为 -1
+            for peer_id, action in ((None, "allow"), (-1, "deny")):
+                conn.execute(text(
+                    "INSERT INTO acls (peer_id, rule_type, action, target, port, protocol, direction, enabled) "
+                    "VALUES (:p, 'firewall', :a, '10.0.0.0/8', '', '', 'both', 1)"
+                ), {"p": peer_id, "a": action})
+        return engine
+
+    def test_fresh_database_is_stamped_latest(self):
+        """测试全新数据库直接建表并记录最新版本"""
+        from sqlalchemy import create_engine
+        from app.migrations import run_migrations, LATEST_VERSION
+        engine = create_engine("sqlite:///:memory:")
+
+        assert run_migrations(engine) == LATEST_VERSION
+        with engine.connect() as conn:
+            indexes = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {'uq_acls_identity', 'ix_acls_peer_id', 'ix_peers_status'} <= indexes
+
+    def test_legacy_database_is_upgraded(self):
+        """测试旧数据库补充字段、去重并建立索引"""
+        from sqlalchemy import inspect
+        from app.migrations import run_migrations, LATEST_VERSION
+        engine = self._legacy_engine()
+
+        assert run_migrations(engine) == LATEST_VERSION
+        assert 'version' in {c['name'] for c in inspect(engine).get_columns('peers')}
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT peer_id, action FROM acls")).fetchall()
+        assert rows == [(None, 'deny')]
+        # 再次执行不应重复迁移
+        assert run_migrations(engine) == LATEST_VERSION
+
+    def test_legacy_tables_are_rebuilt(self):
+        """测试旧结构（含 endpoint、peer_id 非空、缺少 direction）按批重建并保留数据"""
+        from sqlalchemy import create_engine, inspect
+        from app.migrations import run_migrations, rebuild_table, LATEST_VERSION
+        from app.models import ACL
+        engine = create_engine("sqlite:///:memory:")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE peers (id INTEGER PRIMARY KEY AUTOINCREMENT, public_key TEXT NOT NULL, "
+                "private_key TEXT NOT NULL, allowed_ips TEXT NOT NULL, remark TEXT, status BOOLEAN, "
+                "peer_ip TEXT NOT NULL UNIQUE, endpoint TEXT, keepalive INTEGER, preshared_key TEXT, created_at DATETIME)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE acls (id INTEGER PRIMARY KEY AUTOINCREMENT, peer_id INTEGER NOT NULL, "
+                "action TEXT NOT NULL, target TEXT NOT NULL, port TEXT NOT NULL, protocol TEXT NOT NULL, "
+                "enabled BOOLEAN NOT NULL DEFAULT 1)"
+            ))
+            conn.execute(text(
+                "INSERT INTO peers (public_key, private_key, allowed_ips, peer_ip, endpoint) "
+                "VALUES ('pub', 'priv', '10.0.0.2/32', '10.0.0.2', '1.2.3.4:51820')"
+            ))
+            for i in range(5):
+                conn.execute(text(
+                    "INSERT INTO acls (peer_id, action, target, port, protocol) VALUES (1, 'allow', :t, '', '')"
+                ), {"t": f"10.1.0.{i}/32"})
+            # 批大小小于行数，验证分批复制
+            assert rebuild_table(conn, ACL.__table__, batch_size=2) == 5
+
+        assert run_migrations(engine) == LATEST_VERSION
+        peer_columns = {c['name']: c for c in inspect(engine).get_columns('peers')}
+        assert 'endpoint' not in peer_columns
+        assert 'client_allowed_ips' in peer_columns
+        acl_columns = {c['name']: c for c in inspect(engine).get_columns('acls')}
+        assert acl_columns['peer_id']['nullable']
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT peer_id, direction, rule_type FROM acls ORDER BY id")).fetchall()
+            client_ips = conn.execute(text("SELECT client_allowed_ips FROM peers")).scalar()
+        assert rows == [(1, 'both', 'firewall')] * 5
+        assert client_ips == '0.0.0.0/0'
+
+
+class TestRequestSession:
+    """请求级会话依赖测试"""
+
+    def test_one_session_per_request(self):
+        """测试同一请求内的依赖共用一个会话，提交后连接即归还连接池"""
+        from fastapi import Depends, FastAPI
+        from fastapi.testclient import TestClient
+        from app.db import engine, get_db
+
+        api = FastAPI()
+
+        def current_user(session=Depends(get_db)):
+            session.execute(text("SELECT 1"))
+            session.commit()
+            return session
+
+        @api.get("/")
+        def handler(user_session=Depends(current_user), session=Depends(get_db)):
+            session.execute(text("SELECT 1"))
+            session.commit()
+            # 提交后执行的耗时操作（如 WireGuard 同步）不占用连接
+            return {"same": user_session is session, "checked_out": engine.pool.checkedout()}
+
+        with TestClient(api) as client:
+            assert client.get("/").json() == {"same": True, "checked_out": 0}
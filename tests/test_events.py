@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from app.events import EventBroker, PresenceWatcher
+
+
+class TestEventBroker:
+    """实时事件广播测试"""
+
+    def test_fan_out_from_threads(self):
+        """测试其他线程发布的事件送达所有连接，编号递增"""
+        async def scenario():
+            broker = EventBroker(buffer_size=10, history_size=10)
+            first, second = broker.subscribe(), broker.subscribe()
+            thread = threading.Thread(target=lambda: [broker.publish('activity', {'n': n}) for n in range(3)])
+            thread.start()
+            thread.join()
+            got = [await first.get(1), await second.get(1)]
+            broker.unsubscribe(first)
+            broker.unsubscribe(second)
+            return broker, got
+
+        broker, got = asyncio.run(scenario())
+        for events in got:
+            assert [event['id'] for event in events] == [1, 2, 3]
+            assert events[0]['frame'] == 'id: 1\nevent: activity\ndata: {"n": 0}\n\n'.encode()
+        assert broker.stats()['subscribers'] == 0
+
+    def test_overflow_replay_and_limit(self):
+        """测试慢连接只保留最新事件并标记 resync，重连按 Last-Event-ID 补发，超过连接上限返回 503"""
+        async def scenario():
+            broker = EventBroker(buffer_size=2, history_size=3, max_subscribers=2)
+            slow = broker.subscribe()
+            for n in range(5):
+                broker.publish('sync', {'n': n})
+            await asyncio.sleep(0)
+            events = await slow.get(1)
+            assert [event['id'] for event in events] == [4, 5]
+            assert slow.take_overflow() and not slow.take_overflow()
+            broker.unsubscribe(slow)
+
+            resumed = broker.subscribe(last_event_id=3)
+            assert [event['id'] for event in await resumed.get(1)] == [4, 5]
+            assert not resumed.take_overflow()
+            # 错过的事件已移出历史
+            stale = broker.subscribe(last_event_id=1)
+            assert stale.take_overflow()
+            with pytest.raises(HTTPException) as exc:
+                broker.subscribe()
+            assert exc.value.status_code == 503
+            assert await resumed.get(0.01) == []
+            return broker.stats()
+
+        stats = asyncio.run(scenario())
+        # 慢连接丢弃 3 条，stale 补发 3 条历史时缓冲只容纳 2 条
+        assert stats['published'] == 5 and stats['dropped'] == 4
+
+    def test_presence_transitions(self):
+        """测试节点上线 / 离线只在状态变化时发布，第一次轮询只建立基线"""
+        async def scenario():
+            broker = EventBroker()
+            watcher = PresenceWatcher(broker)
+
+            async def lookup(keys):
+                return {'k1': (1, 'office')}
+            watcher._lookup = lookup
+            assert await watcher.apply({'k1': 100}) == []
+            assert await watcher.apply({'k1': 160}) == []
+            online = await watcher.apply({'k1': 160, 'k2': 170})
+            offline = await watcher.apply({'k2': 200})
+            return online, offline
+
+        online, offline = asyncio.run(scenario())
+        assert len(online) == 1 and b'event: peer.online' in online[0]['frame'] and b'"k2"' in online[0]['frame']
+        assert len(offline) == 1 and b'event: peer.offline' in offline[0]['frame']
+        assert b'"peer_id": 1' in offline[0]['frame'] and b'"online_count": 1' in offline[0]['frame']
+
+
+class TestStreamTickets:
+    """事件流票据测试"""
+
+    def test_ticket_single_use_and_scoped(self, api_client, api_token):
+        """测试票据只能打开一次事件流、不能当作登录令牌，查询参数中的登录令牌被拒绝"""
+        from app.auth import create_access_token
+        from app.events import stream_tickets
+        response = api_client.post('/events/ticket', headers=api_token('read'))
+        assert response.status_code == 200
+        ticket = response.json()['ticket']
+        assert response.json()['expires_in'] == stream_tickets.ttl
+
+        # 票据不能用于其他接口
+        assert api_client.get('/peers', headers={'Authorization': f'Bearer {ticket}'}).status_code == 401
+        principal = stream_tickets.redeem(ticket)
+        assert (principal.username, principal.scopes) == ('robot', ('read',))
+        # 已使用的票据再次打开被拒绝（不进入流式响应）
+        assert api_client.get('/events/stream', params={'ticket': ticket}).status_code == 401
+
+        token = create_access_token({'sub': 'robot', 'uid': principal.id, 'tv': 0})
+        assert api_client.get('/events/stream', params={'token': token}).status_code == 401
+        assert api_client.post('/events/ticket').status_code == 401
@@ -0,0 +1,28 @@
+import io
+import zipfile
+from app.config_export import iter_zip, _safe_name
+
+
+class TestZipStream:
+    """流式ZIP生成测试"""
+
+    def test_iter_zip_produces_valid_archive(self):
+        """测试逐块产出的字节拼接后是合法的ZIP"""
+        files = ((f"peer_{i}.conf", f"[Interface]\nAddress = 10.0.0.{i}/32\n") for i in range(50))
+        chunks = list(iter_zip(files))
+
+        assert len(chunks) > 1
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        assert archive.testzip() is None
+        assert len(archive.namelist()) == 50
+        assert archive.read("peer_7.conf").decode().endswith("10.0.0.7/32\n")
+
+    def test_iter_zip_empty(self):
+        """测试没有文件时生成空ZIP"""
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(iter_zip([]))))
+        assert archive.namelist() == []
+
+    def test_safe_name(self):
+        """测试备注转换为安全文件名"""
+        assert _safe_name("site a/../b") == "site_a_.._b"
+        assert _safe_name(None) == ""
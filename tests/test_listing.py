@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+from app.listing import (
+    decode_cursor, encode_cursor, escape_like, network_contains,
+    page_limit, parse_fields, parse_network, parse_sort
+)
+from app.models import Peer
+
+
+class TestListing:
+    """列表分页、过滤与投影工具测试"""
+
+    def test_cursor_round_trip(self):
+        """测试游标编码后可还原排序值与 id"""
+        cursor = encode_cursor('remark', True, 'node-1', 42)
+        assert decode_cursor(cursor, 'remark', True, Peer.remark) == ('node-1', 42)
+
+    def test_cursor_rejects_mismatch_and_garbage(self):
+        """测试排序方式不一致或格式错误的游标返回 400"""
+        cursor = encode_cursor('id', False, 5, 5)
+        for bad, sort, desc in ((cursor, 'id', True), (cursor, 'remark', False), ('not-a-cursor', 'id', False)):
+            with pytest.raises(HTTPException) as exc:
+                decode_cursor(bad, sort, desc, Peer.id)
+            assert exc.value.status_code == 400
+
+    def test_parse_fields_sort_and_limit(self):
+        """测试字段、排序与每页条数参数解析"""
+        allowed = {'id': Peer.id, 'remark': Peer.remark}
+        assert parse_fields(None, allowed) == ['id', 'remark']
+        assert parse_fields('remark, id', allowed) == ['remark', 'id']
+        assert parse_sort('-remark', allowed) == ('remark', True)
+        assert parse_sort(None, allowed) == ('id', False)
+        with pytest.raises(HTTPException):
+            parse_fields('private_key', allowed)
+        with pytest.raises(HTTPException):
+            parse_sort('private_key', allowed)
+        with pytest.raises(HTTPException):
+            page_limit(0)
+
+    def test_network_contains(self):
+        """测试 CIDR 包含关系判断"""
+        assert network_contains(parse_network('10.0.0.0/8'), parse_network('10.1.2.3'))
+        assert not network_contains(parse_network('10.1.0.0/16'), parse_network('10.0.0.0/8'))
+        assert not network_contains(parse_network('10.0.0.0/8'), parse_network('::1'))
+        assert parse_network('not-an-ip') is None
+        assert escape_like('50%_a') == '50\\%\\_a'
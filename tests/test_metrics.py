@@ -0,0 +1,110 @@
+from collections import namedtuple
+import pytest
+from app import metrics
+from app.metrics import MetricsSampler
+
+Counters = namedtuple('Counters', 'bytes_sent bytes_recv')
+Usage = namedtuple('Usage', 'total used percent')
+
+
+class TestMetricsSampler:
+    """系统资源后台采样测试"""
+
+    @pytest.fixture
+    def fake_psutil(self, monkeypatch):
+        state = {'now': 100.0, 'net': Counters(1000, 2000), 'wg0': Counters(10, 20)}
+        monkeypatch.setattr(metrics.time, 'monotonic', lambda: state['now'])
+        monkeypatch.setattr(metrics.psutil, 'cpu_percent', lambda interval=None: 12.5)
+        monkeypatch.setattr(metrics.psutil, 'virtual_memory', lambda: Usage(100, 40, 40.0))
+        monkeypatch.setattr(metrics.psutil, 'disk_usage', lambda path: Usage(1000, 250, 25.0))
+        monkeypatch.setattr(
+            metrics.psutil, 'net_io_counters',
+            lambda pernic=False: {'wg0': state['wg0']} if pernic else state['net']
+        )
+        return state
+
+    def test_rates_from_consecutive_samples(self, fake_psutil):
+        """测试速率按相邻两次采样计算，第一次采样速率为 0，接口重建后从 0 计数"""
+        sampler = MetricsSampler(interval=0, buffer_size=10)
+        first = sampler.sample()
+        assert first['cpu_percent'] == 0.0 and first['network']['bytes_sent_per_s'] == 0.0
+
+        fake_psutil.update(now=105.0, net=Counters(6000, 2500), wg0=Counters(5, 520))
+        second = sampler.sample()
+        assert second['cpu_percent'] == 12.5
+        assert second['network'] == {'bytes_sent_per_s': 1000.0, 'bytes_recv_per_s': 100.0}
+        # wg0 发送计数器变小（接口重建），按新计数器值计算
+        assert second['interfaces']['wg0']['bytes_sent_per_s'] == 1.0
+        assert second['interfaces']['wg0']['bytes_recv_per_s'] == 100.0
+        assert second['memory']['percent'] == 40.0 and second['disk']['used'] == 250
+        assert sampler.latest() is second
+
+    def test_ring_buffer_and_latest_without_thread(self, fake_psutil):
+        """测试环形缓冲只保留最近的采样，未启动后台线程时 latest 当场采样"""
+        sampler = MetricsSampler(interval=0, buffer_size=3)
+        assert sampler.latest()['cpu_percent'] == 0.0
+        for step in range(5):
+            fake_psutil['now'] += 5
+            sampler.sample()
+        assert len(sampler.samples()) == 3
+        sampler.start()
+        assert sampler.stats()['running'] is False and sampler.stats()['buffered'] == 3
+
+
+class TestPerformanceHistory:
+    """性能历史轮转存储测试"""
+
+    def _sample(self, cpu):
+        return {
+            'cpu_percent': cpu, 'memory': {'percent': 50.0}, 'disk': {'percent': 20.0},
+            'network': {'bytes_sent_per_s': 100.0, 'bytes_recv_per_s': 200.0},
+            'interfaces': {'wg0': {'bytes_sent_per_s': 10.0, 'bytes_recv_per_s': 20.0}}
+        }
+
+    def test_downsampling_and_wraparound(self):
+        """测试同一时间段取平均、按范围选择精度、槽位循环覆盖旧数据"""
+        from app.timeseries import PerformanceHistory
+        history = PerformanceHistory(archives=[(10, 6), (60, 10)], path='', interface='wg0')
+        for offset in range(0, 120, 5):
+            history.record(self._sample(float(offset)), now=1000.0 * 60 + offset)
+        now = 60000.0 + 119
+
+        fine = history.query(now - 59, now, ['cpu_percent', 'wg_recv_per_s'], now=now)
+        assert fine['resolution'] == 10
+        # 10 秒精度只保留 6 个槽位，60000-60050 的槽位已被覆盖
+        assert fine['timestamps'] == [60060, 60070, 60080, 60090, 60100, 60110]
+        assert fine['series']['cpu_percent'] == [62.5, 72.5, 82.5, 92.5, 102.5, 112.5]
+        assert fine['series']['wg_recv_per_s'] == [20.0] * 6
+
+        coarse = history.query(now - 300, now, ['cpu_percent'], now=now)
+        assert coarse['resolution'] == 60
+        assert coarse['timestamps'] == [60000, 60060]
+        assert coarse['series']['cpu_percent'] == [27.5, 87.5]
+        # 点数上限：10 秒精度需要 6 个点，超过上限时改用 1 分钟精度
+        assert history.query(now - 59, now, ['cpu_percent'], now=now, max_points=3)['resolution'] == 60
+        with pytest.raises(ValueError):
+            history.query(now - 60, now, ['load'], now=now)
+
+    def test_persistence_is_fixed_size(self, tmp_path):
+        """测试写入定长文件后重新加载，归档配置变化时忽略旧文件"""
+        from app.timeseries import PerformanceHistory
+        path = str(tmp_path / 'metrics.rrd')
+        history = PerformanceHistory(archives=[(10, 6), (60, 10)], path=path, interface='wg0')
+        history.open()
+        history.record(self._sample(5.0), now=600.0)
+        history.close()
+        size = (tmp_path / 'metrics.rrd').stat().st_size
+        history.open()
+        for offset in range(0, 1000, 5):
+            history.record(self._sample(1.0), now=700.0 + offset)
+        history.close()
+        assert (tmp_path / 'metrics.rrd').stat().st_size == size
+
+        reloaded = PerformanceHistory(archives=[(10, 6), (60, 10)], path=path, interface='wg0')
+        reloaded.open()
+        result = reloaded.query(1600, 1700, ['cpu_percent'], now=1700)
+        assert result['timestamps'] and result['series']['cpu_percent'][-1] == 1.0
+        reloaded.close()
+
+        changed = PerformanceHistory(archives=[(10, 8)], path=path, interface='wg0')
+        assert changed.load() is False
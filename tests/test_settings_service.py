@@ -0,0 +1,77 @@
+import pytest
+from app.settings_service import SettingsService, SETTING_DEFINITIONS
+from app.models import SystemSetting
+
+
+@pytest.fixture
+def service(test_db):
+    session = test_db()
+    session.query(SystemSetting).delete()
+    session.commit()
+    session.close()
+    return SettingsService(refresh_seconds=60, session_factory=test_db)
+
+
+class TestSettingsService:
+    """系统设置服务测试"""
+
+    def test_update_is_visible_without_requery(self, service, test_db):
+        """测试写入后立即可读，且读取走内存缓存"""
+        service.update({'global_endpoint': 'vpn.example.com:51820'})
+        assert service.get('global_endpoint') == 'vpn.example.com:51820'
+
+        # 绕过服务直接修改数据库，缓存未过期前不会重新查询
+        session = test_db()
+        session.query(SystemSetting).filter_by(key='global_endpoint').update({'value': 'other'})
+        session.commit()
+        session.close()
+        assert service.get('global_endpoint') == 'vpn.example.com:51820'
+
+        service.reload()
+        assert service.get('global_endpoint') == 'other'
+
+    def test_bulk_update_upserts(self, service):
+        """测试批量写入同时插入和更新"""
+        service.update({'a': '1'})
+        changed = service.update({'a': '2', 'b': 'x'})
+
+        assert changed == {'a', 'b'}
+        assert service.all() == {'a': '2', 'b': 'x'}
+
+    def test_change_notification(self, service):
+        """测试只有值变化时才通知订阅者并递增代数"""
+        service.get('global_endpoint')
+        events = []
+        service.subscribe(events.append)
+
+        service.update({'global_endpoint': 'a:1'})
+        generation = service.generation
+        service.update({'global_endpoint': 'a:1'})
+
+        assert events == [{'global_endpoint'}]
+        assert service.generation == generation
+
+    def test_typed_get(self, service, monkeypatch):
+        """测试按声明类型解析设置值"""
+        monkeypatch.setitem(SETTING_DEFINITIONS, 'sync_enabled', (bool, True))
+        monkeypatch.setitem(SETTING_DEFINITIONS, 'retention_days', (int, 30))
+
+        assert service.get('sync_enabled') is True
+        service.update({'sync_enabled': False, 'retention_days': 7})
+        assert service.get('sync_enabled') is False
+        assert service.get('retention_days') == 7
+
+    def test_refresh_picks_up_external_writes(self, test_db):
+        """测试 refresh 在刷新间隔后重新加载并递增代数"""
+        service = SettingsService(refresh_seconds=0, session_factory=test_db)
+        generation = service.refresh()
+        session = test_db()
+        session.add(SystemSetting(key='global_endpoint', value='elsewhere:51820'))
+        session.commit()
+        try:
+            assert service.refresh() == generation + 1
+            assert service.get('global_endpoint') == 'elsewhere:51820'
+        finally:
+            session.query(SystemSetting).delete()
+            session.commit()
+            session.close()
@@ -59,6 +59,18 @@ class TestACLValidation:
 
         for target in invalid_targets:
             assert not validate_acl_target(target)
+        assert not validate_acl_target(None)
+
+    def test_normalize_batch_acl(self):
+        """测试批量导入规则的标准化与规则标识"""
+        from app.acl import acl_identity, normalize_batch_acl
+        a = normalize_batch_acl({"action": "allow", "target": " 10.0.0.0/8 ", "protocol": "*", "port": 53, "peer_id": "3"})
+        b = normalize_batch_acl({"action": "deny", "target": "10.0.0.0/8", "protocol": "", "port": "53", "peer_id": 3, "destination": ""})
+        assert a["target"] == "10.0.0.0/8" and a["protocol"] == "" and a["port"] == "53"
+        assert acl_identity(a) == acl_identity(b)
+        for bad in ({"target": "10.0.0.0/8"}, {"action": "allow", "target": "x"}, {"action": "allow", "target": "1.1.1.1", "peer_id": "a"}):
+            with pytest.raises(ValueError):
+                normalize_batch_acl(bad)
 
 
 class TestActivityLogging:
@@ -102,6 +114,149 @@ class TestActivityLogging:
         assert before <= activity.created_at <= after
 
 
+class TestActivityWriter:
+    """活动日志后台写入测试"""
+
+    def setup_method(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from app.models import Base
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+    def teardown_method(self):
+        self.engine.dispose()
+
+    def _messages(self):
+        session = self.Session()
+        try:
+            return [a.message for a in session.query(Activity).order_by(Activity.id)]
+        finally:
+            session.close()
+
+    def test_batches_writes(self):
+        """测试多条活动合并为一批写入，时间为记录时刻"""
+        from datetime import datetime
+        from app.activity import ActivityWriter
+        writer = ActivityWriter(batch_size=100, flush_ms=200, session_factory=self.Session)
+        before = datetime.utcnow()
+        for i in range(50):
+            assert writer.enqueue({'type': 'info', 'message': f'a{i}', 'created_at': datetime.utcnow()})
+        writer.flush()
+        assert self._messages() == [f'a{i}' for i in range(50)]
+        assert writer.stats()['batches'] == 1
+        session = self.Session()
+        assert session.query(Activity).first().created_at >= before
+        session.close()
+        writer.stop()
+
+    def test_stop_flushes_and_backpressure(self):
+        """测试停止时写完队列；队列满时等待超时返回 False"""
+        from datetime import datetime
+        from app.activity import ActivityWriter
+        writer = ActivityWriter(batch_size=10, flush_ms=10000, queue_size=5, enqueue_timeout=0.05, session_factory=self.Session)
+        rows = [{'type': 'info', 'message': f'b{i}', 'created_at': datetime.utcnow()} for i in range(6)]
+        results = [writer.enqueue(row) for row in rows]
+        # 后台线程取走第一条后在等待凑批，队列中最多再放 5 条
+        assert results[:5] == [True] * 5
+        writer.stop()
+        assert self._messages() == [row['message'] for row, ok in zip(rows, results) if ok]
+
+    def test_rollups_and_retention(self, tmp_path):
+        """测试写入时更新汇总，清理过期记录并归档，汇总计数保留"""
+        import gzip
+        import json
+        from datetime import datetime, timedelta
+        from sqlalchemy import select
+        from app.activity import ActivityWriter, recent_activity_count_stmt, total_activity_count
+        from app.migrations import migration_0007_activity_rollups
+        from app.models import ActivityRollup
+        from app.retention import ActivityRetention
+        now = datetime.utcnow()
+        old = [{'type': 'info', 'message': f'old{i}', 'created_at': now - timedelta(days=40, minutes=i)} for i in range(7)]
+        writer = ActivityWriter(session_factory=self.Session)
+        for row in old + [{'type': 'error', 'message': 'new', 'created_at': now}]:
+            writer.enqueue(row)
+        writer.stop()
+
+        session = self.Session()
+        assert total_activity_count(session) == 8
+        assert session.execute(recent_activity_count_stmt(24)).scalar() == 1
+        session.close()
+
+        retention = ActivityRetention(retention_days=30, hourly_rollup_days=30, batch_size=3,
+                                      archive_dir=str(tmp_path), session_factory=self.Session)
+        assert retention.run_once() == 7
+        assert self._messages() == ['new']
+        lines = []
+        for month in {row['created_at'].strftime('%Y-%m') for row in old}:
+            with gzip.open(tmp_path / f"activities-{month}.ndjson.gz", 'rt', encoding='utf-8') as f:
+                lines += [json.loads(line)['message'] for line in f]
+        assert sorted(lines) == sorted(row['message'] for row in old)
+
+        session = self.Session()
+        # 原始记录已清理，按天汇总保留累计数；过期的小时汇总被删除
+        assert total_activity_count(session) == 8
+        assert session.query(ActivityRollup).filter(ActivityRollup.period == 'hour').count() == 1
+        session.query(ActivityRollup).delete()
+        session.commit()
+        # 迁移按现有记录回填
+        migration_0007_activity_rollups(session.connection())
+        assert session.execute(select(ActivityRollup.type, ActivityRollup.count).where(ActivityRollup.period == 'day')).all() == [('error', 1)]
+        session.close()
+
+    def test_default_retention_keeps_everything(self):
+        """测试默认配置永久保留活动记录，不启动清理线程"""
+        from datetime import datetime, timedelta
+        from app.activity import ActivityWriter
+        from app.retention import ActivityRetention
+        writer = ActivityWriter(session_factory=self.Session)
+        writer.enqueue({'type': 'info', 'message': 'ancient', 'created_at': datetime.utcnow() - timedelta(days=3650)})
+        writer.stop()
+
+        retention = ActivityRetention(session_factory=self.Session)
+        assert retention.retention_days == 0
+        retention.start()
+        assert retention._thread is None
+        assert retention.run_once() == 0
+        assert self._messages() == ['ancient']
+
+    def test_event_fields_and_fulltext(self):
+        """测试结构化字段写入、全文索引随增删同步，以及旧表迁移回填"""
+        from datetime import datetime
+        from sqlalchemy import text
+        from app.activity import ActivityWriter, _activity_row
+        from app.migrations import migration_0008_activity_events
+        writer = ActivityWriter(session_factory=self.Session)
+        writer.enqueue(_activity_row("创建 节点: 上海办公室", 'success', 'peer.create', 'admin', 'peer', 7))
+        # 未带结构化字段的记录与带字段的记录可在同一批写入
+        writer.enqueue({'type': 'info', 'message': '导出系统配置: 1个节点', 'created_at': datetime.utcnow()})
+        writer.stop()
+
+        def search(conn, q):
+            return conn.execute(text(
+                "SELECT a.message FROM activities a JOIN activities_fts f ON f.rowid = a.id WHERE activities_fts MATCH :q"
+            ), {"q": f'"{q}"'}).scalars().all()
+
+        with self.engine.begin() as conn:
+            row = conn.execute(text("SELECT event_type, actor, entity_type, entity_id FROM activities WHERE id = 1")).one()
+            assert tuple(row) == ('peer.create', 'admin', 'peer', 7)
+            assert search(conn, '上海办公') == ["创建 节点: 上海办公室"]
+            conn.execute(text("DELETE FROM activities WHERE id = 1"))
+            assert search(conn, '上海办公') == []
+
+            # 旧结构：无新字段、无全文索引
+            conn.execute(text("DROP TABLE activities_fts"))
+            conn.execute(text("DROP TABLE activities"))
+            conn.execute(text("CREATE TABLE activities (id INTEGER PRIMARY KEY, type VARCHAR, message VARCHAR, created_at DATETIME)"))
+            conn.execute(text("INSERT INTO activities (type, message) VALUES ('info', '导出系统配置: 3个节点'), ('info', '其他')"))
+            migration_0008_activity_events(conn)
+            assert conn.execute(text("SELECT event_type FROM activities ORDER BY id")).scalars().all() == ['backup.export', None]
+            assert search(conn, '系统配置') == ['导出系统配置: 3个节点']
+
+
 class TestModels:
     """数据模型测试"""
 
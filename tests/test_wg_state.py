@@ -0,0 +1,66 @@
+import asyncio
+import subprocess
+from app import wg_state
+from app.wg_state import WireGuardState, parse_dump
+
+DUMP = '\n'.join([
+    'wg0\tPRIVATE=\tSERVER=\t51820\toff',
+    'wg0\tPEER1=\t(none)\t203.0.113.5:51820\t10.0.0.2/32,10.0.1.0/24\t1000\t1073741824\t2048\t25',
+    'wg0\tPEER2=\tPSK=\t(none)\t10.0.0.3/32\t0\t0\t0\toff',
+    'wg0\tPEER3=\t(none)\t198.51.100.7:4500\t10.0.0.4/32\t400\t10\t20\toff',
+    'wg1\tPRIVATE=\tOTHER=\t51821\toff',
+])
+
+
+class TestWireGuardState:
+    """WireGuard 状态快照测试"""
+
+    def test_parse_dump(self):
+        """测试解析接口与节点字段，(none) 与 off 转为空值，字节数为精确整数"""
+        interfaces = parse_dump(DUMP + '\n')
+        assert set(interfaces) == {'wg0', 'wg1'}
+        wg0 = interfaces['wg0']
+        assert wg0.public_key == 'SERVER=' and wg0.listen_port == 51820 and len(wg0.peers) == 3
+        first, second = wg0.peers[0], wg0.peers[1]
+        assert first.endpoint == '203.0.113.5:51820'
+        assert first.allowed_ips == ('10.0.0.2/32', '10.0.1.0/24')
+        assert (first.latest_handshake, first.rx_bytes, first.tx_bytes, first.persistent_keepalive) == (1000, 1073741824, 2048, 25)
+        assert second.endpoint is None and second.latest_handshake == 0 and second.persistent_keepalive == 0
+        assert interfaces['wg1'].peers == ()
+
+    def test_snapshot_status_and_online_peers(self, monkeypatch):
+        """测试在线节点按握手时间判断，命令返回失败为 down、无法执行为 error"""
+        outputs = [
+            subprocess.CompletedProcess([], 0, DUMP.encode(), b''),
+            subprocess.CompletedProcess([], 1, b'', b'Unable to access interface'),
+        ]
+
+        async def fake_run(args, **kwargs):
+            assert args == ['wg', 'show', 'all', 'dump']
+            if not outputs:
+                raise FileNotFoundError('wg')
+            return outputs.pop(0)
+
+        monkeypatch.setattr(wg_state, 'run_async', fake_run)
+        state = WireGuardState(interval=0)
+        seen = []
+
+        async def listener(snapshot):
+            seen.append(snapshot)
+
+        state.listeners.append(listener)
+
+        async def scenario():
+            snapshot = await state.snapshot()
+            # 快照未过期时不再执行命令
+            assert await state.snapshot() is snapshot
+            return snapshot, await state.refresh(), await state.refresh()
+
+        up, down, missing = asyncio.run(scenario())
+        assert up.status('wg0') == 'up' and up.status('wg9') == 'down'
+        assert up.online_peers('wg0', now=1000) == {'PEER1=': 1000, 'PEER3=': 400}
+        assert up.online_peers('wg0', now=1300) == {'PEER1=': 1000}
+        assert down.status('wg0') == 'down' and down.error == 'Unable to access interface'
+        assert missing.status('wg0') == 'error' and missing.online_peers('wg0') == {}
+        assert seen == [up, down, missing]
+        assert state.stats()['polls'] == 3 and state.stats()['failures'] == 2